@@ -4,15 +4,16 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from . import crud, models
-from .database import SessionLocal
-import os
-from dotenv import load_dotenv
+from .database import get_db
+from .principals import Principal, principal_cache
+from .config import settings
 
-load_dotenv()
-
-SECRET_KEY = os.getenv("SECRET_KEY", "secret")
-ALGORITHM = os.getenv("ALGORITHM", "HS256")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60))
+SECRET_KEY = settings.secret_key
+ALGORITHM = settings.algorithm
+ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
+# Build the principal from the token's signed claims and skip the user lookup.
+# Role changes then only take effect when the token is reissued.
+AUTH_TRUST_TOKEN_CLAIMS = settings.auth_trust_token_claims
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 
@@ -26,14 +27,11 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def token_claims(user: models.User) -> dict:
+    return {"sub": str(user.id), "role": user.role, "email": user.email, "name": user.name}
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    # The session only opens a connection on a cache miss
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -41,12 +39,17 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     )
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: int = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
+        user_id = int(payload.get("sub"))
+    except (JWTError, TypeError, ValueError):
         raise credentials_exception
+    if AUTH_TRUST_TOKEN_CLAIMS and "role" in payload:
+        return Principal(id=user_id, email=payload.get("email"), name=payload.get("name"), role=payload["role"])
+    principal = principal_cache.get(user_id)
+    if principal is not None:
+        return principal
     user = crud.get_user(db, user_id=user_id)
     if user is None:
         raise credentials_exception
-    return user
+    principal = Principal.from_user(user)
+    principal_cache.put(principal)
+    return principal
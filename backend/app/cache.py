@@ -0,0 +1,181 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from fastapi import Request, Response
+from .serializers import dumps
+from .config import settings
+from .database import DATABASE_REPLICA_URLS, REPLICA_STICKY_SECONDS, reads_primary
+from .shared_state import generations
+
+CACHE_URL = settings.cache_url  # e.g. redis://localhost:6379/0; unset = in-process only
+CACHE_TTL = settings.cache_ttl
+CACHE_MAX_ENTRIES = settings.cache_max_entries
+
+class LocalCache:
+    """In-process LRU with per-entry TTL. Also the stand-in for the shared backend."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # Counters live outside the LRU: evicting a namespace version would revive stale entries
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] is not None and entry[1] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, ttl: int = None):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl if ttl else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def counter(self, key) -> int:
+        if generations is not None:
+            return generations.get(key)
+        return self._counters.get(key, 0)
+
+    def incr(self, key) -> int:
+        # Multi-worker mode: namespace versions are shared, so an invalidation
+        # reaches every worker's entries (the entries themselves are not)
+        if generations is not None:
+            return generations.bump(key)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class RedisCache:
+    """Shared backend so every worker sees the same entries and invalidations."""
+
+    def __init__(self, url: str):
+        import redis
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._client.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl: int = None):
+        self._client.set(key, json.dumps(value), ex=ttl)
+
+    def counter(self, key) -> int:
+        return int(self._client.get(key) or 0)
+
+    def incr(self, key) -> int:
+        return self._client.incr(key)
+
+    def clear(self):
+        self._client.flushdb()
+
+class ResponseCache:
+    """Caches encoded JSON responses per URL, grouped into namespaces.
+
+    Every key embeds the current version of its namespaces, so a write only
+    has to bump the version (`invalidate`) and stale entries are never read
+    again; the LRU/TTL reclaims them. Responses carry an ETag and a matching
+    If-None-Match gets a 304 without a body.
+
+    With read replicas, a client holding the read-primary cookie skips the
+    lookup and its primary read replaces the entry, and a replica read is
+    not stored until REPLICA_STICKY_SECONDS after this worker first saw the
+    namespace version (the replica may not have the write behind it yet).
+    """
+
+    def __init__(self, backend, ttl: int = CACHE_TTL, replicas: bool = bool(DATABASE_REPLICA_URLS)):
+        self.backend = backend
+        self.ttl = ttl
+        self.replicas = replicas
+        self.hits = 0
+        self.misses = 0
+        self.unsettled = 0
+        # namespace -> (version, monotonic time this worker first saw it)
+        self._seen = {}
+
+    def invalidate(self, *namespaces):
+        for namespace in namespaces:
+            self.backend.incr(f"ns:{namespace}")
+
+    def _key(self, request: Request, namespaces):
+        versions = {ns: self.backend.counter(f"ns:{ns}") for ns in namespaces}
+        key = "resp:%s:%s?%s" % (",".join(f"{ns}.{version}" for ns, version in versions.items()), request.url.path, request.url.query)
+        return key, versions
+
+    def _settled(self, versions) -> bool:
+        now = time.monotonic()
+        settled = True
+        for ns, version in versions.items():
+            seen = self._seen.get(ns)
+            if seen is None or seen[0] != version:
+                seen = self._seen[ns] = (version, now)
+            settled = settled and now - seen[1] >= REPLICA_STICKY_SECONDS
+        return settled
+
+    def _lookup(self, request: Request, namespaces):
+        """Cache key, the cached entry (None on a miss or a primary read) and whether a fresh load may be stored."""
+        key, versions = self._key(request, namespaces)
+        if not self.replicas:
+            return key, self.backend.get(key), True
+        primary = reads_primary(request)
+        settled = self._settled(versions)
+        return key, None if primary else self.backend.get(key), primary or settled
+
+    def _store(self, key, content, headers, store: bool = True):
+        body = dumps(content)
+        entry = {"body": body.decode(), "etag": '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest(), "headers": headers}
+        if store:
+            self.backend.set(key, entry, self.ttl)
+        else:
+            self.unsettled += 1
+        return entry
+
+    def _respond(self, request: Request, entry):
+        headers = dict(entry["headers"], ETag=entry["etag"])
+        headers["Cache-Control"] = "no-cache"
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and entry["etag"] in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry["body"], media_type="application/json", headers=headers)
+
+    def respond(self, request: Request, namespaces, load, headers: dict = None):
+        """Serve `load()` through the cache.
+
+        `load` may fill `headers` (e.g. a next cursor); they are cached with the body.
+        """
+        key, entry, store = self._lookup(request, namespaces)
+        if entry is None:
+            self.misses += 1
+            content = load()
+            entry = self._store(key, content, headers or {}, store)
+        else:
+            self.hits += 1
+        return self._respond(request, entry)
+
+    async def respond_async(self, request: Request, namespaces, load, headers: dict = None):
+        key, entry, store = self._lookup(request, namespaces)
+        if entry is None:
+            self.misses += 1
+            content = await load()
+            entry = self._store(key, content, headers or {}, store)
+        else:
+            self.hits += 1
+        return self._respond(request, entry)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "unsettled": self.unsettled, "backend": type(self.backend).__name__}
+
+response_cache = ResponseCache(RedisCache(CACHE_URL) if CACHE_URL else LocalCache())
@@ -0,0 +1,88 @@
+import functools
+import os
+from dataclasses import dataclass, fields
+from dotenv import load_dotenv
+
+TRUE_VALUES = ("1", "true", "yes")
+
+@dataclass(frozen=True)
+class Settings:
+    """Everything the backend reads from the environment; field `x` comes from variable X.
+
+    Defaults here are the only defaults; .env.example documents the variables.
+    """
+    # Database and connection pool (pool settings are ignored for SQLite)
+    database_url: str = "sqlite:///./test.db"
+    async_database_url: str = None
+    db_async: bool = False
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    database_replica_urls: str = None
+    replica_sticky_seconds: float = 5
+    replica_retry_seconds: float = 30
+    # Tokens, principals and passwords
+    secret_key: str = "secret"
+    algorithm: str = "HS256"
+    access_token_expire_minutes: int = 60
+    auth_trust_token_claims: bool = False
+    auth_cache_size: int = 10000
+    auth_cache_ttl: float = 60
+    bcrypt_rounds: int = 12
+    password_workers: int = 0
+    # Server worker processes on this box; set by app.serve, read by gunicorn and uvicorn too
+    web_concurrency: int = 1
+    password_queue_limit: int = 0
+    login_max_failures_per_account: int = 5
+    login_max_attempts_per_ip: int = 30
+    login_window_seconds: float = 60
+    # Payments
+    payment_ingest_queue_size: int = 10000
+    payment_ingest_flush_size: int = 500
+    payment_ingest_flush_interval: float = 0.25
+    payment_dead_letter_dir: str = "./dead-letter"
+    payments_partition_ahead: int = 3
+    payments_retention_months: int = 12
+    payments_archive_dir: str = "./archive"
+    # Response cache
+    cache_url: str = None
+    cache_ttl: int = 30
+    cache_max_entries: int = 10000
+    # Fares, routes and positions
+    surge_interval: float = 5
+    surge_window: int = 600
+    surge_demand_target: float = 20
+    surge_route_refresh: float = 60
+    surge_rain: float = 0
+    route_index_max_age: float = 300
+    position_ttl: float = 120
+    position_cell_degrees: float = 0.01
+    position_log_dir: str = "./positions"
+    position_log_queue_size: int = 10000
+    # Instrumentation
+    metrics_enabled: bool = True
+    slow_query_ms: float = 200
+    profiling_enabled: bool = False
+    profile_interval: float = 0.001
+    # Multi-worker mode: directory (tmpfs) for state shared between workers
+    shared_state_dir: str = None
+
+    @classmethod
+    def from_env(cls, environ=os.environ) -> "Settings":
+        values = {}
+        for field in fields(cls):
+            raw = environ.get(field.name.upper())
+            if raw is None or (raw == "" and field.default is None):
+                continue
+            values[field.name] = raw.lower() in TRUE_VALUES if field.type is bool else field.type(raw)
+        return cls(**values)
+
+@functools.lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    # Read once per process: .env is loaded here and nowhere else
+    load_dotenv()
+    return Settings.from_env()
+
+settings = get_settings()
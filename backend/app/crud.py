@@ -1,22 +1,34 @@
+from sqlalchemy import delete, select, insert, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from . import models, schemas
-from passlib.context import CryptContext
+from .fare_engine import fare_table, latest_fare_ids
+from .pagination import apply_page
+from .database import dialect_insert
+from .principals import principal_cache
+from .passwords import password_context
+from .cache import response_cache
+from . import revenue
+from .surge import demand
+from .route_search import clean_stop_names, route_index, stop_key
+from .serializers import FLEET_COLUMNS, MATATU_COLUMNS, FARE_COLUMNS
+import datetime
 import logging
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 logger = logging.getLogger("matatu_registration")
 logger.setLevel(logging.DEBUG)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return password_context().hash(password)
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_context().verify(plain_password, hashed_password)
 
 # Users
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = get_password_hash(user.password)
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: str = None):
+    # Callers on the event loop hash on the password pool and pass the result in
+    if hashed_password is None:
+        hashed_password = get_password_hash(user.password)
     db_user = models.User(
         name=user.name,
         email=user.email,
@@ -27,6 +39,7 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    principal_cache.invalidate(db_user.id)
     return db_user
 
 def get_user_by_email(db: Session, email: str):
@@ -43,8 +56,12 @@ def authenticate_user(db: Session, email: str, password: str):
         return False
     return user
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.User).offset(skip).limit(limit).all()
+def update_password_hash(db: Session, user_id: int, hashed_password: str):
+    db.execute(update(models.User).where(models.User.id == user_id).values(hashed_password=hashed_password))
+    db.commit()
+
+def get_users(db: Session, skip: int = 0, limit: int = 100, after_id: int = None):
+    return apply_page(db.query(models.User), models.User.id, skip, limit, after_id).all()
 
 # Fleets
 def create_fleet(db: Session, fleet: schemas.FleetCreate):
@@ -55,39 +72,203 @@ def create_fleet(db: Session, fleet: schemas.FleetCreate):
     db.add(db_fleet)
     db.commit()
     db.refresh(db_fleet)
+    response_cache.invalidate("fleets")
     return db_fleet
 
-def get_fleets(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Fleet).offset(skip).limit(limit).all()
+def get_fleets(db: Session, skip: int = 0, limit: int = 100, after_id: int = None):
+    return apply_page(db.query(models.Fleet), models.Fleet.id, skip, limit, after_id).all()
+
+def select_rows(query, id_column, *criteria, skip: int = 0, limit: int = None, after_id: int = None):
+    """Column projection for the list fast path; unpaged when `limit` is None."""
+    query = query.where(*criteria)
+    if limit is None:
+        return query.order_by(id_column)
+    return apply_page(query, id_column, skip, limit, after_id)
+
+def get_fleet_rows(db: Session, operator_id: str = None, **page):
+    criteria = [models.Fleet.operator_id == operator_id] if operator_id is not None else []
+    return db.execute(select_rows(select(*FLEET_COLUMNS), models.Fleet.id, *criteria, **page)).all()
 
 def get_fleet(db: Session, fleet_id: int):
     return db.query(models.Fleet).filter(models.Fleet.id == fleet_id).first()
 
+def fleet_has_matatus(db: Session, fleet_id: int):
+    return db.query(models.Matatu.id).filter(models.Matatu.fleet_id == fleet_id).first() is not None
+
 # Matatus
 def create_matatu(db: Session, matatu: schemas.MatatuCreate):
-    logger.debug(f"Received matatu registration request: {matatu}")
+    logger.debug("Received matatu registration request: %s", matatu)
     existing = db.query(models.Matatu).filter(models.Matatu.registration_number == matatu.registration_number).first()
     if existing:
-        logger.warning(f"Matatu with registration number {matatu.registration_number} already exists: {existing}")
+        logger.warning("Matatu with registration number %s already exists", matatu.registration_number)
         return None
     try:
-        db_matatu = models.Matatu(**matatu.dict(by_alias=False))
+        db_matatu = models.Matatu(**matatu.dict(by_alias=False, exclude={"stops"}))
+        db_matatu.route_id = resolve_route(db, matatu_stop_names(matatu))
         db.add(db_matatu)
         db.commit()
         db.refresh(db_matatu)
-        logger.info(f"Matatu registered successfully: {db_matatu}")
+        index_matatu(db, db_matatu)
+        response_cache.invalidate("matatus")
+        logger.info("Matatu registered successfully: %s", db_matatu.registration_number)
         return db_matatu
     except Exception as e:
         db.rollback()
-        logger.error(f"Matatu registration failed for {matatu.registration_number}: {e}")
+        logger.error("Matatu registration failed for %s: %s", matatu.registration_number, e)
+        return None
+
+def create_matatus_bulk(db: Session, matatus, chunk_size: int = 500):
+    """Register many matatus in one transaction.
+
+    `matatus` is a list of (index, MatatuCreate) pairs; returns one report
+    dict per accepted or rejected row.
+    """
+    results, pending, seen = [], [], set()
+    for index, matatu in matatus:
+        if matatu.registration_number in seen:
+            results.append(_bulk_result(index, matatu.registration_number, "rejected", reason="Duplicate registration number in request"))
+        else:
+            seen.add(matatu.registration_number)
+            pending.append((index, matatu))
+
+    existing = set()
+    numbers = [m.registration_number for _, m in pending]
+    for i in range(0, len(numbers), chunk_size):
+        existing.update(db.scalars(
+            select(models.Matatu.registration_number)
+            .where(models.Matatu.registration_number.in_(numbers[i:i + chunk_size]))
+        ))
+    rows, accepted, routes = [], [], {}
+    for index, matatu in pending:
+        if matatu.registration_number in existing:
+            results.append(_bulk_result(index, matatu.registration_number, "rejected", reason="Matatu already exists"))
+        else:
+            # One lookup per distinct stop sequence, however many matatus share it
+            stops = tuple(matatu_stop_names(matatu))
+            if stops not in routes:
+                routes[stops] = resolve_route(db, stops)
+            rows.append(dict(matatu.dict(by_alias=False, exclude={"stops"}), route_id=routes[stops]))
+            accepted.append((index, matatu.registration_number))
+
+    if rows:
+        try:
+            ids = {}
+            for i in range(0, len(rows), chunk_size):
+                inserted = db.execute(
+                    insert(models.Matatu).returning(models.Matatu.id, models.Matatu.registration_number),
+                    rows[i:i + chunk_size],
+                )
+                ids.update((number, id_) for id_, number in inserted)
+            db.commit()
+            for route_id in set(routes.values()):
+                route_index.add_route(db, route_id)
+            for row in rows:
+                route_index.set_matatu(ids.get(row["registration_number"]), row["registration_number"], row["route_id"])
+            response_cache.invalidate("matatus")
+        except IntegrityError as e:
+            # Lost a race with a concurrent registration; nothing was written
+            db.rollback()
+            logger.warning("Bulk matatu registration rolled back: %s", e.orig)
+            results.extend(_bulk_result(index, number, "rejected", reason="Conflicting concurrent registration, retry")
+                           for index, number in accepted)
+        else:
+            results.extend(_bulk_result(index, number, "accepted", matatu_id=ids.get(number)) for index, number in accepted)
+    results.sort(key=lambda r: r["index"])
+    logger.info("Bulk matatu registration: %d accepted of %d", sum(r["status"] == "accepted" for r in results), len(results))
+    return results
+
+def _bulk_result(index, registration_number, status, matatu_id=None, reason=None):
+    return {
+        "index": index,
+        "registrationNumber": registration_number,
+        "status": status,
+        "matatuId": str(matatu_id) if matatu_id is not None else None,
+        "reason": reason,
+    }
+
+# Routes
+def matatu_stop_names(matatu: schemas.MatatuCreate) -> list:
+    return clean_stop_names([matatu.route_start, *matatu.stops, matatu.route_end])
+
+def resolve_route(db: Session, names):
+    """Id of the route running through `names` in order, created if new; None for fewer than two stops."""
+    names = clean_stop_names(names)
+    if len(names) < 2:
         return None
+    keys = [stop_key(name) for name in names]
+    stop_ids = dict(db.execute(select(models.Stop.key, models.Stop.id).where(models.Stop.key.in_(keys))).all())
+    for name, key in zip(names, keys):
+        if key not in stop_ids:
+            stop = models.Stop(name=name, key=key)
+            db.add(stop)
+            db.flush()
+            stop_ids[key] = stop.id
+    signature = ",".join(str(stop_ids[key]) for key in keys)
+    route_id = db.scalar(select(models.Route.id).where(models.Route.signature == signature))
+    if route_id is None:
+        route = models.Route(name=f"{names[0]} - {names[-1]}", signature=signature)
+        db.add(route)
+        db.flush()
+        db.add_all(models.RouteStop(route_id=route.id, position=position, stop_id=stop_ids[key]) for position, key in enumerate(keys))
+        db.flush()
+        route_id = route.id
+    return route_id
+
+def index_matatu(db: Session, db_matatu: models.Matatu):
+    route_index.add_route(db, db_matatu.route_id)
+    route_index.set_matatu(db_matatu.id, db_matatu.registration_number, db_matatu.route_id)
+    # Read by MatatuOut.from_orm
+    db_matatu.stops = route_index.stop_names(db_matatu.route_id)
+
+def set_matatu_route(db: Session, db_matatu: models.Matatu, stops):
+    names = clean_stop_names(stops)
+    db_matatu.route_start = names[0] if names else None
+    db_matatu.route_end = names[-1] if names else None
+    db_matatu.route_id = resolve_route(db, names)
+    db.commit()
+    db.refresh(db_matatu)
+    index_matatu(db, db_matatu)
+    response_cache.invalidate("matatus")
+    return db_matatu
+
+def get_matatus(db: Session, skip: int = 0, limit: int = 100, after_id: int = None):
+    return apply_page(db.query(models.Matatu), models.Matatu.id, skip, limit, after_id).all()
+
+# Matatus come back with their fleet name in the same query; see get_current_fares for the fare
+MATATU_SELECT = select(*MATATU_COLUMNS).outerjoin_from(models.Matatu, models.Fleet, models.Matatu.fleet_id == models.Fleet.id)
+
+def matatu_criteria(matatu_id: int = None, registration_number: str = None, operator_id: str = None):
+    criteria = []
+    if matatu_id is not None:
+        criteria.append(models.Matatu.id == matatu_id)
+    if registration_number is not None:
+        criteria.append(models.Matatu.registration_number == registration_number)
+    if operator_id is not None:
+        criteria.append(models.Matatu.operator_id == operator_id)
+    return criteria
 
-def get_matatus(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Matatu).offset(skip).limit(limit).all()
+def get_matatu_rows(db: Session, matatu_id: int = None, registration_number: str = None, operator_id: str = None, **page):
+    criteria = matatu_criteria(matatu_id, registration_number, operator_id)
+    return db.execute(select_rows(MATATU_SELECT, models.Matatu.id, *criteria, **page)).all()
+
+def get_current_fares(db: Session, matatu_ids):
+    """Latest fare row per matatu, fetched for a whole page in one query."""
+    if not matatu_ids:
+        return {}
+    rows = db.execute(select(*FARE_COLUMNS).where(models.Fare.id.in_(latest_fare_ids(matatu_ids)))).all()
+    return {row.matatu_id: row for row in rows}
 
 def get_matatu(db: Session, matatu_id: int):
     return db.query(models.Matatu).filter(models.Matatu.id == matatu_id).first()
 
+def get_matatu_ids(db: Session, fleet_id: int = None, operator_id: str = None):
+    query = db.query(models.Matatu.id)
+    if fleet_id is not None:
+        query = query.filter(models.Matatu.fleet_id == fleet_id)
+    if operator_id is not None:
+        query = query.filter(models.Matatu.operator_id == operator_id)
+    return [row.id for row in query.order_by(models.Matatu.id)]
+
 def get_matatu_by_registration(db: Session, registration_number: str):
     return db.query(models.Matatu).filter(models.Matatu.registration_number == registration_number).first()
 
@@ -97,6 +278,8 @@ def create_fare(db: Session, fare: schemas.FareCreate):
     db.add(db_fare)
     db.commit()
     db.refresh(db_fare)
+    fare_table.upsert(db_fare)
+    response_cache.invalidate("fares")
     return db_fare
 
 def get_fares_for_matatu(db: Session, matatu_id: int):
@@ -105,25 +288,178 @@ def get_fares_for_matatu(db: Session, matatu_id: int):
 def update_fare(db: Session, fare_id: int, fare_update: schemas.FareCreate):
     db_fare = db.query(models.Fare).filter(models.Fare.id == fare_id).first()
     if db_fare:
+        previous_matatu_id = db_fare.matatu_id
         for field, value in fare_update.dict().items():
             setattr(db_fare, field, value)
         db.commit()
         db.refresh(db_fare)
+        fare_table.refresh(db, {previous_matatu_id, db_fare.matatu_id})
+        response_cache.invalidate("fares")
     return db_fare
 
-def get_fares(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Fare).offset(skip).limit(limit).all()
+def get_fares(db: Session, skip: int = 0, limit: int = 100, after_id: int = None):
+    return apply_page(db.query(models.Fare), models.Fare.id, skip, limit, after_id).all()
+
+def get_fare_rows(db: Session, matatu_id: int = None, **page):
+    criteria = [models.Fare.matatu_id == matatu_id] if matatu_id is not None else []
+    return db.execute(select_rows(select(*FARE_COLUMNS), models.Fare.id, *criteria, **page)).all()
 
 # Payments
 def create_payment(db: Session, payment: schemas.PaymentCreate):
+    """Store a payment; None if its M-Pesa receipt is already recorded."""
     db_payment = models.Payment(**payment.dict())
+    if db_payment.mpesa_receipt_number and not claim_keys(db, RECEIPT_KEY, [db_payment.mpesa_receipt_number]):
+        db.rollback()
+        return None
     db.add(db_payment)
+    db.flush()
+    revenue.record(db, [revenue.payment_values(db_payment)])
     db.commit()
+    demand.record([db_payment.matatu_id])
     db.refresh(db_payment)
     return db_payment
 
-def get_payments_for_user(db: Session, user_id: int):
-    return db.query(models.Payment).filter(models.Payment.user_id == user_id).all()
+IDEMPOTENCY_KEY = "idempotency"
+RECEIPT_KEY = "receipt"
+
+def claim_keys(db: Session, kind: str, values) -> set:
+    """Claim unique payment keys; returns the ones not taken before."""
+    values = set(values)
+    if not values:
+        return set()
+    insert_for_dialect = dialect_insert(db.get_bind())
+    if insert_for_dialect is not None:
+        statement = (
+            insert_for_dialect(models.PaymentKey)
+            .values([{"kind": kind, "value": value} for value in sorted(values)])
+            .on_conflict_do_nothing()
+            .returning(models.PaymentKey.value)
+        )
+        return set(db.scalars(statement))
+    taken = set(db.scalars(select(models.PaymentKey.value).where(models.PaymentKey.kind == kind, models.PaymentKey.value.in_(values))))
+    db.add_all(models.PaymentKey(kind=kind, value=value) for value in values - taken)
+    db.flush()
+    return values - taken
+
+def insert_payments_batch(db: Session, rows):
+    # Used by the ingestion writer: one INSERT for the batch, skipping
+    # idempotency keys that are repeated or already stored, and payments
+    # whose M-Pesa receipt is already recorded
+    unique = {}
+    for row in rows:
+        unique.setdefault(row["idempotency_key"], row)
+    claimed = claim_keys(db, IDEMPOTENCY_KEY, unique)
+    fresh = [row for key, row in unique.items() if key in claimed]
+    receipts = claim_keys(db, RECEIPT_KEY, (row["mpesa_receipt_number"] for row in fresh if row.get("mpesa_receipt_number")))
+    stored, duplicates = [], []
+    for row in fresh:
+        receipt = row.get("mpesa_receipt_number")
+        if receipt and receipt not in receipts:
+            duplicates.append(row)
+            continue
+        # Only the first payment in the batch gets a repeated receipt
+        receipts.discard(receipt)
+        stored.append(row)
+    fresh = stored
+    if duplicates:
+        logger.warning("Skipped %d ingested payments with an already recorded receipt: %s",
+                       len(duplicates), [row["idempotency_key"] for row in duplicates])
+        # Their idempotency keys stay free, so they map to no payment rather than to another one
+        db.execute(delete(models.PaymentKey).where(
+            models.PaymentKey.kind == IDEMPOTENCY_KEY,
+            models.PaymentKey.value.in_([row["idempotency_key"] for row in duplicates]),
+        ))
+    if fresh:
+        db.execute(insert(models.Payment), fresh)
+        revenue.record(db, fresh)
+    db.commit()
+    demand.record(row.get("matatu_id") for row in fresh)
+    return len(fresh)
+
+def get_payment_by_idempotency_key(db: Session, idempotency_key: str):
+    return db.query(models.Payment).filter(models.Payment.idempotency_key == idempotency_key).first()
+
+# M-Pesa callbacks
+# STK pushes expire within minutes; the bound lets PostgreSQL prune to the newest partitions
+MPESA_SETTLE_WINDOW = datetime.timedelta(days=2)
+
+def mpesa_settle_statement(callback: schemas.MpesaStkCallback, receipt_number: str = None):
+    # Settles the pending payment in one statement; a retried callback matches no rows
+    values = {"status": "completed", "mpesa_receipt_number": receipt_number} if callback.ResultCode == 0 else {"status": "failed"}
+    return (
+        update(models.Payment)
+        .where(models.Payment.checkout_request_id == callback.CheckoutRequestID, models.Payment.status == "pending")
+        .where(models.Payment.timestamp >= datetime.datetime.utcnow() - MPESA_SETTLE_WINDOW)
+        .values(**values)
+        .returning(*revenue.PAYMENT_COLUMNS)
+    )
+
+def mpesa_receipt_values(callback: schemas.MpesaStkCallback, metadata: dict):
+    phone = metadata.get("PhoneNumber")
+    return {
+        "mpesa_receipt_number": metadata["MpesaReceiptNumber"],
+        "checkout_request_id": callback.CheckoutRequestID,
+        "amount": float(metadata.get("Amount") or 0),
+        "phone_number": str(phone) if phone is not None else None,
+        "payment_method": "mpesa",
+        "status": "completed",
+        "timestamp": datetime.datetime.utcnow(),
+    }
+
+def settle_mpesa_payment(db: Session, callback: schemas.MpesaStkCallback):
+    """Apply an STK push result; returns what happened for logging.
+
+    'settled'/'failed' when a pending payment was updated, 'recorded' when a
+    paid receipt had no pending payment, 'duplicate' for a repeated delivery.
+    """
+    metadata = callback.metadata()
+    receipt_number = metadata.get("MpesaReceiptNumber")
+    settled = db.execute(mpesa_settle_statement(callback, receipt_number)).mappings().all()
+    if settled:
+        if receipt_number:
+            claim_keys(db, RECEIPT_KEY, [receipt_number])
+        revenue.record(db, settled)
+        db.commit()
+        return "settled" if callback.ResultCode == 0 else "failed"
+    if callback.ResultCode != 0 or not receipt_number:
+        return "duplicate"
+    # The receipt claim decides: a repeated delivery finds it taken
+    inserted = bool(claim_keys(db, RECEIPT_KEY, [receipt_number]))
+    if inserted:
+        values = mpesa_receipt_values(callback, metadata)
+        db.execute(insert(models.Payment), [values])
+        revenue.record(db, [values])
+    db.commit()
+    return "recorded" if inserted else "duplicate"
+
+def payment_time_criteria(since: datetime.datetime = None, until: datetime.datetime = None):
+    # A timestamp bound is what lets PostgreSQL skip whole monthly partitions
+    criteria = []
+    if since is not None:
+        criteria.append(models.Payment.timestamp >= since)
+    if until is not None:
+        criteria.append(models.Payment.timestamp < until)
+    return criteria
+
+def get_payments_for_user(db: Session, user_id: int, since: datetime.datetime = None, until: datetime.datetime = None):
+    return db.query(models.Payment).filter(models.Payment.user_id == user_id, *payment_time_criteria(since, until)).all()
+
+def get_payments(db: Session, skip: int = 0, limit: int = 100, after_id: int = None,
+                 since: datetime.datetime = None, until: datetime.datetime = None):
+    query = db.query(models.Payment).filter(*payment_time_criteria(since, until))
+    return apply_page(query, models.Payment.id, skip, limit, after_id).all()
 
-def get_payments(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Payment).offset(skip).limit(limit).all()
\ No newline at end of file
+def iter_payments(db: Session, start=None, end=None, fleet_id: int = None, matatu_id: int = None,
+                  status: str = None, batch_size: int = 1000):
+    # Plain rows over a server-side cursor: nothing is hydrated into ORM objects
+    # and only batch_size rows are held in memory at a time
+    query = select(*models.Payment.__table__.columns).where(*payment_time_criteria(start, end))
+    if fleet_id is not None:
+        query = query.where(models.Payment.fleet_id == fleet_id)
+    if matatu_id is not None:
+        query = query.where(models.Payment.matatu_id == matatu_id)
+    if status is not None:
+        query = query.where(models.Payment.status == status)
+    query = query.order_by(models.Payment.id).execution_options(stream_results=True, yield_per=batch_size)
+    for partition in db.execute(query).mappings().partitions():
+        yield partition
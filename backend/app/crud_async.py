@@ -0,0 +1,219 @@
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models, schemas
+from .crud import (
+    logger, MATATU_SELECT, RECEIPT_KEY, select_rows, matatu_criteria, claim_keys, payment_time_criteria,
+    mpesa_settle_statement, mpesa_receipt_values, matatu_stop_names, resolve_route, index_matatu,
+)
+from .fare_engine import fare_table, latest_fare_ids
+from .pagination import apply_page
+from .principals import principal_cache
+from .passwords import hasher
+from .cache import response_cache
+from . import revenue
+from .surge import demand
+from .route_search import clean_stop_names
+from .serializers import FLEET_COLUMNS, FARE_COLUMNS
+import datetime
+
+# Async counterparts of app/crud.py, used when DB_ASYNC is enabled.
+# bcrypt is CPU bound, so hashing runs on the password process pool.
+
+# Users
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    hashed_password = await hasher.hash(user.password)
+    db_user = models.User(
+        name=user.name,
+        email=user.email,
+        hashed_password=hashed_password,
+        phone=user.phone,
+        role=user.role
+    )
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    principal_cache.invalidate(db_user.id)
+    return db_user
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    return await db.scalar(select(models.User).where(models.User.email == email))
+
+async def get_user(db: AsyncSession, user_id: int):
+    return await db.get(models.User, user_id)
+
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    user = await get_user_by_email(db, email)
+    if not user:
+        return False
+    valid, new_hash = await hasher.verify(password, user.hashed_password)
+    if not valid:
+        return False
+    if new_hash:
+        await db.execute(update(models.User).where(models.User.id == user.id).values(hashed_password=new_hash))
+        await db.commit()
+    return user
+
+async def get_users(db: AsyncSession, skip: int = 0, limit: int = 100, after_id: int = None):
+    return (await db.scalars(apply_page(select(models.User), models.User.id, skip, limit, after_id))).all()
+
+# Fleets
+async def create_fleet(db: AsyncSession, fleet: schemas.FleetCreate):
+    db_fleet = models.Fleet(name=fleet.name, operator_id=fleet.operator_id)
+    db.add(db_fleet)
+    await db.commit()
+    await db.refresh(db_fleet)
+    response_cache.invalidate("fleets")
+    return db_fleet
+
+async def get_fleets(db: AsyncSession, skip: int = 0, limit: int = 100, after_id: int = None):
+    return (await db.scalars(apply_page(select(models.Fleet), models.Fleet.id, skip, limit, after_id))).all()
+
+async def get_fleet_rows(db: AsyncSession, operator_id: str = None, **page):
+    criteria = [models.Fleet.operator_id == operator_id] if operator_id is not None else []
+    return (await db.execute(select_rows(select(*FLEET_COLUMNS), models.Fleet.id, *criteria, **page))).all()
+
+async def get_fleet(db: AsyncSession, fleet_id: int):
+    return await db.get(models.Fleet, fleet_id)
+
+async def fleet_has_matatus(db: AsyncSession, fleet_id: int):
+    return await db.scalar(select(models.Matatu.id).where(models.Matatu.fleet_id == fleet_id).limit(1)) is not None
+
+# Matatus
+async def create_matatu(db: AsyncSession, matatu: schemas.MatatuCreate):
+    existing = await get_matatu_by_registration(db, matatu.registration_number)
+    if existing:
+        logger.warning("Matatu with registration number %s already exists", matatu.registration_number)
+        return None
+    try:
+        db_matatu = models.Matatu(**matatu.dict(by_alias=False, exclude={"stops"}))
+        db_matatu.route_id = await db.run_sync(resolve_route, matatu_stop_names(matatu))
+        db.add(db_matatu)
+        await db.commit()
+        await db.refresh(db_matatu)
+        await db.run_sync(index_matatu, db_matatu)
+        response_cache.invalidate("matatus")
+        logger.info("Matatu registered successfully: %s", db_matatu.registration_number)
+        return db_matatu
+    except Exception as e:
+        await db.rollback()
+        logger.error("Matatu registration failed for %s: %s", matatu.registration_number, e)
+        return None
+
+async def set_matatu_route(db: AsyncSession, db_matatu: models.Matatu, stops):
+    names = clean_stop_names(stops)
+    db_matatu.route_start = names[0] if names else None
+    db_matatu.route_end = names[-1] if names else None
+    db_matatu.route_id = await db.run_sync(resolve_route, names)
+    await db.commit()
+    await db.refresh(db_matatu)
+    await db.run_sync(index_matatu, db_matatu)
+    response_cache.invalidate("matatus")
+    return db_matatu
+
+async def get_matatus(db: AsyncSession, skip: int = 0, limit: int = 100, after_id: int = None):
+    return (await db.scalars(apply_page(select(models.Matatu), models.Matatu.id, skip, limit, after_id))).all()
+
+async def get_matatu_rows(db: AsyncSession, matatu_id: int = None, registration_number: str = None, operator_id: str = None, **page):
+    criteria = matatu_criteria(matatu_id, registration_number, operator_id)
+    return (await db.execute(select_rows(MATATU_SELECT, models.Matatu.id, *criteria, **page))).all()
+
+async def get_current_fares(db: AsyncSession, matatu_ids):
+    if not matatu_ids:
+        return {}
+    rows = (await db.execute(select(*FARE_COLUMNS).where(models.Fare.id.in_(latest_fare_ids(matatu_ids))))).all()
+    return {row.matatu_id: row for row in rows}
+
+async def get_matatu(db: AsyncSession, matatu_id: int):
+    return await db.get(models.Matatu, matatu_id)
+
+async def get_matatu_ids(db: AsyncSession, fleet_id: int = None, operator_id: str = None):
+    query = select(models.Matatu.id)
+    if fleet_id is not None:
+        query = query.where(models.Matatu.fleet_id == fleet_id)
+    if operator_id is not None:
+        query = query.where(models.Matatu.operator_id == operator_id)
+    return (await db.scalars(query.order_by(models.Matatu.id))).all()
+
+async def get_matatu_by_registration(db: AsyncSession, registration_number: str):
+    return await db.scalar(select(models.Matatu).where(models.Matatu.registration_number == registration_number))
+
+async def delete(db: AsyncSession, instance):
+    await db.delete(instance)
+    await db.commit()
+
+# Fares
+async def create_fare(db: AsyncSession, fare: schemas.FareCreate):
+    db_fare = models.Fare(**fare.dict(by_alias=False))
+    db.add(db_fare)
+    await db.commit()
+    await db.refresh(db_fare)
+    fare_table.upsert(db_fare)
+    response_cache.invalidate("fares")
+    return db_fare
+
+async def get_fares_for_matatu(db: AsyncSession, matatu_id: int):
+    return (await db.scalars(select(models.Fare).where(models.Fare.matatu_id == matatu_id))).all()
+
+async def update_fare(db: AsyncSession, fare_id: int, fare_update: schemas.FareCreate):
+    db_fare = await db.get(models.Fare, fare_id)
+    if db_fare:
+        matatu_ids = {db_fare.matatu_id}
+        for field, value in fare_update.dict().items():
+            setattr(db_fare, field, value)
+        await db.commit()
+        await db.refresh(db_fare)
+        matatu_ids.add(db_fare.matatu_id)
+        fares = await db.scalars(select(models.Fare).where(models.Fare.id.in_(latest_fare_ids(matatu_ids))))
+        fare_table.replace(matatu_ids, fares.all())
+        response_cache.invalidate("fares")
+    return db_fare
+
+async def get_fares(db: AsyncSession, skip: int = 0, limit: int = 100, after_id: int = None):
+    return (await db.scalars(apply_page(select(models.Fare), models.Fare.id, skip, limit, after_id))).all()
+
+async def get_fare_rows(db: AsyncSession, matatu_id: int = None, **page):
+    criteria = [models.Fare.matatu_id == matatu_id] if matatu_id is not None else []
+    return (await db.execute(select_rows(select(*FARE_COLUMNS), models.Fare.id, *criteria, **page))).all()
+
+# Payments
+async def create_payment(db: AsyncSession, payment: schemas.PaymentCreate):
+    db_payment = models.Payment(**payment.dict())
+    if db_payment.mpesa_receipt_number and not await db.run_sync(claim_keys, RECEIPT_KEY, [db_payment.mpesa_receipt_number]):
+        await db.rollback()
+        return None
+    db.add(db_payment)
+    await db.flush()
+    await revenue.record_async(db, [revenue.payment_values(db_payment)])
+    await db.commit()
+    demand.record([db_payment.matatu_id])
+    await db.refresh(db_payment)
+    return db_payment
+
+async def settle_mpesa_payment(db: AsyncSession, callback: schemas.MpesaStkCallback):
+    metadata = callback.metadata()
+    receipt_number = metadata.get("MpesaReceiptNumber")
+    settled = (await db.execute(mpesa_settle_statement(callback, receipt_number))).mappings().all()
+    if settled:
+        if receipt_number:
+            await db.run_sync(claim_keys, RECEIPT_KEY, [receipt_number])
+        await revenue.record_async(db, settled)
+        await db.commit()
+        return "settled" if callback.ResultCode == 0 else "failed"
+    if callback.ResultCode != 0 or not receipt_number:
+        return "duplicate"
+    inserted = bool(await db.run_sync(claim_keys, RECEIPT_KEY, [receipt_number]))
+    if inserted:
+        values = mpesa_receipt_values(callback, metadata)
+        await db.execute(insert(models.Payment), [values])
+        await revenue.record_async(db, [values])
+    await db.commit()
+    return "recorded" if inserted else "duplicate"
+
+async def get_payments_for_user(db: AsyncSession, user_id: int, since: datetime.datetime = None, until: datetime.datetime = None):
+    query = select(models.Payment).where(models.Payment.user_id == user_id, *payment_time_criteria(since, until))
+    return (await db.scalars(query)).all()
+
+async def get_payments(db: AsyncSession, skip: int = 0, limit: int = 100, after_id: int = None,
+                       since: datetime.datetime = None, until: datetime.datetime = None):
+    query = select(models.Payment).where(*payment_time_criteria(since, until))
+    return (await db.scalars(apply_page(query, models.Payment.id, skip, limit, after_id))).all()
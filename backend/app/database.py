@@ -1,22 +1,303 @@
-import os
-from sqlalchemy import create_engine
+import itertools
+import logging
+import math
+import threading
+import time
+from fastapi import Request
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
+from sqlalchemy.orm import Session, sessionmaker
+from .config import settings
+from .metrics import instrument_engine
 
-load_dotenv()
+logger = logging.getLogger("database")
 
-SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
+SQLALCHEMY_DATABASE_URL = settings.database_url
+# DB_ASYNC=1 serves the API with async handlers on an asyncio engine
+DB_ASYNC = settings.db_async
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {}
-)
+def async_database_url(url: str) -> str:
+    if url.startswith("postgresql://") or url.startswith("postgresql+psycopg2://"):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url.split("://", 1)[1]
+    return url
+
+ASYNC_DATABASE_URL = settings.async_database_url or async_database_url(SQLALCHEMY_DATABASE_URL)
+
+# Read replicas (comma-separated URLs): GET routes read through
+# get_read_db, which takes them round-robin when a handler first queries,
+# so handlers answered from memory or a cache never take a replica
+# connection. A replica that cannot be reached is skipped for
+# REPLICA_RETRY_SECONDS, and with none left reads go to the primary. After a write the client gets a cookie that keeps its
+# reads on the primary for REPLICA_STICKY_SECONDS, so it sees its own writes
+# despite replication lag.
+DATABASE_REPLICA_URLS = [url.strip() for url in (settings.database_replica_urls or "").split(",") if url.strip()]
+REPLICA_STICKY_SECONDS = settings.replica_sticky_seconds
+REPLICA_RETRY_SECONDS = settings.replica_retry_seconds
+READ_PRIMARY_COOKIE = "read_primary_until"
+
+# Connection pool settings (ignored for SQLite, which uses its own pools)
+DB_POOL_SIZE = settings.db_pool_size
+DB_MAX_OVERFLOW = settings.db_max_overflow
+DB_POOL_TIMEOUT = settings.db_pool_timeout
+DB_POOL_RECYCLE = settings.db_pool_recycle
+DB_POOL_PRE_PING = settings.db_pool_pre_ping
+
+class PoolStats:
+    """Counters for connection checkouts and time spent waiting on the pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def snapshot(self, pool) -> dict:
+        stats = {
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "connects": self.connects,
+            "timeouts": self.timeouts,
+            "waitSecondsTotal": round(self.wait_seconds_total, 6),
+            "waitSecondsMax": round(self.wait_seconds_max, 6),
+        }
+        if isinstance(pool, QueuePool):
+            stats.update(size=pool.size(), checkedOut=pool.checkedout(), overflow=pool.overflow(), idle=pool.checkedin())
+        return stats
+
+pool_stats = PoolStats()
+
+class _TimedPoolMixin:
+    # _do_get only runs when a connection is actually taken from the pool,
+    # so this is the time a request spends waiting for (or opening) one
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            pool_stats.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_stats.record_wait(time.perf_counter() - start)
+        return conn
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+def engine_options(url: str, poolclass) -> dict:
+    if url.startswith("sqlite"):
+        return {"connect_args": {"check_same_thread": False}} if "aiosqlite" not in url else {}
+    return {
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+def instrument_pool(engine):
+    def on_connect(dbapi_connection, connection_record):
+        pool_stats.connects += 1
+
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_stats.checkouts += 1
+
+    def on_checkin(dbapi_connection, connection_record):
+        pool_stats.checkins += 1
+
+    event.listen(engine, "connect", on_connect)
+    event.listen(engine, "checkout", on_checkout)
+    event.listen(engine, "checkin", on_checkin)
+
+class ReplicaSet:
+    """Engines of the read replicas, handed out round-robin, skipping those marked down."""
+
+    def __init__(self, engines, primary):
+        self.engines = engines
+        self.primary = primary
+        self._down_until = [0.0] * len(engines)
+        self._next = itertools.count()
+        self.replica_reads = 0
+        self.primary_reads = 0
+
+    def candidates(self):
+        """(position, engine) of the replicas to try for one read, in order."""
+        now = time.monotonic()
+        start = next(self._next)
+        order = [(start + i) % len(self.engines) for i in range(len(self.engines))]
+        return [(i, self.engines[i]) for i in order if self._down_until[i] <= now]
+
+    def mark_down(self, position: int, exc: Exception):
+        self._down_until[position] = time.monotonic() + REPLICA_RETRY_SECONDS
+        logger.warning("Read replica %d unavailable for %.0f s: %s", position, REPLICA_RETRY_SECONDS, exc)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "replicas": len(self.engines),
+            "down": sum(1 for until in self._down_until if until > now),
+            "replicaReads": self.replica_reads,
+            "primaryReads": self.primary_reads,
+        }
+
+class ReadSession(Session):
+    """Session that connects to a replica when it first needs a connection, not when it is opened.
+
+    An unreachable replica is marked down and the next one tried, then the
+    primary. Under AsyncSession this runs in its greenlet, so the same class
+    serves both engines.
+    """
+
+    def __init__(self, replica_set: ReplicaSet, **kwargs):
+        super().__init__(**kwargs)
+        self.replica_set = replica_set
+        self._read_bind = None
+        self._read_connection = None
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._read_bind is None:
+            self._read_bind = self._connect()
+        return self._read_bind
+
+    def _connect(self):
+        for position, replica in self.replica_set.candidates():
+            try:
+                self._read_connection = replica.connect()
+            except (OperationalError, PoolTimeoutError) as exc:
+                self.replica_set.mark_down(position, exc)
+                continue
+            self.replica_set.replica_reads += 1
+            return self._read_connection
+        self.replica_set.primary_reads += 1
+        return self.replica_set.primary
+
+    def close(self):
+        super().close()
+        if self._read_connection is not None:
+            self._read_connection.close()
+        self._read_bind = self._read_connection = None
+
+def create_instrumented_engine(url: str):
+    engine = create_engine(url, **engine_options(url, TimedQueuePool))
+    instrument_pool(engine)
+    instrument_engine(engine)
+    return engine
+
+engine = create_instrumented_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+# Replica connections count towards pool_stats with the primary's
+replicas = ReplicaSet([create_instrumented_engine(url) for url in DATABASE_REPLICA_URLS], engine)
+
+async_engine = None
+AsyncSessionLocal = None
+async_replicas = None
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+
+    def create_instrumented_async_engine(url: str):
+        created = create_async_engine(url, **engine_options(url, TimedAsyncQueuePool))
+        instrument_pool(created.sync_engine)
+        instrument_engine(created.sync_engine)
+        return created
+
+    async_engine = create_instrumented_async_engine(ASYNC_DATABASE_URL)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    # The sessions run on the sync side of these engines, inside AsyncSession's greenlet
+    async_replicas = ReplicaSet([
+        create_instrumented_async_engine(async_database_url(url)).sync_engine for url in DATABASE_REPLICA_URLS
+    ], async_engine.sync_engine)
+
+def dialect_insert(bind):
+    """insert() with ON CONFLICT support for the bind's dialect, or None."""
+    name = bind.dialect.name
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
 
+# FastAPI caches a dependency per request, so every Depends(get_db) in one
+# request (router, auth, ...) shares this session and its single connection
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def reads_primary(request: Request) -> bool:
+    """Whether the client wrote recently enough that a replica may not have its write yet."""
+    try:
+        return float(request.cookies.get(READ_PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+def open_read_session(primary: bool = False):
+    """Session that reads from a reachable replica, or from the primary if asked for or none is reachable."""
+    if primary or not replicas.engines:
+        replicas.primary_reads += 1
+        return SessionLocal()
+    return ReadSession(replicas, autoflush=False)
+
+def open_async_read_session(primary: bool = False):
+    if primary or not async_replicas.engines:
+        async_replicas.primary_reads += 1
+        return AsyncSessionLocal()
+    return AsyncSession(sync_session_class=ReadSession, replica_set=async_replicas, autoflush=False, expire_on_commit=False)
+
+# For GET routes: a replica session unless the client has just written.
+# Routes that write, or read to decide a write, keep using get_db.
+def get_read_db(request: Request):
+    db = open_read_session(reads_primary(request))
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db(request: Request):
+    async with open_async_read_session(reads_primary(request)) as db:
+        yield db
+
+class ReadYourWritesMiddleware:
+    """Sets the read-primary cookie on successful responses to writes (anything but GET/HEAD/OPTIONS)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in ("GET", "HEAD", "OPTIONS"):
+            return await self.app(scope, receive, send)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                cookie = (
+                    f"{READ_PRIMARY_COOKIE}={time.time() + REPLICA_STICKY_SECONDS:.3f}; "
+                    f"Max-Age={math.ceil(REPLICA_STICKY_SECONDS)}; Path=/; HttpOnly; SameSite=Lax"
+                )
+                message = {**message, "headers": [*message.get("headers", []), (b"set-cookie", cookie.encode())]}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
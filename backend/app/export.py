@@ -0,0 +1,70 @@
+import csv
+import datetime
+import io
+import json
+from enum import Enum
+from . import crud
+from .database import open_read_session
+
+# Column -> field name in the export, same names as PaymentOut
+PAYMENT_FIELDS = {
+    "id": "id",
+    "user_id": "userId",
+    "matatu_id": "matatuId",
+    "fleet_id": "fleetId",
+    "amount": "amount",
+    "route": "route",
+    "timestamp": "timestamp",
+    "status": "status",
+    "start_location": "startLocation",
+    "end_location": "endLocation",
+    "mpesa_receipt_number": "mpesaReceiptNumber",
+    "payment_method": "paymentMethod",
+    "phone_number": "phoneNumber",
+    "checkout_request_id": "checkoutRequestId",
+}
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+}
+
+def _value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+def _ndjson_chunks(partitions):
+    dumps = json.dumps
+    for rows in partitions:
+        yield "".join(
+            dumps({field: _value(row[column]) for column, field in PAYMENT_FIELDS.items()}) + "\n"
+            for row in rows
+        )
+
+def _csv_chunks(partitions):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(PAYMENT_FIELDS.values())
+    for rows in partitions:
+        writer.writerows([_value(row[column]) for column in PAYMENT_FIELDS] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    # Header only when nothing matched
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def stream_payments(fmt: ExportFormat, **filters):
+    # Owns its session: the response body is produced after the request's
+    # dependencies have been torn down. Past days, so a replica will do
+    db = open_read_session()
+    try:
+        partitions = crud.iter_payments(db, **filters)
+        yield from _csv_chunks(partitions) if fmt == ExportFormat.csv else _ndjson_chunks(partitions)
+    finally:
+        db.close()
@@ -0,0 +1,301 @@
+from array import array
+import bisect
+import datetime
+import os
+import struct
+import threading
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from . import models
+from .shared_state import SHARED_STATE_DIR, generations, map_file, write_atomic
+
+# Peak windows (inclusive hours) - same as TimeManager.isPeakHours() in the Android app
+PEAK_HOURS = ((6, 9), (16, 20))
+# Fares are quoted in Nairobi time (EAT, no DST)
+EAT = datetime.timezone(datetime.timedelta(hours=3), "EAT")
+
+# Superseded rows tolerated (beyond one per live matatu) before upsert() compacts
+FARE_TABLE_SLACK = 1024
+
+# Column order of the four price points inside a row
+NON_PEAK, PEAK, RAINY_NON_PEAK, RAINY_PEAK = range(4)
+FARE_TYPES = ("nonPeak", "peak", "rainyNonPeak", "rainyPeak")
+
+def is_peak(when: datetime.datetime) -> bool:
+    hour = when.hour
+    return any(start <= hour <= end for start, end in PEAK_HOURS)
+
+def to_local(when: datetime.datetime = None) -> datetime.datetime:
+    if when is None:
+        return datetime.datetime.now(EAT)
+    if when.tzinfo is None:
+        # Naive times from clients are already local
+        return when.replace(tzinfo=EAT)
+    return when.astimezone(EAT)
+
+class FareTable:
+    """Latest fare per matatu, packed into flat arrays.
+
+    Rows are append-only: an update writes a new row and then swaps the
+    matatu's index entry, so readers never take the lock or see a half
+    written row. Once superseded rows outnumber the live ones (plus
+    FARE_TABLE_SLACK), the live rows are copied into fresh arrays and the
+    whole state is swapped; readers holding the old state keep using it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (index, fare_ids, prices, discounts) - swapped as a whole on load() and compaction
+        self._state = ({}, array("q"), array("d"), array("d"))
+        self._superseded = 0
+
+    def __len__(self):
+        return len(self._current()[0])
+
+    def __contains__(self, matatu_id):
+        return matatu_id in self._current()[0]
+
+    def _current(self):
+        return self._state
+
+    def load(self, fares):
+        fare_ids, prices, discounts, index = array("q"), array("d"), array("d"), {}
+        for fare in sorted(fares, key=lambda f: f.id):
+            index[fare.matatu_id] = len(fare_ids)
+            fare_ids.append(fare.id)
+            prices.extend(_price_points(fare))
+            discounts.append(fare.disability_discount or 0.0)
+        with self._lock:
+            self._state = (index, fare_ids, prices, discounts)
+            self._superseded = 0
+
+    def load_from_db(self, db: Session):
+        self.load(db.query(models.Fare).all())
+
+    def upsert(self, fare):
+        with self._lock:
+            index, fare_ids, prices, discounts = self._state
+            row = index.get(fare.matatu_id)
+            if row is not None and fare_ids[row] > fare.id:
+                # A newer fare already wins for this matatu
+                return
+            fare_ids.append(fare.id)
+            prices.extend(_price_points(fare))
+            discounts.append(fare.disability_discount or 0.0)
+            index[fare.matatu_id] = len(fare_ids) - 1
+            self._superseded += row is not None
+            self._compact_if_due()
+
+    def discard(self, matatu_id):
+        with self._lock:
+            if self._state[0].pop(matatu_id, None) is not None:
+                self._superseded += 1
+                self._compact_if_due()
+
+    def _compact_if_due(self):
+        index, fare_ids, prices, discounts = self._state
+        if self._superseded <= len(index) + FARE_TABLE_SLACK:
+            return
+        new_index, new_fare_ids, new_prices, new_discounts = {}, array("q"), array("d"), array("d")
+        for matatu_id, row in index.items():
+            new_index[matatu_id] = len(new_fare_ids)
+            new_fare_ids.append(fare_ids[row])
+            new_prices.extend(prices[row * 4:row * 4 + 4])
+            new_discounts.append(discounts[row])
+        self._state = (new_index, new_fare_ids, new_prices, new_discounts)
+        self._superseded = 0
+
+    def refresh(self, db: Session, matatu_ids):
+        """Reload the latest fare for the given matatus from the database."""
+        matatu_ids = {m for m in matatu_ids if m is not None}
+        if matatu_ids:
+            self.replace(matatu_ids, db.query(models.Fare).filter(models.Fare.id.in_(latest_fare_ids(matatu_ids))).all())
+
+    def replace(self, matatu_ids, fares):
+        found = set()
+        for fare in fares:
+            found.add(fare.matatu_id)
+            self.upsert(fare)
+        for matatu_id in set(matatu_ids) - found:
+            self.discard(matatu_id)
+
+    def snapshot(self):
+        """Copy of the current state: (matatu_ids, rows, fare_ids, prices, discounts).
+
+        rows[i] is matatu_ids[i]'s row in the other arrays; superseded rows
+        stay until the next compaction, so index through rows.
+        """
+        index, fare_ids, prices, discounts = self._current()
+        with self._lock:
+            return array("q", index.keys()), array("q", index.values()), array("q", fare_ids), array("d", prices), array("d", discounts)
+
+    def quote(self, matatu_id: int, when: datetime.datetime = None, rainy: bool = False, disabled: bool = False):
+        return self._quote(self._current(), matatu_id, to_local(when), rainy, disabled)
+
+    def quote_many(self, matatu_ids, when: datetime.datetime = None, rainy: bool = False, disabled: bool = False):
+        """Quote several matatus against one snapshot; returns (quotes, ids without a fare)."""
+        state = self._current()
+        local = to_local(when)
+        quotes, missing = [], []
+        for matatu_id in matatu_ids:
+            quote = self._quote(state, matatu_id, local, rainy, disabled)
+            if quote is None:
+                missing.append(matatu_id)
+            else:
+                quotes.append(quote)
+        return quotes, missing
+
+    @staticmethod
+    def _quote(state, matatu_id, local, rainy, disabled):
+        index, fare_ids, prices, discounts = state
+        row = index.get(matatu_id)
+        if row is None:
+            return None
+        peak = is_peak(local)
+        column = (RAINY_PEAK if peak else RAINY_NON_PEAK) if rainy else (PEAK if peak else NON_PEAK)
+        base_fare = prices[row * 4 + column]
+        discount = base_fare * discounts[row] if disabled else 0.0
+        return {
+            "matatuId": matatu_id,
+            "fareId": fare_ids[row],
+            "fareType": FARE_TYPES[column],
+            "isPeak": peak,
+            "isRainy": rainy,
+            "quotedAt": local,
+            "baseFare": base_fare,
+            "discount": discount,
+            "fare": max(base_fare - discount, 0.0),
+        }
+
+class SortedIndex:
+    """matatu_id -> row over a sorted id array: the index of a mapped snapshot, shared by every worker."""
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, matatu_id):
+        return self.get(matatu_id) is not None
+
+    def get(self, matatu_id, default=None):
+        row = bisect.bisect_left(self.ids, matatu_id)
+        return row if row < len(self.ids) and self.ids[row] == matatu_id else default
+
+    def keys(self):
+        return self.ids
+
+    def values(self):
+        return range(len(self.ids))
+
+class SharedFareTable(FareTable):
+    """FareTable read from a memory-mapped snapshot file shared by all workers.
+
+    One compact row per matatu, sorted by matatu id. Every change rewrites
+    the snapshot under a file lock from the latest published one and bumps
+    the "fares" generation; readers remap when the generation moved, so a
+    box holds one copy of the table in the page cache, not one per worker.
+    """
+
+    HEADER = struct.Struct("=8sqq")  # magic, owner (the workers' parent pid), rows
+    MAGIC = b"FARESNP1"
+
+    def __init__(self, directory: str):
+        super().__init__()
+        self.path = os.path.join(directory, "fares.snapshot")
+        self._generation = None
+        self._owner = None
+
+    def _current(self):
+        generation = generations.get("fares")
+        if generation != self._generation:
+            with self._lock:
+                self._attach(generation)
+        return self._state
+
+    def _attach(self, generation):
+        mapped = map_file(self.path)
+        if mapped is None:
+            self._state, self._owner = (SortedIndex(array("q")), array("q"), array("d"), array("d")), None
+        else:
+            magic, self._owner, rows = self.HEADER.unpack_from(mapped)
+            if magic != self.MAGIC:
+                raise ValueError(f"{self.path} is not a fare snapshot")
+            view = memoryview(mapped)[self.HEADER.size:]
+            ids, fare_ids = view[:rows * 8].cast("q"), view[rows * 8:rows * 16].cast("q")
+            prices, discounts = view[rows * 16:rows * 48].cast("d"), view[rows * 48:rows * 56].cast("d")
+            self._state = (SortedIndex(ids), fare_ids, prices, discounts)
+        self._generation = generation
+
+    def _publish(self, change, rows=None):
+        """Apply `change(rows)` to {matatu_id: (fare_id, price points, discount)} and publish the result."""
+        with generations.lock("fares"):
+            if rows is None:
+                with self._lock:
+                    self._attach(generations.get("fares"))
+                    index, fare_ids, prices, discounts = self._state
+                    rows = {
+                        matatu_id: (fare_ids[row], tuple(prices[row * 4:row * 4 + 4]), discounts[row])
+                        for row, matatu_id in enumerate(index.keys())
+                    }
+            change(rows)
+            ordered = sorted(rows.items())
+            write_atomic(self.path, (
+                self.HEADER.pack(self.MAGIC, os.getppid(), len(ordered)),
+                array("q", (matatu_id for matatu_id, _ in ordered)).tobytes(),
+                array("q", (fare_id for _, (fare_id, _, _) in ordered)).tobytes(),
+                array("d", (price for _, (_, points, _) in ordered for price in points)).tobytes(),
+                array("d", (discount for _, (_, _, discount) in ordered)).tobytes(),
+            ))
+            generation = generations.bump("fares")
+            with self._lock:
+                self._attach(generation)
+
+    @staticmethod
+    def _row(fare):
+        return fare.id, _price_points(fare), fare.disability_discount or 0.0
+
+    def load(self, fares):
+        rows = {}
+        for fare in sorted(fares, key=lambda f: f.id):
+            rows[fare.matatu_id] = self._row(fare)
+        self._publish(lambda _: None, rows)
+
+    def load_from_db(self, db: Session):
+        # The first worker of a deployment builds the snapshot, the rest attach to it
+        with generations.lock("fares-load"):
+            with self._lock:
+                self._attach(generations.get("fares"))
+            if self._owner != os.getppid():
+                self.load(db.query(models.Fare).all())
+
+    def upsert(self, fare):
+        def change(rows):
+            current = rows.get(fare.matatu_id)
+            if current is None or current[0] <= fare.id:
+                rows[fare.matatu_id] = self._row(fare)
+        self._publish(change)
+
+    def discard(self, matatu_id):
+        self._publish(lambda rows: rows.pop(matatu_id, None))
+
+    def replace(self, matatu_ids, fares):
+        def change(rows):
+            for matatu_id in matatu_ids:
+                rows.pop(matatu_id, None)
+            for fare in sorted(fares, key=lambda f: f.id):
+                rows[fare.matatu_id] = self._row(fare)
+        self._publish(change)
+
+def latest_fare_ids(matatu_ids):
+    return (
+        select(func.max(models.Fare.id))
+        .where(models.Fare.matatu_id.in_(matatu_ids))
+        .group_by(models.Fare.matatu_id)
+    )
+
+def _price_points(fare):
+    return (fare.non_peak_fare, fare.peak_fare, fare.rainy_non_peak_fare, fare.rainy_peak_fare)
+
+fare_table = SharedFareTable(SHARED_STATE_DIR) if SHARED_STATE_DIR else FareTable()
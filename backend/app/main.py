@@ -1,10 +1,52 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from .database import engine, Base
-from .routers import users, fleets, matatus, fares, payments, auth
+from .database import SessionLocal, DB_ASYNC, DATABASE_REPLICA_URLS, ReadYourWritesMiddleware
+from .fare_engine import fare_table
+from .partitions import partition_maintainer
+from .surge import surge_engine
+from .route_search import route_index
+from .positions import position_log
+from .payment_ingest import ingestor
+from .passwords import hasher
+from .metrics import METRICS_ENABLED, MetricsMiddleware
+from .routers import health, metrics, positions
 
-Base.metadata.create_all(bind=engine)
+if DB_ASYNC:
+    from .routers.aio import users, fleets, matatus, fares, payments, revenue, routes, auth
+else:
+    from .routers import users, fleets, matatus, fares, payments, revenue, routes, auth
 
-app = FastAPI(title="Dynamic Matatu Fare API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    db = SessionLocal()
+    try:
+        fare_table.load_from_db(db)
+        route_index.load(db)
+    finally:
+        db.close()
+    ingestor.start()
+    partition_maintainer.start()
+    surge_engine.start()
+    position_log.start()
+    if metrics.publisher:
+        metrics.publisher.start()
+    yield
+    if metrics.publisher:
+        metrics.publisher.stop()
+    position_log.stop()
+    surge_engine.stop()
+    partition_maintainer.stop()
+    ingestor.stop()
+    hasher.shutdown()
+    if DB_ASYNC:
+        from .database import async_engine
+        await async_engine.dispose()
+
+app = FastAPI(title="Dynamic Matatu Fare API", lifespan=lifespan)
+if DATABASE_REPLICA_URLS:
+    app.add_middleware(ReadYourWritesMiddleware)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
 
 app.include_router(auth.router)
 app.include_router(users.router)
@@ -12,3 +54,8 @@ app.include_router(fleets.router)
 app.include_router(matatus.router)
 app.include_router(fares.router)
 app.include_router(payments.router)
+app.include_router(revenue.router)
+app.include_router(routes.router)
+app.include_router(positions.router)
+app.include_router(health.router)
+app.include_router(metrics.router)
@@ -0,0 +1,287 @@
+import bisect
+import contextvars
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from sqlalchemy import event
+from .shared_state import write_atomic
+from .profiler import PROFILING_ENABLED, profile_requested, sampler
+from .config import settings
+
+logger = logging.getLogger("sql.slow")
+
+# Request and SQL instrumentation, exported at GET /metrics in the
+# Prometheus text format. Latency is kept per route template (never the raw
+# path, so ids do not multiply the series) and SQL time is attributed to
+# the request that issued it through a context variable. Under the
+# multi-worker runner each worker also publishes its numbers to the
+# shared-state directory every METRICS_PUBLISH_INTERVAL seconds, and the
+# worker that is scraped adds up its own and the other live workers'.
+METRICS_ENABLED = settings.metrics_enabled
+SLOW_QUERY_MS = settings.slow_query_ms
+SLOW_QUERY_MAX_CHARS = 2000
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+METRICS_PUBLISH_INTERVAL = 5
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name: str, help_text: str, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._series = {}
+
+    def observe(self, labels: tuple, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {labels: list(values) for labels, values in self._series.items()}
+
+    @staticmethod
+    def merge(values, other):
+        return [a + b for a, b in zip(values, other)]
+
+    def render(self, series: dict = None) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        series = self.snapshot() if series is None else series
+        for labels, values in sorted(series.items()):
+            base = _labels(self.label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values):
+                cumulative += count
+                le = bound if isinstance(bound, str) else repr(float(bound))
+                lines.append(f"{self.name}_bucket{{{base}{',' if base else ''}le=\"{le}\"}} {cumulative}")
+            suffix = f"{{{base}}}" if base else ""
+            lines.append(f"{self.name}_sum{suffix} {values[-1]!r}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(value, other):
+        return value + other
+
+    def render(self, values: dict = None) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        values = self.snapshot() if values is None else values
+        for labels, value in sorted(values.items()):
+            base = _labels(self.label_names, labels)
+            lines.append(f"{self.name}{{{base}}} {value!r}" if base else f"{self.name} {value!r}")
+        return lines
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(names, values) -> str:
+    return ",".join(f"{name}=\"{_escape(value)}\"" for name, value in zip(names, values))
+
+def _gauges(name: str, help_text: str, values: dict, label_names=("stat",)) -> list:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    lines.extend(f"{name}{{{_labels(label_names, labels)}}} {value!r}" for labels, value in sorted(values.items()))
+    return lines
+
+request_seconds = Histogram(
+    "http_request_duration_seconds", "Request latency by route template.", ("method", "route"), LATENCY_BUCKETS
+)
+requests_total = Counter("http_requests_total", "Requests by route template and status code.", ("method", "route", "status"))
+request_queries = Histogram(
+    "http_request_db_queries", "SQL statements executed per request.", ("method", "route"), QUERY_COUNT_BUCKETS
+)
+request_query_seconds = Histogram(
+    "http_request_db_seconds", "Time spent in SQL per request.", ("method", "route"), LATENCY_BUCKETS
+)
+query_seconds = Histogram("db_query_duration_seconds", "Latency of every SQL statement, requests or not.", (), LATENCY_BUCKETS)
+slow_queries = Counter("db_slow_queries_total", "SQL statements slower than SLOW_QUERY_MS.")
+
+# [statement count, seconds] for the request being served; a list so that
+# sync handlers on the threadpool (which run in a copy of the context) add to
+# the same totals
+_request_queries = contextvars.ContextVar("request_queries", default=None)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    query_seconds.observe((), elapsed)
+    totals = _request_queries.get()
+    if totals is not None:
+        totals[0] += 1
+        totals[1] += elapsed
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        slow_queries.inc()
+        logger.warning("Slow query (%.0f ms): %.*s", elapsed * 1000, SLOW_QUERY_MAX_CHARS, statement)
+
+def _handle_error(exception_context):
+    started = exception_context.connection.info.get("query_started") if exception_context.connection is not None else None
+    if started:
+        started.pop()
+
+def instrument_engine(engine):
+    """Time every statement on `engine` (a sync Engine; pass async_engine.sync_engine)."""
+    if not METRICS_ENABLED or event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+def route_label(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+class MetricsMiddleware:
+    """Times each HTTP request and counts its SQL; hands profiled requests to the sampler."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        if PROFILING_ENABLED and profile_requested(scope):
+            return await sampler.profile(self.app, scope, receive, send)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        totals = [0, 0.0]
+        token = _request_queries.set(totals)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_queries.reset(token)
+            labels = (scope["method"], route_label(scope))
+            request_seconds.observe(labels, elapsed)
+            requests_total.inc(labels + (str(status[0]),))
+            request_queries.observe(labels, totals[0])
+            request_query_seconds.observe(labels, totals[1])
+
+METRICS = (request_seconds, requests_total, request_queries, request_query_seconds, query_seconds, slow_queries)
+GAUGE_HELP = {"db_pool": "Connection pool counters and sizes."}
+
+def snapshot(gauges: dict) -> dict:
+    """This worker's series and `gauges` ({name: {stat: value}}) in the form workers publish."""
+    return {
+        "pid": os.getpid(),
+        "series": {metric.name: [[list(labels), values] for labels, values in metric.snapshot().items()] for metric in METRICS},
+        "gauges": {
+            name: {stat: value for stat, value in values.items() if isinstance(value, (int, float))}
+            for name, values in gauges.items()
+        },
+    }
+
+def render(gauges: dict = None, others=()) -> str:
+    """This worker's metrics, added up with the snapshots `others` published.
+
+    Histograms and counters are summed; gauges describe one process each, so
+    with other workers present they get a worker label instead.
+    """
+    workers = [snapshot(gauges or {}), *others]
+    lines = []
+    for metric in METRICS:
+        merged = {}
+        for worker in workers:
+            for labels, values in worker["series"].get(metric.name, ()):
+                labels = tuple(labels)
+                merged[labels] = metric.merge(merged[labels], values) if labels in merged else values
+        lines.extend(metric.render(merged))
+    for name in dict.fromkeys(name for worker in workers for name in worker["gauges"]):
+        help_text = GAUGE_HELP.get(name, f"{name} statistics.")
+        if others:
+            values = {(stat, worker["pid"]): value for worker in workers for stat, value in worker["gauges"].get(name, {}).items()}
+            lines.extend(_gauges(name, help_text, values, ("stat", "worker")))
+        else:
+            lines.extend(_gauges(name, help_text, {(stat,): value for stat, value in workers[0]["gauges"][name].items()}))
+    return "\n".join(lines) + "\n"
+
+class MetricsPublisher:
+    """Writes this worker's snapshot to <directory>/metrics-<pid>.snapshot on a background thread."""
+
+    def __init__(self, directory: str, gauges, interval: float = METRICS_PUBLISH_INTERVAL):
+        self.directory = directory
+        self.gauges = gauges
+        self.interval = interval
+        self.path = os.path.join(directory, f"metrics-{os.getpid()}.snapshot")
+        self._stop = threading.Event()
+        self._thread = None
+
+    def publish(self):
+        write_atomic(self.path, [json.dumps(snapshot(self.gauges())).encode()])
+
+    def others(self) -> list:
+        """The latest snapshots of the other workers that are still running."""
+        found = []
+        for path in glob.glob(os.path.join(self.directory, "metrics-*.snapshot")):
+            if path == self.path:
+                continue
+            try:
+                with open(path, encoding="utf-8") as f:
+                    published = json.load(f)
+                os.kill(published["pid"], 0)
+            except (OSError, ValueError):
+                # Gone since, or a worker that exited
+                continue
+            found.append(published)
+        return found
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-publisher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _run(self):
+        while True:
+            try:
+                self.publish()
+            except Exception:
+                logger.exception("Publishing metrics failed")
+            if self._stop.wait(self.interval):
+                return
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Date, DateTime, Index
 from sqlalchemy.orm import relationship
 from .database import Base
 import datetime
@@ -24,7 +24,7 @@ class Matatu(Base):
     __tablename__ = "matatus"
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     registration_number = Column(String, unique=True, index=True, nullable=False)
-    fleet_id = Column(Integer, ForeignKey("fleets.id"))
+    fleet_id = Column(Integer, ForeignKey("fleets.id"), index=True)
     pochi_number = Column(String, nullable=True)
     paybill_number = Column(String, nullable=True)
     till_number = Column(String, nullable=True)
@@ -33,14 +33,38 @@ class Matatu(Base):
     mpesa_option = Column(String, nullable=True)
     route_start = Column(String, nullable=True)
     route_end = Column(String, nullable=True)
+    route_id = Column(Integer, ForeignKey("routes.id"), nullable=True, index=True)
     matatu_id = Column(String, nullable=True)
     operator_id = Column(String, nullable=False, index=True)
     fares = relationship("Fare", back_populates="matatu")
     fleet = relationship("Fleet", back_populates="matatus")
     payments = relationship("Payment", back_populates="matatu")
 
+class Stop(Base):
+    __tablename__ = "stops"
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    # Lower-cased, single-spaced name; "Kencom " and "kencom" are the same stop
+    key = Column(String, unique=True, index=True, nullable=False)
+
+class Route(Base):
+    """An ordered list of stops, shared by every matatu that runs it."""
+    __tablename__ = "routes"
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    # Comma-separated stop ids in order, so the same stop sequence is stored once
+    signature = Column(String, unique=True, index=True, nullable=False)
+
+class RouteStop(Base):
+    __tablename__ = "route_stops"
+    route_id = Column(Integer, ForeignKey("routes.id"), primary_key=True)
+    position = Column(Integer, primary_key=True, autoincrement=False)
+    stop_id = Column(Integer, ForeignKey("stops.id"), nullable=False, index=True)
+
 class Fare(Base):
     __tablename__ = "fares"
+    # Serves "fares of a matatu" and "latest fare per matatu" (max id per matatu_id)
+    __table_args__ = (Index("ix_fares_matatu_id_id", "matatu_id", "id"),)
     id = Column(Integer, primary_key=True, index=True)
     matatu_id = Column(Integer, ForeignKey("matatus.id"))
     peak_fare = Column(Float, nullable=False)
@@ -52,18 +76,58 @@ class Fare(Base):
 
 class Payment(Base):
     __tablename__ = "payments"
+    # Per-rider, per-vehicle, per-fleet and per-status history, each within a time range
+    __table_args__ = (
+        Index("ix_payments_user_id_timestamp", "user_id", "timestamp"),
+        Index("ix_payments_matatu_id_timestamp", "matatu_id", "timestamp"),
+        Index("ix_payments_fleet_id_timestamp", "fleet_id", "timestamp"),
+        Index("ix_payments_status_timestamp", "status", "timestamp"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     matatu_id = Column(Integer, ForeignKey("matatus.id"))
     amount = Column(Float, nullable=False)
     route = Column(String, nullable=True)
-    timestamp = Column(DateTime, default=datetime.datetime.utcnow)
+    # Partition key on PostgreSQL (monthly ranges, see app/partitions.py)
+    timestamp = Column(DateTime, default=datetime.datetime.utcnow, nullable=False, index=True)
     status = Column(String, default="pending")
     start_location = Column(String, nullable=True)
     end_location = Column(String, nullable=True)
-    mpesa_receipt_number = Column(String, nullable=True)
+    mpesa_receipt_number = Column(String, index=True, nullable=True)
     payment_method = Column(String, nullable=True)
     phone_number = Column(String, nullable=True)
     fleet_id = Column(Integer, ForeignKey("fleets.id"), nullable=True)
+    # Unique across all partitions through PaymentKey, not a unique index
+    idempotency_key = Column(String, index=True, nullable=True)
+    checkout_request_id = Column(String, index=True, nullable=True)
     user = relationship("User", back_populates="payments")
     matatu = relationship("Matatu", back_populates="payments")
+
+class PaymentKey(Base):
+    """Claimed idempotency keys and M-Pesa receipt numbers.
+
+    A partitioned table can only enforce uniqueness together with the
+    partition key, so global uniqueness lives in this unpartitioned table
+    and is claimed in the same transaction as the payment insert. Keys
+    cover the payments still stored: archiving a month releases its keys
+    (app/partitions.py), so the table grows with retention, not history.
+    """
+    __tablename__ = "payment_keys"
+    kind = Column(String, primary_key=True)
+    value = Column(String, primary_key=True)
+
+class RevenueDaily(Base):
+    """Completed takings per (matatu, Nairobi day, fleet, payment method).
+
+    Kept up to date by app/revenue.py as payments complete. The key columns
+    are the upsert target, so a missing matatu/fleet is stored as 0 and a
+    missing payment method as "".
+    """
+    __tablename__ = "revenue_daily"
+    __table_args__ = (Index("ix_revenue_daily_fleet_id_day", "fleet_id", "day"),)
+    matatu_id = Column(Integer, primary_key=True, autoincrement=False)
+    day = Column(Date, primary_key=True)
+    fleet_id = Column(Integer, primary_key=True, autoincrement=False)
+    payment_method = Column(String, primary_key=True)
+    amount = Column(Float, nullable=False, default=0.0)
+    payments = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,53 @@
+import base64
+from typing import Optional
+from fastapi import HTTPException, Query, Response
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(f"id:{last_id}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> int:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    kind, _, value = base64.urlsafe_b64decode(padded.encode()).decode().partition(":")
+    if kind != "id":
+        raise ValueError(cursor)
+    return int(value)
+
+class Page:
+    """List paging parameters.
+
+    Without `skip` the list is walked by primary key: pass the previous
+    response's X-Next-Cursor header as `after` to get the next page. `skip`
+    still works as an OFFSET fallback but does not return a cursor.
+    """
+
+    def __init__(self, after: Optional[str] = None, skip: int = Query(0, ge=0), limit: int = Query(100, ge=1)):
+        self.skip = skip
+        self.limit = limit
+        self.after_id = None
+        if after:
+            try:
+                self.after_id = decode_cursor(after)
+            except (ValueError, UnicodeDecodeError):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    @property
+    def keyset(self) -> bool:
+        return not self.skip
+
+def apply_page(query, id_column, skip: int = 0, limit: int = 100, after_id: int = None):
+    # Works for both Query and select()
+    if skip:
+        return query.offset(skip).limit(limit)
+    if after_id is not None:
+        query = query.filter(id_column > after_id)
+    return query.order_by(id_column).limit(limit)
+
+def next_cursor_headers(page: Page, rows, key=lambda row: row.id) -> dict:
+    if page.keyset and len(rows) >= page.limit:
+        return {NEXT_CURSOR_HEADER: encode_cursor(key(rows[-1]))}
+    return {}
+
+def set_next_cursor(response: Response, page: Page, rows, key=lambda row: row.id):
+    response.headers.update(next_cursor_headers(page, rows, key))
@@ -0,0 +1,203 @@
+import argparse
+import datetime
+import logging
+import os
+import threading
+from sqlalchemy import Integer, delete, func, select, text
+from sqlalchemy.orm import Session
+from . import models
+from .crud import IDEMPOTENCY_KEY, RECEIPT_KEY
+from .database import SessionLocal, engine
+from .config import settings
+
+logger = logging.getLogger("partitions")
+
+# On PostgreSQL, payments is range-partitioned by month on timestamp
+# (migration 0004). Partitions are created ahead of time here, and months
+# past the retention period are written to Parquet and dropped. Other
+# databases have a single payments table; archival deletes the month's rows.
+# Either way the month's idempotency keys and receipts leave payment_keys,
+# so a key can be reused once its payment has been archived.
+PAYMENTS_PARTITION_AHEAD = settings.payments_partition_ahead
+PAYMENTS_RETENTION_MONTHS = settings.payments_retention_months
+PAYMENTS_ARCHIVE_DIR = settings.payments_archive_dir
+PARTITION_CHECK_INTERVAL = 6 * 3600
+
+def month_start(day: datetime.date) -> datetime.date:
+    return datetime.date(day.year, day.month, 1)
+
+def add_months(month: datetime.date, months: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month: datetime.date) -> str:
+    return f"payments_{month:%Y_%m}"
+
+def is_partitioned(connection) -> bool:
+    if connection.dialect.name != "postgresql":
+        return False
+    return connection.execute(text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('payments')"
+    )).first() is not None
+
+def existing_partitions(connection) -> list:
+    return list(connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'payments'::regclass ORDER BY c.relname"
+    )).scalars())
+
+def ensure_partitions(connection, ahead: int = PAYMENTS_PARTITION_AHEAD, today: datetime.date = None) -> list:
+    """Create this month's partition and `ahead` more; returns the names created."""
+    if not is_partitioned(connection):
+        return []
+    existing = set(existing_partitions(connection))
+    month = month_start(today or datetime.datetime.utcnow().date())
+    created = []
+    for offset in range(ahead + 1):
+        start = add_months(month, offset)
+        name = partition_name(start)
+        if name not in existing:
+            connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF payments "
+                f"FOR VALUES FROM ('{start}') TO ('{add_months(start, 1)}')"
+            ))
+            created.append(name)
+    return created
+
+def _month_rows(db: Session, month: datetime.date):
+    query = (
+        select(*models.Payment.__table__.columns)
+        .where(models.Payment.timestamp >= month, models.Payment.timestamp < add_months(month, 1))
+        .order_by(models.Payment.timestamp)
+        .execution_options(stream_results=True, yield_per=10000)
+    )
+    return db.execute(query).mappings().partitions()
+
+def write_parquet(db: Session, month: datetime.date, directory: str) -> tuple:
+    """Write one month of payments to <directory>/payments_YYYY_MM.parquet; returns (path, rows)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, partition_name(month) + ".parquet")
+    partial = path + ".partial"
+    schema = pa.schema([
+        (column.key, pa.timestamp("us") if column.key == "timestamp" else
+         pa.float64() if column.key == "amount" else
+         pa.int64() if isinstance(column.type, Integer) else pa.string())
+        for column in models.Payment.__table__.columns
+    ])
+    rows = 0
+    with pq.ParquetWriter(partial, schema, compression="zstd") as writer:
+        for partition in _month_rows(db, month):
+            writer.write_table(pa.Table.from_pylist([dict(row) for row in partition], schema=schema))
+            rows += len(partition)
+    if pq.ParquetFile(partial).metadata.num_rows != rows:
+        raise RuntimeError(f"Archive of {partition_name(month)} is incomplete")
+    os.replace(partial, path)
+    return path, rows
+
+def archivable_months(db: Session, retention_months: int, today: datetime.date = None) -> list:
+    cutoff = add_months(month_start(today or datetime.datetime.utcnow().date()), -retention_months)
+    connection = db.connection()
+    if is_partitioned(connection):
+        months = [datetime.datetime.strptime(name, "payments_%Y_%m").date() for name in existing_partitions(connection)]
+        return [month for month in months if month < cutoff]
+    months = []
+    oldest = db.scalar(select(func.min(models.Payment.timestamp)))
+    while oldest is not None and oldest < datetime.datetime.combine(cutoff, datetime.time()):
+        month = month_start(oldest.date())
+        months.append(month)
+        oldest = db.scalar(select(func.min(models.Payment.timestamp)).where(models.Payment.timestamp >= add_months(month, 1)))
+    return months
+
+def prune_payment_keys(db: Session, month: datetime.date) -> int:
+    """Release the idempotency keys and receipt numbers claimed by one month's payments."""
+    in_month = (models.Payment.timestamp >= month, models.Payment.timestamp < add_months(month, 1))
+    pruned = 0
+    for kind, column in ((IDEMPOTENCY_KEY, models.Payment.idempotency_key), (RECEIPT_KEY, models.Payment.mpesa_receipt_number)):
+        pruned += db.execute(delete(models.PaymentKey).where(
+            models.PaymentKey.kind == kind,
+            models.PaymentKey.value.in_(select(column).where(*in_month, column.is_not(None))),
+        )).rowcount
+    return pruned
+
+def archive_month(db: Session, month: datetime.date, directory: str = PAYMENTS_ARCHIVE_DIR) -> tuple:
+    """Archive one month to Parquet, then drop its partition (or delete its rows) and its payment keys."""
+    path, rows = write_parquet(db, month, directory)
+    keys = prune_payment_keys(db, month)
+    connection = db.connection()
+    if is_partitioned(connection):
+        name = partition_name(month)
+        connection.execute(text(f"ALTER TABLE payments DETACH PARTITION {name}"))
+        connection.execute(text(f"DROP TABLE {name}"))
+    else:
+        db.execute(delete(models.Payment).where(
+            models.Payment.timestamp >= month, models.Payment.timestamp < add_months(month, 1)
+        ))
+    db.commit()
+    logger.info("Archived %d payments for %s to %s, releasing %d payment keys", rows, f"{month:%Y-%m}", path, keys)
+    return path, rows
+
+def archive_old(db: Session, retention_months: int = PAYMENTS_RETENTION_MONTHS, directory: str = PAYMENTS_ARCHIVE_DIR,
+                today: datetime.date = None) -> list:
+    return [archive_month(db, month, directory) for month in archivable_months(db, retention_months, today)]
+
+class PartitionMaintainer:
+    """Background thread that keeps future partitions in place while the app runs."""
+
+    def __init__(self, interval: float = PARTITION_CHECK_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def check(self):
+        try:
+            with engine.begin() as connection:
+                created = ensure_partitions(connection)
+            if created:
+                logger.info("Created payment partitions: %s", ", ".join(created))
+        except Exception:
+            logger.exception("Payment partition check failed")
+
+    def start(self):
+        if self._thread is not None or engine.dialect.name != "postgresql":
+            return
+        self._stop.clear()
+        self.check()
+        self._thread = threading.Thread(target=self._run, name="payment-partitions", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+partition_maintainer = PartitionMaintainer()
+
+def main():
+    parser = argparse.ArgumentParser(description="Payment partition maintenance")
+    parser.add_argument("command", choices=["ensure", "archive"])
+    parser.add_argument("--ahead", type=int, default=PAYMENTS_PARTITION_AHEAD)
+    parser.add_argument("--retention-months", type=int, default=PAYMENTS_RETENTION_MONTHS)
+    parser.add_argument("--dir", default=PAYMENTS_ARCHIVE_DIR)
+    args = parser.parse_args()
+    if args.command == "ensure":
+        with engine.begin() as connection:
+            print("Created:", ", ".join(ensure_partitions(connection, args.ahead)) or "nothing")
+        return
+    db = SessionLocal()
+    try:
+        for path, rows in archive_old(db, args.retention_months, args.dir):
+            print(f"{path}: {rows} payments")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from .config import settings
+
+# Raising BCRYPT_ROUNDS makes existing hashes "deprecated"; they are
+# rehashed with the new cost on the user's next successful login
+BCRYPT_ROUNDS = settings.bcrypt_rounds
+# Each server worker has its own pool, so by default they share the cores
+PASSWORD_WORKERS = settings.password_workers or max(1, (os.cpu_count() or 1) // settings.web_concurrency)
+PASSWORD_QUEUE_LIMIT = settings.password_queue_limit or PASSWORD_WORKERS * 8
+
+# Built on first use: importing passlib is a noticeable part of worker boot,
+# and the API process itself only hashes through the pool
+@functools.lru_cache(maxsize=None)
+def password_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+class PasswordQueueFull(Exception):
+    pass
+
+# Run inside the worker processes
+def _hash(password):
+    return password_context().hash(password)
+
+def _verify_and_update(password, hashed_password):
+    return password_context().verify_and_update(password, hashed_password)
+
+def _pool_context():
+    return multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+class PasswordHasher:
+    """bcrypt on a process pool sized to the cores, off the request threads.
+
+    At most `queue_limit` hashes may be in flight; beyond that callers get
+    PasswordQueueFull instead of piling up behind a login surge.
+    """
+
+    def __init__(self, workers: int = PASSWORD_WORKERS, queue_limit: int = PASSWORD_QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            if self._in_flight >= self.queue_limit:
+                raise PasswordQueueFull()
+            self._in_flight += 1
+            if self._executor is None:
+                # Not fork: by now the app's background threads are running, and a
+                # forked child can inherit one of their locks held forever
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=_pool_context())
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return asyncio.wrap_future(future)
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(_hash, password)
+
+    async def verify(self, password: str, hashed_password: str):
+        """Returns (valid, new_hash); new_hash is set when the stored hash needs an upgrade."""
+        return await self._submit(_verify_and_update, password, hashed_password)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+hasher = PasswordHasher()
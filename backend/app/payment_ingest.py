@@ -0,0 +1,202 @@
+import argparse
+import datetime
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from sqlalchemy.exc import DBAPIError, OperationalError, TimeoutError as PoolTimeoutError
+from . import crud
+from .database import SessionLocal
+from .config import settings
+
+logger = logging.getLogger("payment_ingest")
+
+PAYMENT_INGEST_QUEUE_SIZE = settings.payment_ingest_queue_size
+PAYMENT_INGEST_FLUSH_SIZE = settings.payment_ingest_flush_size
+PAYMENT_INGEST_FLUSH_INTERVAL = settings.payment_ingest_flush_interval
+# Attempts per batch while the database is unreachable. Any other error is
+# the data's fault: the batch is split in halves until the rows that fail
+# are isolated, and the rest is stored.
+PAYMENT_INGEST_MAX_RETRIES = 3
+# Rows that still fail are appended here, one payment per line, so an
+# acknowledged payment is never lost; replaying is safe to repeat because
+# rows are inserted by idempotency key
+PAYMENT_DEAD_LETTER_DIR = settings.payment_dead_letter_dir
+
+class IngestQueueFull(Exception):
+    pass
+
+class PaymentIngestor:
+    """Bounded in-process queue of payments, written by one background thread.
+
+    Payments are acknowledged as soon as they are queued. The writer drains
+    up to `flush_size` rows (or whatever arrived within `flush_interval`)
+    into a single INSERT + commit. When the queue is full `submit` raises
+    IngestQueueFull so the API can push back on clients.
+    """
+
+    def __init__(self, session_factory, max_queue: int = PAYMENT_INGEST_QUEUE_SIZE,
+                 flush_size: int = PAYMENT_INGEST_FLUSH_SIZE, flush_interval: float = PAYMENT_INGEST_FLUSH_INTERVAL,
+                 dead_letter_dir: str = PAYMENT_DEAD_LETTER_DIR):
+        self.session_factory = session_factory
+        self.dead_letter_dir = dead_letter_dir
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self.written = 0
+        self.failed = 0
+        self.dead_lettered = 0
+        self.batches = 0
+
+    def submit(self, payment: dict, idempotency_key: str):
+        row = dict(payment, idempotency_key=idempotency_key)
+        row.setdefault("timestamp", datetime.datetime.utcnow())
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            raise IngestQueueFull()
+
+    def start(self):
+        if self._thread is not None:
+            if not self._stop.is_set():
+                return
+            # Left behind by a stop() that timed out; let it finish draining first
+            self._thread.join()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="payment-ingest", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        # Drains whatever is still queued before returning
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning("Payment writer still draining %d queued payments after %.0f s", self._queue.qsize(), timeout)
+            return
+        self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "capacity": self._queue.maxsize,
+            "written": self.written,
+            "failed": self.failed,
+            "deadLettered": self.dead_lettered,
+            "batches": self.batches,
+        }
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.flush_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch):
+        failed = self._write(batch)
+        if not failed:
+            return
+        self.failed += len(failed)
+        try:
+            path = write_dead_letter(self.dead_letter_dir, failed)
+        except OSError:
+            # Last resort: the rows themselves, so they can be re-entered by hand
+            logger.exception("Could not dead-letter %d payments: %s", len(failed), [_dumps(row) for row in failed])
+            return
+        self.dead_lettered += len(failed)
+        logger.error("Dead-lettered %d of %d payments to %s", len(failed), len(batch), path)
+
+    def _write(self, batch) -> list:
+        """Store `batch`, returning the rows that could not be stored."""
+        for attempt in range(1, PAYMENT_INGEST_MAX_RETRIES + 1):
+            db = self.session_factory()
+            try:
+                self.written += crud.insert_payments_batch(db, batch)
+                self.batches += 1
+                return []
+            except Exception as exc:
+                db.rollback()
+                if not _transient(exc):
+                    logger.warning("Payment batch of %d rejected: %s", len(batch), exc)
+                    break
+                logger.exception("Payment batch of %d failed (attempt %d)", len(batch), attempt)
+                time.sleep(0.1 * attempt)
+            finally:
+                db.close()
+        else:
+            return batch
+        if len(batch) == 1:
+            return batch
+        middle = len(batch) // 2
+        return self._write(batch[:middle]) + self._write(batch[middle:])
+
+def _transient(exc: Exception) -> bool:
+    """Whether retrying the same rows could succeed: the database, not the data, was the problem."""
+    if isinstance(exc, (OperationalError, PoolTimeoutError)):
+        return True
+    return isinstance(exc, DBAPIError) and exc.connection_invalidated
+
+def _dumps(row: dict) -> str:
+    return json.dumps(row, default=lambda value: value.isoformat())
+
+def write_dead_letter(directory: str, rows) -> str:
+    """Append rows to <directory>/payments-YYYYMMDD.ndjson (UTC day) and flush them to disk."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"payments-{datetime.datetime.utcnow():%Y%m%d}.ndjson")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("".join(_dumps(row) + "\n" for row in rows))
+        f.flush()
+        os.fsync(f.fileno())
+    return path
+
+def replay(db, paths, batch_size: int = PAYMENT_INGEST_FLUSH_SIZE) -> int:
+    """Insert dead-lettered payments; each file is renamed to *.replayed once all its rows are stored."""
+    written = 0
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        for row in rows:
+            row["timestamp"] = datetime.datetime.fromisoformat(row["timestamp"])
+        for start in range(0, len(rows), batch_size):
+            written += crud.insert_payments_batch(db, rows[start:start + batch_size])
+        os.replace(path, path + ".replayed")
+    return written
+
+ingestor = PaymentIngestor(SessionLocal)
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched payment ingestion maintenance")
+    parser.add_argument("command", choices=["replay"])
+    parser.add_argument("paths", nargs="*", help=f"dead-letter files (default: all in {PAYMENT_DEAD_LETTER_DIR})")
+    args = parser.parse_args()
+    paths = args.paths or sorted(glob.glob(os.path.join(PAYMENT_DEAD_LETTER_DIR, "payments-*.ndjson")))
+    db = SessionLocal()
+    try:
+        print(f"Stored {replay(db, paths)} payments from {len(paths)} files (already stored ones are skipped)")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
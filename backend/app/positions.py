@@ -0,0 +1,344 @@
+import datetime
+import heapq
+import logging
+import math
+import os
+import queue
+import threading
+import time
+import numpy as np
+from . import shared_state
+from .serializers import dumps
+from .config import settings
+
+logger = logging.getLogger("positions")
+
+# Live vehicle positions. The latest fix per matatu lives in a uniform
+# lat/lon grid (POSITION_CELL_DEGREES, about 1.1 km at the default) and
+# expires after POSITION_TTL seconds without a new fix. Every accepted fix
+# is also appended to a daily NDJSON file by a background writer; nothing
+# goes through the database. With SHARED_STATE_DIR set the latest fixes live
+# in one memory-mapped table that every worker reads and writes instead.
+POSITION_TTL = settings.position_ttl
+POSITION_CELL_DEGREES = settings.position_cell_degrees
+POSITION_LOG_DIR = settings.position_log_dir
+POSITION_LOG_QUEUE_SIZE = settings.position_log_queue_size
+# Rows of the shared table; matatu ids probe a few rows from id % slots
+POSITION_SHARED_SLOTS = 65536
+POSITION_SHARED_PROBES = 16
+EARTH_RADIUS_M = 6371000.0
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+def distance_m(lat1, lon1, lat2, lon2) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+class PositionIndex:
+    """Latest position per matatu, bucketed by grid cell for nearest-vehicle queries."""
+
+    def __init__(self, ttl: float = POSITION_TTL, cell_degrees: float = POSITION_CELL_DEGREES, clock=time.time):
+        self.ttl = ttl
+        self.cell_degrees = cell_degrees
+        self.clock = clock
+        self._lock = threading.Lock()
+        # matatu_id -> (lat, lon, heading, speed, recorded_at epoch seconds, cell)
+        self._latest = {}
+        self._cells = {}
+        self._swept_at = clock()
+        self.updates = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self._latest)
+
+    def cell(self, lat: float, lon: float) -> tuple:
+        return int(math.floor(lat / self.cell_degrees)), int(math.floor(lon / self.cell_degrees))
+
+    def update_many(self, fixes):
+        """Apply (matatu_id, lat, lon, heading, speed, recorded_at) fixes; older than the stored fix are ignored.
+
+        A fix dated in the future counts as recorded now, so a device clock
+        running ahead cannot pin its matatu to that position.
+        """
+        now = self.clock()
+        with self._lock:
+            for matatu_id, lat, lon, heading, speed, recorded_at in fixes:
+                recorded_at = min(recorded_at, now)
+                previous = self._latest.get(matatu_id)
+                if previous is not None and previous[4] > recorded_at:
+                    continue
+                cell = self.cell(lat, lon)
+                if previous is not None and previous[5] != cell:
+                    self._discard_from_cell(matatu_id, previous[5])
+                self._latest[matatu_id] = (lat, lon, heading, speed, recorded_at, cell)
+                self._cells.setdefault(cell, set()).add(matatu_id)
+                self.updates += 1
+            if now - self._swept_at >= self.ttl:
+                self._sweep(now)
+
+    def _discard_from_cell(self, matatu_id, cell):
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(matatu_id)
+            if not members:
+                del self._cells[cell]
+
+    def _sweep(self, now):
+        cutoff = now - self.ttl
+        for matatu_id in [m for m, fix in self._latest.items() if fix[4] < cutoff]:
+            self._discard_from_cell(matatu_id, self._latest.pop(matatu_id)[5])
+            self.expired += 1
+        self._swept_at = now
+
+    def get(self, matatu_id: int):
+        fix = self._latest.get(matatu_id)
+        if fix is None or fix[4] < self.clock() - self.ttl:
+            return None
+        return self._position(matatu_id, fix, None)
+
+    def nearest(self, lat: float, lon: float, limit: int = 10, radius_m: float = 5000, accept=None) -> list:
+        """Up to `limit` live positions within `radius_m`, closest first.
+
+        Searches rings of cells outwards and stops once no unvisited cell can
+        hold anything closer than what was found. `accept(matatu_id)` filters
+        candidates, e.g. to one route.
+        """
+        cutoff = self.clock() - self.ttl
+        center_row, center_col = self.cell(lat, lon)
+        # Smallest extent of a cell in metres, so ring k is at least (k - 1) cells away
+        cell_m = self.cell_degrees * METERS_PER_DEGREE * max(math.cos(math.radians(min(abs(lat) + self.cell_degrees, 89.0))), 0.01)
+        max_ring = int(radius_m / cell_m) + 1
+        found = []
+        with self._lock:
+            for ring in range(max_ring + 1):
+                if len(found) >= limit and -found[0][0] <= (ring - 1) * cell_m:
+                    break
+                for cell in self._ring(center_row, center_col, ring):
+                    for matatu_id in self._cells.get(cell, ()):
+                        fix = self._latest[matatu_id]
+                        if fix[4] < cutoff or (accept is not None and not accept(matatu_id)):
+                            continue
+                        distance = distance_m(lat, lon, fix[0], fix[1])
+                        if distance > radius_m:
+                            continue
+                        entry = (-distance, matatu_id, fix)
+                        if len(found) < limit:
+                            heapq.heappush(found, entry)
+                        elif entry > found[0]:
+                            heapq.heapreplace(found, entry)
+        return [self._position(matatu_id, fix, -negative) for negative, matatu_id, fix in sorted(found, reverse=True)]
+
+    @staticmethod
+    def _ring(row, col, ring):
+        if ring == 0:
+            yield row, col
+            return
+        for offset in range(-ring, ring + 1):
+            yield row - ring, col + offset
+            yield row + ring, col + offset
+        for offset in range(-ring + 1, ring):
+            yield row + offset, col - ring
+            yield row + offset, col + ring
+
+    def _position(self, matatu_id, fix, distance):
+        lat, lon, heading, speed, recorded_at, _ = fix
+        return {
+            "matatuId": matatu_id,
+            "lat": lat,
+            "lon": lon,
+            "heading": heading,
+            "speed": speed,
+            "recordedAt": datetime.datetime.fromtimestamp(recorded_at, datetime.timezone.utc),
+            "distanceM": round(distance, 1) if distance is not None else None,
+        }
+
+    def stats(self) -> dict:
+        return {"vehicles": len(self._latest), "cells": len(self._cells), "updates": self.updates, "expired": self.expired}
+
+class SharedPositionIndex:
+    """PositionIndex in the shared-state directory, so a fix sent to any worker is seen by all.
+
+    One row per matatu: id (0 for a never used row), lat, lon, heading and
+    speed (NaN when unknown) and recorded_at. A matatu takes the first row
+    it finds, probing from its id, that is its own, empty or expired. Rows
+    are read and written under a file lock; nearest() copies the live rows
+    out and measures them in one vectorized pass.
+    """
+
+    def __init__(self, state: shared_state.Generations, ttl: float = POSITION_TTL, clock=time.time):
+        self.state = state
+        self.ttl = ttl
+        self.clock = clock
+        mapped = state.map("positions.table", POSITION_SHARED_SLOTS * 6 * 8)
+        self._rows = np.frombuffer(mapped, dtype=np.float64).reshape(POSITION_SHARED_SLOTS, 6)
+        self.updates = 0
+
+    def __len__(self):
+        with self.state.lock("positions"):
+            return int(self._live().sum())
+
+    def _live(self):
+        return (self._rows[:, 0] != 0) & (self._rows[:, 5] >= self.clock() - self.ttl)
+
+    def _find(self, matatu_id, cutoff):
+        """Row holding `matatu_id`, else the first reusable row on its probe path (the oldest when none is)."""
+        reusable = None
+        for probe in range(POSITION_SHARED_PROBES):
+            row = self._rows[(matatu_id + probe) % POSITION_SHARED_SLOTS]
+            if row[0] == matatu_id:
+                return row
+            if reusable is None and (row[0] == 0 or row[5] < cutoff):
+                reusable = row
+            if row[0] == 0:
+                break
+        if reusable is None:
+            start = matatu_id % POSITION_SHARED_SLOTS
+            rows = [(start + probe) % POSITION_SHARED_SLOTS for probe in range(POSITION_SHARED_PROBES)]
+            reusable = self._rows[min(rows, key=lambda i: self._rows[i, 5])]
+        reusable[:] = (matatu_id, 0, 0, np.nan, np.nan, -np.inf)
+        return reusable
+
+    def update_many(self, fixes):
+        """Same contract as PositionIndex.update_many."""
+        now = self.clock()
+        cutoff = now - self.ttl
+        with self.state.lock("positions"):
+            for matatu_id, lat, lon, heading, speed, recorded_at in fixes:
+                row = self._find(matatu_id, cutoff)
+                recorded_at = min(recorded_at, now)
+                if row[5] > recorded_at:
+                    continue
+                row[1:] = (lat, lon, np.nan if heading is None else heading, np.nan if speed is None else speed, recorded_at)
+                self.updates += 1
+
+    def get(self, matatu_id: int):
+        cutoff = self.clock() - self.ttl
+        with self.state.lock("positions"):
+            for probe in range(POSITION_SHARED_PROBES):
+                row = self._rows[(matatu_id + probe) % POSITION_SHARED_SLOTS]
+                if row[0] == matatu_id:
+                    fix = row.copy()
+                    break
+                if row[0] == 0:
+                    return None
+            else:
+                return None
+        return self._position(fix, None) if fix[5] >= cutoff else None
+
+    def nearest(self, lat: float, lon: float, limit: int = 10, radius_m: float = 5000, accept=None) -> list:
+        """Same contract as PositionIndex.nearest."""
+        with self.state.lock("positions"):
+            rows = self._rows[self._live()]
+        lat1, lon1 = math.radians(lat), math.radians(lon)
+        lat2, lon2 = np.radians(rows[:, 1]), np.radians(rows[:, 2])
+        a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        distances = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        within = np.flatnonzero(distances <= radius_m)
+        found = []
+        for i in within[np.lexsort((rows[within, 0], distances[within]))]:
+            if accept is not None and not accept(int(rows[i, 0])):
+                continue
+            found.append(self._position(rows[i], float(distances[i])))
+            if len(found) >= limit:
+                break
+        return found
+
+    @staticmethod
+    def _position(fix, distance):
+        matatu_id, lat, lon, heading, speed, recorded_at = fix.tolist()
+        return {
+            "matatuId": int(matatu_id),
+            "lat": lat,
+            "lon": lon,
+            "heading": None if math.isnan(heading) else heading,
+            "speed": None if math.isnan(speed) else speed,
+            "recordedAt": datetime.datetime.fromtimestamp(recorded_at, datetime.timezone.utc),
+            "distanceM": round(distance, 1) if distance is not None else None,
+        }
+
+    def stats(self) -> dict:
+        return {"vehicles": len(self), "slots": POSITION_SHARED_SLOTS, "updates": self.updates}
+
+class PositionLog:
+    """Appends fixes to <directory>/positions-YYYYMMDD.ndjson (UTC days) from one background thread.
+
+    Requests only enqueue; when the writer falls behind, batches are dropped
+    and counted rather than slowing down ingestion.
+    """
+
+    def __init__(self, directory: str = POSITION_LOG_DIR, max_queue: int = POSITION_LOG_QUEUE_SIZE):
+        self.directory = directory
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._file = None
+        self._day = None
+        self.written = 0
+        self.dropped = 0
+
+    def submit(self, fixes, received_at: float):
+        try:
+            self._queue.put_nowait((fixes, received_at))
+        except queue.Full:
+            self.dropped += len(fixes)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="position-log", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stats(self) -> dict:
+        return {"queued": self._queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception:
+                logger.exception("Writing %d position batches failed", len(batch))
+
+    def _write(self, batch):
+        for fixes, received_at in batch:
+            day = time.strftime("%Y%m%d", time.gmtime(received_at))
+            if day != self._day:
+                if self._file is not None:
+                    self._file.close()
+                self._file = open(os.path.join(self.directory, f"positions-{day}.ndjson"), "ab")
+                self._day = day
+            self._file.write(b"".join(dumps({
+                "matatuId": matatu_id,
+                "lat": lat,
+                "lon": lon,
+                "heading": heading,
+                "speed": speed,
+                "recordedAt": recorded_at,
+                "receivedAt": received_at,
+            }) + b"\n" for matatu_id, lat, lon, heading, speed, recorded_at in fixes))
+            self.written += len(fixes)
+        self._file.flush()
+
+position_index = SharedPositionIndex(shared_state.generations) if shared_state.generations else PositionIndex()
+position_log = PositionLog()
@@ -0,0 +1,71 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+from .config import settings
+from .shared_state import generations
+
+AUTH_CACHE_SIZE = settings.auth_cache_size
+AUTH_CACHE_TTL = settings.auth_cache_ttl
+
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated user as seen by request handlers (not an ORM row)."""
+    id: int
+    email: Optional[str] = None
+    name: Optional[str] = None
+    phone: Optional[str] = None
+    role: Optional[str] = "user"
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(id=user.id, email=user.email, name=user.name, phone=user.phone, role=user.role)
+
+class PrincipalCache:
+    """Bounded LRU of principals by user id with a time-to-live per entry."""
+
+    def __init__(self, max_size: int = AUTH_CACHE_SIZE, ttl: float = AUTH_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # In multi-worker mode an invalidation anywhere clears every worker's cache
+        self._generation = generations.get("principals") if generations is not None else None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> Optional[Principal]:
+        if generations is not None and generations.get("principals") != self._generation:
+            with self._lock:
+                self._entries.clear()
+                self._generation = generations.get("principals")
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, principal: Principal):
+        with self._lock:
+            self._entries[principal.id] = (principal, time.monotonic() + self.ttl)
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+        if generations is not None:
+            generations.bump("principals")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+principal_cache = PrincipalCache()
@@ -0,0 +1,100 @@
+import collections
+import os
+import sys
+import threading
+import time
+from urllib.parse import parse_qs
+from .config import settings
+
+# On-demand sampling profiler. With PROFILING_ENABLED=1 a request sent with
+# an "X-Profile: 1" header (or ?profile=1) is served as usual but answered
+# with its profile instead: collapsed stacks ("frame;frame;frame count",
+# ready for flamegraph.pl or speedscope). The event loop is sampled while it
+# runs this request, and threadpool workers while they run code under app/,
+# so sync handlers are caught too; profile on a quiet worker, since other
+# requests' threadpool work lands in the same samples.
+PROFILING_ENABLED = settings.profiling_enabled
+PROFILE_INTERVAL = settings.profile_interval
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+THREADPOOL_MARKER = f"{os.sep}anyio{os.sep}"
+THREADING_DIR = threading.__file__
+
+def profile_requested(scope) -> bool:
+    for name, value in scope.get("headers", ()):
+        if name == b"x-profile":
+            return value in (b"1", b"true")
+    query = scope.get("query_string", b"")
+    return b"profile=" in query and parse_qs(query.decode("latin-1")).get("profile", [""])[0] in ("1", "true")
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+class Sampler:
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self._busy = threading.Lock()
+
+    def _sample(self, stacks: collections.Counter, stop: threading.Event, loop_thread: int):
+        own = threading.get_ident()
+        while not stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack, in_request, in_app, in_pool, callee = [], False, False, False, None
+                while frame is not None:
+                    code = frame.f_code
+                    # Not the sampler being joined once the request is done
+                    if code is Sampler.profile.__code__ and callee is not None:
+                        in_request = not callee.co_filename.startswith(THREADING_DIR)
+                    in_app = in_app or code.co_filename.startswith(APP_DIR)
+                    in_pool = in_pool or THREADPOOL_MARKER in code.co_filename
+                    stack.append(_frame_label(frame))
+                    callee, frame = code, frame.f_back
+                if in_request if thread_id == loop_thread else in_app and in_pool:
+                    stacks[";".join(reversed(stack))] += 1
+
+    async def profile(self, app, scope, receive, send):
+        """Run the request under the sampler and send its collapsed stacks as the response."""
+        if not self._busy.acquire(blocking=False):
+            return await app(scope, receive, send)
+        stacks = collections.Counter()
+        status = [500]
+
+        async def discard(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=self._sample, args=(stacks, stop, threading.get_ident()), name="profiler", daemon=True
+        )
+        # The sampler only runs when it gets the GIL; by default a busy thread
+        # keeps it for 5 ms, which would leave a short request with no samples
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch_interval, self.interval / 2))
+        start = time.perf_counter()
+        thread.start()
+        try:
+            await app(scope, receive, discard)
+        finally:
+            stop.set()
+            thread.join()
+            sys.setswitchinterval(switch_interval)
+            self._busy.release()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        body = "".join(f"{stack} {count}\n" for stack, count in stacks.most_common()).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"content-length", str(len(body)).encode()),
+                (b"x-profile-samples", str(sum(stacks.values())).encode()),
+                (b"x-profile-duration-ms", f"{elapsed_ms:.1f}".encode()),
+                (b"x-profile-status", str(status[0]).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+sampler = Sampler()
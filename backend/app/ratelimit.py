@@ -0,0 +1,162 @@
+import hashlib
+import threading
+import time
+from collections import deque
+import numpy as np
+from . import shared_state
+from .config import settings
+
+LOGIN_MAX_FAILURES_PER_ACCOUNT = settings.login_max_failures_per_account
+LOGIN_MAX_ATTEMPTS_PER_IP = settings.login_max_attempts_per_ip
+LOGIN_WINDOW_SECONDS = settings.login_window_seconds
+# Shared limiters (SHARED_STATE_DIR set): keys tracked per limiter, and the
+# sub-windows a window is counted in
+SHARED_LIMITER_SLOTS = 16384
+SHARED_LIMITER_BUCKETS = 10
+SHARED_LIMITER_PROBES = 16
+
+class SlidingWindowLimiter:
+    """Counts events per key over the last `window` seconds."""
+
+    def __init__(self, limit: int, window: float, max_keys: int = 100000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, events, now):
+        while events and events[0] <= now - self.window:
+            events.popleft()
+
+    def retry_after(self, key) -> float:
+        """Seconds until `key` may try again, 0 when it is under the limit."""
+        now = time.monotonic()
+        with self._lock:
+            events = self._events.get(key)
+            if not events:
+                return 0
+            self._prune(events, now)
+            if len(events) < self.limit:
+                return 0
+            return events[0] + self.window - now
+
+    def hit(self, key):
+        now = time.monotonic()
+        with self._lock:
+            if key not in self._events and len(self._events) >= self.max_keys:
+                # Drop keys whose windows have fully expired
+                for stale in [k for k, v in self._events.items() if not v or v[-1] <= now - self.window]:
+                    del self._events[stale]
+            events = self._events.setdefault(key, deque())
+            self._prune(events, now)
+            events.append(now)
+
+    def reset(self, key):
+        with self._lock:
+            self._events.pop(key, None)
+
+class SharedSlidingWindowLimiter:
+    """SlidingWindowLimiter kept in the shared-state directory, so the limit holds across workers.
+
+    Each key owns a row of a memory-mapped table: a 64-bit fingerprint and
+    a ring of (sub-window, count) pairs, so events age out a tenth of the
+    window at a time. Keys probe a few rows from their hash; a row whose
+    counts have all expired is reused, and with none free the key shares
+    its first row, which can only make the limit stricter.
+    """
+
+    def __init__(self, state: shared_state.Generations, name: str, limit: int, window: float, clock=time.monotonic):
+        self.state = state
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self.clock = clock
+        self.width = window / SHARED_LIMITER_BUCKETS
+        columns = 1 + 2 * SHARED_LIMITER_BUCKETS
+        mapped = state.map(f"{name}.counters", SHARED_LIMITER_SLOTS * columns * 8)
+        self._rows = np.frombuffer(mapped, dtype=np.int64).reshape(SHARED_LIMITER_SLOTS, columns)
+
+    @staticmethod
+    def _fingerprint(key) -> int:
+        # Never 0, which marks an empty row
+        return int.from_bytes(hashlib.blake2b(str(key).encode(), digest_size=8).digest(), "little", signed=True) or 1
+
+    def _find(self, key, now_bucket: int, create: bool):
+        fingerprint = self._fingerprint(key)
+        start = fingerprint % SHARED_LIMITER_SLOTS
+        free = None
+        for probe in range(SHARED_LIMITER_PROBES):
+            row = self._rows[(start + probe) % SHARED_LIMITER_SLOTS]
+            if row[0] == fingerprint:
+                return row
+            if free is None and (row[0] == 0 or row[1::2].max() <= now_bucket - SHARED_LIMITER_BUCKETS):
+                free = row
+        if not create:
+            return None
+        row = free if free is not None else self._rows[start]
+        if row[0] != fingerprint:
+            row[:] = 0
+            row[0] = fingerprint
+        return row
+
+    def _live(self, row, now_bucket: int) -> list:
+        """(sub-window, count) pairs still inside the window, oldest first."""
+        pairs = row[1:].reshape(-1, 2)
+        return sorted((int(b), int(c)) for b, c in pairs if c and b > now_bucket - SHARED_LIMITER_BUCKETS)
+
+    def retry_after(self, key) -> float:
+        now = self.clock()
+        now_bucket = int(now // self.width)
+        with self.state.lock(self.name):
+            row = self._find(key, now_bucket, create=False)
+            live = self._live(row, now_bucket) if row is not None else []
+        total = sum(count for _, count in live)
+        if total < self.limit:
+            return 0
+        # Under the limit again once enough of the oldest sub-windows have aged out
+        for bucket, count in live:
+            total -= count
+            if total < self.limit:
+                return max((bucket + SHARED_LIMITER_BUCKETS) * self.width - now, 0)
+
+    def hit(self, key):
+        now_bucket = int(self.clock() // self.width)
+        with self.state.lock(self.name):
+            row = self._find(key, now_bucket, create=True)
+            position = 1 + 2 * (now_bucket % SHARED_LIMITER_BUCKETS)
+            if row[position] != now_bucket:
+                row[position], row[position + 1] = now_bucket, 0
+            row[position + 1] += 1
+
+    def reset(self, key):
+        with self.state.lock(self.name):
+            row = self._find(key, int(self.clock() // self.width), create=False)
+            if row is not None:
+                row[:] = 0
+
+def _limiter(name: str, limit: int, window: float):
+    if shared_state.generations is not None:
+        return SharedSlidingWindowLimiter(shared_state.generations, name, limit, window)
+    return SlidingWindowLimiter(limit, window)
+
+class LoginThrottle:
+    # Failed logins per account, and every attempt per client IP; shared by
+    # all workers when SHARED_STATE_DIR is set
+    def __init__(self):
+        self.accounts = _limiter("login-accounts", LOGIN_MAX_FAILURES_PER_ACCOUNT, LOGIN_WINDOW_SECONDS)
+        self.ips = _limiter("login-ips", LOGIN_MAX_ATTEMPTS_PER_IP, LOGIN_WINDOW_SECONDS)
+
+    def retry_after(self, account: str, ip: str) -> float:
+        return max(self.accounts.retry_after(account.lower()), self.ips.retry_after(ip))
+
+    def attempt(self, ip: str):
+        self.ips.hit(ip)
+
+    def failed(self, account: str):
+        self.accounts.hit(account.lower())
+
+    def succeeded(self, account: str):
+        self.accounts.reset(account.lower())
+
+login_throttle = LoginThrottle()
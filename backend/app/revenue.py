@@ -0,0 +1,164 @@
+import argparse
+import datetime
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+from . import models
+from .database import SessionLocal, dialect_insert
+from .fare_engine import EAT
+
+# Daily takings rollup. Completed payments are added to revenue_daily in the
+# same transaction that inserts or settles them, so dashboards read a few
+# rollup rows instead of scanning payments.
+
+NO_ID = 0
+NO_METHOD = ""
+
+# What a payment contributes to the rollup; also RETURNING'd by the M-Pesa settle UPDATE
+PAYMENT_COLUMNS = (
+    models.Payment.amount,
+    models.Payment.matatu_id,
+    models.Payment.fleet_id,
+    models.Payment.payment_method,
+    models.Payment.timestamp,
+    models.Payment.status,
+)
+
+KEY_COLUMNS = ("matatu_id", "day", "fleet_id", "payment_method")
+UPSERT_CHUNK = 1000
+
+def revenue_day(timestamp: datetime.datetime = None) -> datetime.date:
+    # Payment timestamps are naive UTC; takings are counted per Nairobi day
+    timestamp = timestamp or datetime.datetime.utcnow()
+    return timestamp.replace(tzinfo=datetime.timezone.utc).astimezone(EAT).date()
+
+def day_start_utc(day: datetime.date) -> datetime.datetime:
+    return datetime.datetime.combine(day, datetime.time(), EAT).astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+def accumulate(payments, totals: dict = None) -> dict:
+    """Sum completed payments (mappings) into {rollup key: [amount, count]}."""
+    totals = {} if totals is None else totals
+    for payment in payments:
+        if payment.get("status") != "completed":
+            continue
+        key = (
+            payment.get("matatu_id") or NO_ID,
+            revenue_day(payment.get("timestamp")),
+            payment.get("fleet_id") or NO_ID,
+            payment.get("payment_method") or NO_METHOD,
+        )
+        entry = totals.setdefault(key, [0.0, 0])
+        entry[0] += payment["amount"] or 0.0
+        entry[1] += 1
+    return totals
+
+def _rows(totals: dict):
+    # Sorted so concurrent upserts lock rollup rows in the same order
+    return [dict(zip(KEY_COLUMNS, key), amount=amount, payments=count) for key, (amount, count) in sorted(totals.items())]
+
+def upsert_statement(bind, rows):
+    """INSERT .. ON CONFLICT DO UPDATE adding the rows' totals; None if the dialect has no upsert."""
+    insert_for_dialect = dialect_insert(bind)
+    if insert_for_dialect is None:
+        return None
+    table = models.RevenueDaily
+    statement = insert_for_dialect(table).values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=list(KEY_COLUMNS),
+        set_={
+            "amount": table.amount + statement.excluded.amount,
+            "payments": table.payments + statement.excluded.payments,
+        },
+    )
+
+def _add(db: Session, row: dict):
+    existing = db.get(models.RevenueDaily, tuple(row[column] for column in KEY_COLUMNS))
+    if existing is None:
+        db.add(models.RevenueDaily(**row))
+    else:
+        existing.amount += row["amount"]
+        existing.payments += row["payments"]
+
+def _write(db: Session, totals: dict):
+    rows = _rows(totals)
+    for offset in range(0, len(rows), UPSERT_CHUNK):
+        chunk = rows[offset:offset + UPSERT_CHUNK]
+        statement = upsert_statement(db.get_bind(), chunk)
+        if statement is not None:
+            db.execute(statement)
+        else:
+            for row in chunk:
+                _add(db, row)
+
+def record(db: Session, payments):
+    """Add completed payments to the rollup. The caller commits."""
+    totals = accumulate(payments)
+    if totals:
+        _write(db, totals)
+
+async def record_async(db, payments):
+    totals = accumulate(payments)
+    if totals:
+        await db.run_sync(_write, totals)
+
+def payment_values(payment: models.Payment) -> dict:
+    return {column.key: getattr(payment, column.key) for column in PAYMENT_COLUMNS}
+
+def daily_query(start: datetime.date, end: datetime.date, matatu_id: int = None, fleet_id: int = None,
+                by_matatu: bool = False):
+    """Takings per day and payment method (and matatu) within [start, end]."""
+    table = models.RevenueDaily
+    groups = [table.day, table.payment_method] + ([table.matatu_id] if by_matatu else [])
+    query = select(*groups, func.sum(table.amount), func.sum(table.payments)).where(table.day.between(start, end))
+    if matatu_id is not None:
+        query = query.where(table.matatu_id == matatu_id)
+    if fleet_id is not None:
+        query = query.where(table.fleet_id == fleet_id)
+    return query.group_by(*groups).order_by(*groups)
+
+def revenue_dict(row) -> dict:
+    day, payment_method, *rest = row
+    *matatu, amount, payments = rest
+    result = {"date": day.isoformat(), "paymentMethod": payment_method or None}
+    if matatu:
+        result["matatuId"] = matatu[0] or None
+    result["amount"] = amount
+    result["payments"] = payments
+    return result
+
+def backfill(db: Session, start: datetime.date, end: datetime.date, batch_size: int = 5000) -> int:
+    """Rebuild the rollup for [start, end] from payments; returns the payments counted.
+
+    Run it off-peak: payments completing while it runs may be counted twice
+    or not at all for the days being rebuilt.
+    """
+    db.execute(delete(models.RevenueDaily).where(models.RevenueDaily.day.between(start, end)))
+    query = (
+        select(*PAYMENT_COLUMNS)
+        .where(models.Payment.status == "completed")
+        .where(models.Payment.timestamp >= day_start_utc(start))
+        .where(models.Payment.timestamp < day_start_utc(end + datetime.timedelta(days=1)))
+        .execution_options(stream_results=True, yield_per=batch_size)
+    )
+    totals, counted = {}, 0
+    for partition in db.execute(query).mappings().partitions():
+        accumulate(partition, totals)
+        counted += len(partition)
+    _write(db, totals)
+    db.commit()
+    return counted
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the daily revenue rollup from payments")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--start", type=datetime.date.fromisoformat, required=True)
+    parser.add_argument("--end", type=datetime.date.fromisoformat, default=revenue_day())
+    args = parser.parse_args()
+    db = SessionLocal()
+    try:
+        counted = backfill(db, args.start, args.end)
+    finally:
+        db.close()
+    print(f"Rebuilt revenue for {args.start}..{args.end} from {counted} payments")
+
+if __name__ == "__main__":
+    main()
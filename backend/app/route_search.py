@@ -0,0 +1,292 @@
+import argparse
+import bisect
+import collections
+import logging
+import threading
+import time
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from . import models
+from .database import SessionLocal, open_read_session
+from .config import settings
+from .shared_state import generations
+
+# In-memory origin-destination search: stop name -> stops (prefix and
+# trigram matching) -> routes through them -> matatus on those routes.
+# Loaded at startup and updated as matatus are registered, re-routed or
+# deleted in this process; other workers' changes are picked up when the
+# index is older than ROUTE_INDEX_MAX_AGE seconds or, in multi-worker mode,
+# as soon as the "routes" generation moves. Reloads run on a background
+# thread, one at a time, while searches keep using the current index.
+logger = logging.getLogger("route_search")
+
+ROUTE_INDEX_MAX_AGE = settings.route_index_max_age
+# Share of trigrams a stop name must have in common with the query
+STOP_MATCH_SIMILARITY = 0.3
+STOP_MATCH_LIMIT = 5
+
+def stop_key(name: str) -> str:
+    return " ".join(name.lower().split())
+
+def trigrams(key: str) -> set:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def clean_stop_names(names) -> list:
+    """Stop names in travel order, without blanks or immediate repeats."""
+    cleaned = []
+    for name in names:
+        name = " ".join((name or "").split())
+        if name and (not cleaned or stop_key(cleaned[-1]) != stop_key(name)):
+            cleaned.append(name)
+    return cleaned
+
+class _Index:
+    def __init__(self):
+        self.stops = {}                                  # stop_id -> (name, key, trigram count)
+        self.keys = []                                   # sorted (key, stop_id), for prefix matches
+        self.grams = collections.defaultdict(set)        # trigram -> stop_ids
+        self.stop_routes = collections.defaultdict(dict)  # stop_id -> {route_id: position}
+        self.routes = {}                                 # route_id -> (name, [stop_id, ...])
+        self.route_matatus = collections.defaultdict(dict)  # route_id -> {matatu_id: registration}
+        self.matatu_routes = {}                          # matatu_id -> route_id
+
+    def add_stop(self, stop_id, name):
+        if stop_id in self.stops:
+            return
+        key = stop_key(name)
+        grams = trigrams(key)
+        self.stops[stop_id] = (name, key, len(grams))
+        bisect.insort(self.keys, (key, stop_id))
+        for gram in grams:
+            self.grams[gram].add(stop_id)
+
+    def add_route(self, route_id, name, stops):
+        for position, (stop_id, stop_name) in enumerate(stops):
+            self.add_stop(stop_id, stop_name)
+            self.stop_routes[stop_id].setdefault(route_id, position)
+        self.routes[route_id] = (name, [stop_id for stop_id, _ in stops])
+
+    def set_matatu(self, matatu_id, registration_number, route_id):
+        self.remove_matatu(matatu_id)
+        if route_id is not None:
+            self.route_matatus[route_id][matatu_id] = registration_number
+            self.matatu_routes[matatu_id] = route_id
+
+    def remove_matatu(self, matatu_id):
+        route_id = self.matatu_routes.pop(matatu_id, None)
+        if route_id is not None:
+            self.route_matatus[route_id].pop(matatu_id, None)
+
+class RouteIndex:
+    def __init__(self, session_factory=open_read_session, max_age: float = ROUTE_INDEX_MAX_AGE):
+        self.session_factory = session_factory
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        self._index = _Index()
+        self._loaded_at = None
+        self._generation = None
+
+    def __len__(self):
+        return len(self._index.routes)
+
+    def load(self, db: Session):
+        generation = generations.get("routes") if generations is not None else None
+        index = _Index()
+        routes = collections.defaultdict(list)
+        query = (
+            select(models.RouteStop.route_id, models.Stop.id, models.Stop.name)
+            .join(models.Stop, models.RouteStop.stop_id == models.Stop.id)
+            .order_by(models.RouteStop.route_id, models.RouteStop.position)
+        )
+        for route_id, stop_id, name in db.execute(query):
+            routes[route_id].append((stop_id, name))
+        for route_id, name in db.execute(select(models.Route.id, models.Route.name)):
+            index.add_route(route_id, name, routes[route_id])
+        matatus = select(models.Matatu.id, models.Matatu.registration_number, models.Matatu.route_id).where(
+            models.Matatu.route_id.is_not(None)
+        )
+        for matatu_id, registration_number, route_id in db.execute(matatus):
+            index.set_matatu(matatu_id, registration_number, route_id)
+        with self._lock:
+            self._index = index
+            self._loaded_at = time.monotonic()
+            self._generation = generation
+
+    def stale(self) -> bool:
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.max_age:
+            return True
+        return generations is not None and generations.get("routes") != self._generation
+
+    def refresh_if_stale(self):
+        """Start a reload on a background thread if the index is stale and none is running."""
+        if not self.stale() or not self._refreshing.acquire(blocking=False):
+            return
+        try:
+            threading.Thread(target=self._refresh, name="route-index-refresh", daemon=True).start()
+        except BaseException:
+            self._refreshing.release()
+            raise
+
+    def _refresh(self):
+        try:
+            db = self.session_factory()
+            try:
+                self.load(db)
+            finally:
+                db.close()
+        except Exception:
+            logger.exception("Route index refresh failed")
+        finally:
+            self._refreshing.release()
+
+    def _changed(self):
+        # Tell other workers; this one is already up to date unless it missed an earlier bump
+        if generations is not None:
+            generation = generations.bump("routes")
+            if self._generation == generation - 1:
+                self._generation = generation
+
+    def add_route(self, db: Session, route_id: int):
+        """Index a route created in this process, unless it is already known."""
+        if route_id is None or route_id in self._index.routes:
+            return
+        name = db.scalar(select(models.Route.name).where(models.Route.id == route_id))
+        stops = db.execute(
+            select(models.Stop.id, models.Stop.name)
+            .join(models.RouteStop, models.RouteStop.stop_id == models.Stop.id)
+            .where(models.RouteStop.route_id == route_id)
+            .order_by(models.RouteStop.position)
+        ).all()
+        with self._lock:
+            self._index.add_route(route_id, name, [tuple(stop) for stop in stops])
+        self._changed()
+
+    def set_matatu(self, matatu_id: int, registration_number: str, route_id: int):
+        with self._lock:
+            self._index.set_matatu(matatu_id, registration_number, route_id)
+        self._changed()
+
+    def remove_matatu(self, matatu_id: int):
+        with self._lock:
+            self._index.remove_matatu(matatu_id)
+        self._changed()
+
+    def route_of(self, matatu_id: int):
+        return self._index.matatu_routes.get(matatu_id)
+
+    def stop_names(self, route_id: int) -> list:
+        route = self._index.routes.get(route_id) if route_id is not None else None
+        if route is None:
+            return []
+        stops = self._index.stops
+        return [stops[stop_id][0] for stop_id in route[1]]
+
+    def match_stops(self, query: str, limit: int = STOP_MATCH_LIMIT) -> list:
+        """Best matching stops as (stop_id, score); prefixes score 1, an exact name 2."""
+        with self._lock:
+            return self._match_stops(self._index, query, limit)
+
+    @staticmethod
+    def _match_stops(index: _Index, query: str, limit: int) -> list:
+        key = stop_key(query or "")
+        if not key:
+            return []
+        scores = {}
+        position = bisect.bisect_left(index.keys, (key,))
+        while position < len(index.keys) and index.keys[position][0].startswith(key) and len(scores) < limit * 4:
+            stop_key_, stop_id = index.keys[position]
+            scores[stop_id] = 2.0 if stop_key_ == key else 1.0
+            position += 1
+        grams = trigrams(key)
+        shared = collections.Counter()
+        for gram in grams:
+            shared.update(index.grams.get(gram, ()))
+        for stop_id, count in shared.items():
+            similarity = count / (len(grams) + index.stops[stop_id][2] - count)
+            if similarity >= STOP_MATCH_SIMILARITY and similarity > scores.get(stop_id, 0.0):
+                scores[stop_id] = similarity
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], index.stops[item[0]][1]))
+        return ranked[:limit]
+
+    def stops(self, query: str, limit: int = 10) -> list:
+        with self._lock:
+            index = self._index
+            return [
+                {"stopId": stop_id, "name": index.stops[stop_id][0], "routes": len(index.stop_routes[stop_id])}
+                for stop_id, _ in self._match_stops(index, query, limit)
+            ]
+
+    def search(self, origin: str, destination: str = None, limit: int = 20) -> list:
+        """Routes with matatus through a stop matching `origin` (and then `destination`), best first.
+
+        Matatus run their route both ways, so either order of the two stops counts.
+        """
+        with self._lock:
+            index = self._index
+            origins = self._match_stops(index, origin, STOP_MATCH_LIMIT)
+            destinations = self._match_stops(index, destination, STOP_MATCH_LIMIT) if destination else [(None, 0.0)]
+            best = {}
+            for origin_id, origin_score in origins:
+                for route_id, origin_position in index.stop_routes[origin_id].items():
+                    if not index.route_matatus.get(route_id):
+                        continue
+                    for destination_id, destination_score in destinations:
+                        if destination_id is None:
+                            destination_position = None
+                        else:
+                            destination_position = index.stop_routes[destination_id].get(route_id)
+                            if destination_position is None or destination_id == origin_id:
+                                continue
+                        hops = abs(destination_position - origin_position) if destination_position is not None else 0
+                        rank = (-(origin_score + destination_score), hops)
+                        if route_id not in best or rank < best[route_id][0]:
+                            best[route_id] = (rank, origin_position, destination_position)
+            results = []
+            for route_id, (rank, origin_position, destination_position) in sorted(best.items(), key=lambda item: item[1][0])[:limit]:
+                name, stop_ids = index.routes[route_id]
+                if destination_position is None:
+                    path = stop_ids
+                elif destination_position >= origin_position:
+                    path = stop_ids[origin_position:destination_position + 1]
+                else:
+                    path = stop_ids[destination_position:origin_position + 1][::-1]
+                results.append({
+                    "routeId": route_id,
+                    "name": name,
+                    "origin": index.stops[stop_ids[origin_position]][0],
+                    "destination": index.stops[stop_ids[destination_position]][0] if destination_position is not None else None,
+                    "stops": [index.stops[stop_id][0] for stop_id in path],
+                    "matatus": [
+                        {"matatuId": str(matatu_id), "registrationNumber": registration_number}
+                        for matatu_id, registration_number in sorted(index.route_matatus[route_id].items())
+                    ],
+                })
+            return results
+
+route_index = RouteIndex()
+
+def backfill(db: Session) -> int:
+    """Give matatus registered before routes existed a route from routeStart/routeEnd."""
+    from .crud import resolve_route
+    matatus = db.query(models.Matatu).filter(models.Matatu.route_id.is_(None)).all()
+    assigned = 0
+    for matatu in matatus:
+        matatu.route_id = resolve_route(db, [matatu.route_start, matatu.route_end])
+        assigned += matatu.route_id is not None
+    db.commit()
+    return assigned
+
+def main():
+    parser = argparse.ArgumentParser(description="Route and stop index maintenance")
+    parser.add_argument("command", choices=["backfill"])
+    parser.parse_args()
+    db = SessionLocal()
+    try:
+        print(f"Assigned routes to {backfill(db)} matatus")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Depends, Request
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.ext.asyncio import AsyncSession
+from ... import crud_async
+from ...database import get_async_db
+from ...passwords import PasswordQueueFull
+from ..auth import busy_exception, check_login_allowed, issue_token
+
+router = APIRouter(prefix="/api/auth", tags=["auth"])
+
+@router.post("/token")
+async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    check_login_allowed(request, form_data.username)
+    try:
+        user = await crud_async.authenticate_user(db, form_data.username, form_data.password)
+    except PasswordQueueFull:
+        raise busy_exception()
+    return issue_token(user, form_data.username)
@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from ... import crud_async, schemas
+from ...database import get_async_db, get_async_read_db
+from ...pagination import Page, next_cursor_headers
+from ...fare_engine import fare_table
+from ...cache import response_cache
+from ...serializers import JSONBytesResponse, fare_dict
+from ..fares import dynamic_fare, quote_fare
+from typing import List
+
+router = APIRouter(prefix="/api/fares", tags=["fares"])
+
+@router.post("/", response_model=schemas.FareOut)
+async def create_fare(fare: schemas.FareCreate, db: AsyncSession = Depends(get_async_db)):
+    db_fare = await crud_async.create_fare(db=db, fare=fare)
+    return schemas.FareOut.from_orm(db_fare)
+
+@router.get("/", response_model=List[schemas.FareOut])
+async def read_fares(page: Page = Depends(), db: AsyncSession = Depends(get_async_read_db)):
+    rows = await crud_async.get_fare_rows(db, skip=page.skip, limit=page.limit, after_id=page.after_id)
+    return JSONBytesResponse([fare_dict(row) for row in rows], headers=next_cursor_headers(page, rows))
+
+# Quotes never touch the database, so the sync router's handler is reused as is
+router.get("/quote", response_model=schemas.FareQuote)(quote_fare)
+router.get("/dynamic", response_model=schemas.DynamicFareQuote)(dynamic_fare)
+
+@router.post("/quote/batch", response_model=schemas.FareQuoteBatch)
+async def quote_fares(request: schemas.FareQuoteBatchRequest, db: AsyncSession = Depends(get_async_db)):
+    if request.matatu_ids is None and request.fleet_id is None and request.operator_id is None:
+        raise HTTPException(status_code=400, detail="Provide matatuIds, fleetId or operatorId")
+    matatu_ids = list(request.matatu_ids or [])
+    if request.fleet_id is not None or request.operator_id is not None:
+        matatu_ids.extend(await crud_async.get_matatu_ids(db, fleet_id=request.fleet_id, operator_id=request.operator_id))
+    quotes, missing = fare_table.quote_many(
+        dict.fromkeys(matatu_ids),
+        when=request.time,
+        rainy=request.weather == schemas.Weather.rainy,
+        disabled=request.disabled,
+    )
+    return {"quotes": quotes, "missing": missing}
+
+@router.get("/matatu/{matatu_id}", response_model=List[schemas.FareOut])
+async def read_fares_for_matatu(matatu_id: int, request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    return await response_cache.respond_async(request, ("fares",), lambda: _fares_for_matatu(db, matatu_id))
+
+async def _fares_for_matatu(db: AsyncSession, matatu_id: int):
+    return [fare_dict(row) for row in await crud_async.get_fare_rows(db, matatu_id=matatu_id)]
+
+@router.put("/{fare_id}", response_model=schemas.FareOut)
+async def update_fare(fare_id: int, fare: schemas.FareCreate, db: AsyncSession = Depends(get_async_db)):
+    updated = await crud_async.update_fare(db, fare_id, fare)
+    if not updated:
+        raise HTTPException(status_code=404, detail="Fare not found")
+    return schemas.FareOut.from_orm(updated)
@@ -0,0 +1,50 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from ... import crud_async, schemas
+from ...database import get_async_db, get_async_read_db
+from ...pagination import Page, next_cursor_headers
+from ...cache import response_cache
+from ...serializers import fleet_dict
+from typing import List
+
+router = APIRouter(prefix="/api/fleets", tags=["fleets"])
+
+@router.post("/", response_model=schemas.FleetOut)
+async def create_fleet(fleet: schemas.FleetCreate, db: AsyncSession = Depends(get_async_db)):
+    result = await crud_async.create_fleet(db=db, fleet=fleet)
+    return schemas.FleetOut.from_orm(result)
+
+@router.get("/", response_model=List[schemas.FleetOut])
+async def read_fleets(request: Request, page: Page = Depends(), db: AsyncSession = Depends(get_async_read_db)):
+    headers = {}
+    async def load():
+        rows = await crud_async.get_fleet_rows(db, skip=page.skip, limit=page.limit, after_id=page.after_id)
+        headers.update(next_cursor_headers(page, rows))
+        return [fleet_dict(row) for row in rows]
+    return await response_cache.respond_async(request, ("fleets",), load, headers)
+
+@router.get("/{fleet_id}", response_model=schemas.FleetOut)
+async def read_fleet(fleet_id: int, request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    async def load():
+        db_fleet = await crud_async.get_fleet(db, fleet_id=fleet_id)
+        if db_fleet is None:
+            raise HTTPException(status_code=404, detail="Fleet not found")
+        return schemas.FleetOut.from_orm(db_fleet)
+    return await response_cache.respond_async(request, ("fleets",), load)
+
+@router.get("/operator/{operator_id}", response_model=List[schemas.FleetOut])
+async def get_fleets_for_operator(operator_id: str, request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    async def load():
+        return [fleet_dict(row) for row in await crud_async.get_fleet_rows(db, operator_id=operator_id)]
+    return await response_cache.respond_async(request, ("fleets",), load)
+
+@router.delete("/{fleet_id}", status_code=204)
+async def delete_fleet(fleet_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_fleet = await crud_async.get_fleet(db, fleet_id=fleet_id)
+    if db_fleet is None:
+        raise HTTPException(status_code=404, detail="Fleet not found")
+    if await crud_async.fleet_has_matatus(db, fleet_id):
+        raise HTTPException(status_code=400, detail="Cannot delete fleet with matatus assigned")
+    await crud_async.delete(db, db_fleet)
+    response_cache.invalidate("fleets")
+    return Response(status_code=204)
@@ -0,0 +1,78 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from ... import crud_async, schemas
+from ...database import get_async_db, get_async_read_db
+from ...pagination import Page, next_cursor_headers
+from ...fare_engine import fare_table
+from ...route_search import route_index
+from ...cache import response_cache
+from ...serializers import matatu_dict
+from ..matatus import bulk_register_matatus, bulk_register_matatus_csv
+from typing import List
+
+router = APIRouter(prefix="/api/matatus", tags=["matatus"])
+
+@router.post("/", response_model=schemas.MatatuOut)
+async def create_matatu(matatu: schemas.MatatuCreate, db: AsyncSession = Depends(get_async_db)):
+    result = await crud_async.create_matatu(db=db, matatu=matatu)
+    if result is None:
+        raise HTTPException(status_code=409, detail="Matatu already exists or registration failed. Check backend logs for details.")
+    return schemas.MatatuOut.from_orm(result)
+
+# Onboarding runs rarely; the sync batched insert path is reused
+router.post("/bulk", response_model=schemas.MatatuBulkReport)(bulk_register_matatus)
+router.post("/bulk/csv", response_model=schemas.MatatuBulkReport)(bulk_register_matatus_csv)
+
+async def _matatu_dicts(db: AsyncSession, rows):
+    fares = await crud_async.get_current_fares(db, [row.id for row in rows])
+    return [matatu_dict(row, fares.get(row.id)) for row in rows]
+
+async def _one_matatu(db: AsyncSession, **criteria):
+    rows = await crud_async.get_matatu_rows(db, **criteria)
+    if not rows:
+        raise HTTPException(status_code=404, detail="Matatu not found")
+    return (await _matatu_dicts(db, rows))[0]
+
+async def _operator_matatus(db: AsyncSession, operator_id: str):
+    return await _matatu_dicts(db, await crud_async.get_matatu_rows(db, operator_id=operator_id))
+
+@router.get("/", response_model=List[schemas.MatatuOut])
+async def read_matatus(request: Request, page: Page = Depends(), db: AsyncSession = Depends(get_async_read_db)):
+    headers = {}
+    async def load():
+        rows = await crud_async.get_matatu_rows(db, skip=page.skip, limit=page.limit, after_id=page.after_id)
+        headers.update(next_cursor_headers(page, rows))
+        return await _matatu_dicts(db, rows)
+    return await response_cache.respond_async(request, ("matatus", "fares"), load, headers)
+
+@router.get("/{matatu_id}", response_model=schemas.MatatuOut)
+async def read_matatu(matatu_id: int, request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    return await response_cache.respond_async(request, ("matatus", "fares"), lambda: _one_matatu(db, matatu_id=matatu_id))
+
+@router.get("/registration/{registration_number}", response_model=schemas.MatatuOut)
+async def read_matatu_by_registration(registration_number: str, request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    return await response_cache.respond_async(
+        request, ("matatus", "fares"), lambda: _one_matatu(db, registration_number=registration_number)
+    )
+
+@router.get("/operator/{operator_id}", response_model=List[schemas.MatatuOut])
+async def get_matatus_for_operator(operator_id: str, request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    return await response_cache.respond_async(request, ("matatus", "fares"), lambda: _operator_matatus(db, operator_id))
+
+@router.put("/{matatu_id}/route", response_model=schemas.MatatuOut)
+async def update_matatu_route(matatu_id: int, route: schemas.MatatuRouteUpdate, db: AsyncSession = Depends(get_async_db)):
+    db_matatu = await crud_async.get_matatu(db, matatu_id=matatu_id)
+    if db_matatu is None:
+        raise HTTPException(status_code=404, detail="Matatu not found")
+    return schemas.MatatuOut.from_orm(await crud_async.set_matatu_route(db, db_matatu, route.stops))
+
+@router.delete("/{matatu_id}", status_code=204)
+async def delete_matatu(matatu_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_matatu = await crud_async.get_matatu(db, matatu_id=matatu_id)
+    if db_matatu is None:
+        raise HTTPException(status_code=404, detail="Matatu not found")
+    await crud_async.delete(db, db_matatu)
+    fare_table.discard(matatu_id)
+    route_index.remove_matatu(matatu_id)
+    response_cache.invalidate("matatus", "fares")
+    return Response(status_code=204)
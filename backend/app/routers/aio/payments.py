@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from ... import crud_async, schemas
+from ...database import get_async_db, get_async_read_db
+from ...pagination import Page, set_next_cursor
+from ..payments import export_payments, ingest_payment, read_ingested_payment
+from typing import List, Optional
+import datetime
+import logging
+
+router = APIRouter(prefix="/api/payments", tags=["payments"])
+logger = logging.getLogger("payments")
+
+@router.post("/", response_model=schemas.PaymentOut)
+async def create_payment(payment: schemas.PaymentCreate, db: AsyncSession = Depends(get_async_db)):
+    db_payment = await crud_async.create_payment(db=db, payment=payment)
+    if db_payment is None:
+        raise HTTPException(status_code=409, detail="A payment with this M-Pesa receipt is already recorded")
+    return db_payment
+
+router.post("/ingest", response_model=schemas.PaymentAck, status_code=202)(ingest_payment)
+router.get("/ingest/{idempotency_key}", response_model=schemas.PaymentOut)(read_ingested_payment)
+
+@router.post("/mpesa/callback")
+async def mpesa_callback(callback: schemas.MpesaCallback, db: AsyncSession = Depends(get_async_db)):
+    stk = callback.Body.stkCallback
+    outcome = await crud_async.settle_mpesa_payment(db, stk)
+    logger.info("M-Pesa callback %s: %s", stk.CheckoutRequestID, outcome)
+    return {"ResultCode": 0, "ResultDesc": "Accepted"}
+
+@router.get("/", response_model=List[schemas.PaymentRecordOut])
+async def read_payments(response: Response, page: Page = Depends(), since: Optional[datetime.datetime] = None,
+                        until: Optional[datetime.datetime] = None, db: AsyncSession = Depends(get_async_read_db)):
+    payments = await crud_async.get_payments(db, skip=page.skip, limit=page.limit, after_id=page.after_id, since=since, until=until)
+    set_next_cursor(response, page, payments)
+    return payments
+
+@router.get("/user/{user_id}", response_model=List[schemas.PaymentOut])
+async def read_payments_for_user(user_id: int, since: Optional[datetime.datetime] = None,
+                                 until: Optional[datetime.datetime] = None, db: AsyncSession = Depends(get_async_read_db)):
+    return await crud_async.get_payments_for_user(db, user_id=user_id, since=since, until=until)
+
+# Streams from a sync server-side cursor; Starlette iterates it in a worker thread
+router.get("/export")(export_payments)
@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from ... import schemas
+from ...database import get_async_read_db
+from ...revenue import daily_query, revenue_dict
+from ...serializers import JSONBytesResponse
+from ..revenue import revenue_range
+from typing import List
+
+router = APIRouter(prefix="/api/revenue", tags=["revenue"])
+
+@router.get("/matatu/{matatu_id}", response_model=List[schemas.RevenueDay])
+async def read_matatu_revenue(matatu_id: int, days=Depends(revenue_range), db: AsyncSession = Depends(get_async_read_db)):
+    rows = (await db.execute(daily_query(*days, matatu_id=matatu_id))).all()
+    return JSONBytesResponse([revenue_dict(row) for row in rows])
+
+@router.get("/fleet/{fleet_id}", response_model=List[schemas.RevenueDay])
+async def read_fleet_revenue(fleet_id: int, days=Depends(revenue_range), by_matatu: bool = Query(False, alias="byMatatu"),
+                             db: AsyncSession = Depends(get_async_read_db)):
+    rows = (await db.execute(daily_query(*days, fleet_id=fleet_id, by_matatu=by_matatu))).all()
+    return JSONBytesResponse([revenue_dict(row) for row in rows])
@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Query
+from ... import schemas
+from ...route_search import route_index
+from ...serializers import JSONBytesResponse
+from typing import List, Optional
+
+router = APIRouter(prefix="/api/routes", tags=["routes"])
+
+@router.get("/search", response_model=List[schemas.RouteMatch])
+async def search_routes(
+    origin: str = Query(..., alias="from", min_length=1),
+    destination: Optional[str] = Query(None, alias="to"),
+    limit: int = Query(20, ge=1, le=100),
+):
+    route_index.refresh_if_stale()
+    return JSONBytesResponse(route_index.search(origin, destination, limit))
+
+@router.get("/stops", response_model=List[schemas.StopMatch])
+async def search_stops(q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=50)):
+    route_index.refresh_if_stale()
+    return JSONBytesResponse(route_index.stops(q, limit))
@@ -0,0 +1,36 @@
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from ... import crud_async, schemas
+from ...database import get_async_db, get_async_read_db
+from ...pagination import Page, set_next_cursor
+from ...passwords import PasswordQueueFull
+from ..auth import busy_exception
+from ..users import read_current_user
+from typing import List
+
+router = APIRouter(prefix="/api/users", tags=["users"])
+
+@router.post("/", response_model=schemas.UserOut)
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await crud_async.get_user_by_email(db, email=user.email)
+    if db_user:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    try:
+        return await crud_async.create_user(db=db, user=user)
+    except PasswordQueueFull:
+        raise busy_exception()
+
+@router.get("/", response_model=List[schemas.UserOut])
+async def read_users(response: Response, page: Page = Depends(), db: AsyncSession = Depends(get_async_read_db)):
+    users = await crud_async.get_users(db, skip=page.skip, limit=page.limit, after_id=page.after_id)
+    set_next_cursor(response, page, users)
+    return users
+
+router.get("/me", response_model=schemas.UserOut)(read_current_user)
+
+@router.get("/{user_id}", response_model=schemas.UserOut)
+async def read_user(user_id: int, db: AsyncSession = Depends(get_async_read_db)):
+    db_user = await crud_async.get_user(db, user_id=user_id)
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return db_user
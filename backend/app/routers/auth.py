@@ -1,19 +1,55 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from .. import crud, auth, schemas
 from ..database import get_db
+from ..passwords import hasher, PasswordQueueFull
+from ..ratelimit import login_throttle
 from datetime import timedelta
+import math
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
-@router.post("/token")
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = crud.authenticate_user(db, form_data.username, form_data.password)
+def busy_exception():
+    return HTTPException(status_code=503, detail="Too many logins in progress, retry shortly", headers={"Retry-After": "1"})
+
+def check_login_allowed(request: Request, username: str) -> str:
+    ip = request.client.host if request.client else "unknown"
+    retry_after = login_throttle.retry_after(username, ip)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+    login_throttle.attempt(ip)
+    return ip
+
+def issue_token(user, username: str):
     if not user:
+        login_throttle.failed(username)
         raise HTTPException(status_code=400, detail="Incorrect email or password")
+    login_throttle.succeeded(username)
     access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
-        data={"sub": str(user.id)}, expires_delta=access_token_expires
+        data=auth.token_claims(user), expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
+
+# bcrypt runs on the password process pool, so a login surge does not hold
+# threadpool slots that every other endpoint needs
+@router.post("/token")
+async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    check_login_allowed(request, form_data.username)
+    user = await run_in_threadpool(crud.get_user_by_email, db, form_data.username)
+    if user:
+        try:
+            valid, new_hash = await hasher.verify(form_data.password, user.hashed_password)
+        except PasswordQueueFull:
+            raise busy_exception()
+        if not valid:
+            user = None
+        elif new_hash:
+            await run_in_threadpool(crud.update_password_hash, db, user.id, new_hash)
+    return issue_token(user, form_data.username)
@@ -1,8 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
 from sqlalchemy.orm import Session
 from .. import crud, schemas, auth
-from ..database import get_db
-from typing import List
+from ..database import get_db, get_read_db
+from ..pagination import Page, next_cursor_headers
+from ..fare_engine import fare_table
+from ..surge import surge_engine
+from ..cache import response_cache
+from ..serializers import JSONBytesResponse, fare_dict
+from typing import List, Optional
+import datetime
 
 router = APIRouter(prefix="/api/fares", tags=["fares"])
 
@@ -12,25 +18,52 @@ def create_fare(fare: schemas.FareCreate, db: Session = Depends(get_db)):
     return schemas.FareOut.from_orm(db_fare)
 
 @router.get("/", response_model=List[schemas.FareOut])
-def read_fares(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    fares = crud.get_fares(db, skip=skip, limit=limit)
-    return [schemas.FareOut.from_orm(f) for f in fares]
+def read_fares(page: Page = Depends(), db: Session = Depends(get_read_db)):
+    rows = crud.get_fare_rows(db, skip=page.skip, limit=page.limit, after_id=page.after_id)
+    return JSONBytesResponse([fare_dict(row) for row in rows], headers=next_cursor_headers(page, rows))
+
+# Served from the in-memory fare table, no database access
+@router.get("/quote", response_model=schemas.FareQuote)
+async def quote_fare(
+    matatu_id: int = Query(..., alias="matatuId"),
+    time: Optional[datetime.datetime] = None,
+    weather: schemas.Weather = schemas.Weather.dry,
+    disabled: bool = False,
+):
+    quote = fare_table.quote(matatu_id, when=time, rainy=weather == schemas.Weather.rainy, disabled=disabled)
+    if quote is None:
+        raise HTTPException(status_code=404, detail="No fare set for this matatu")
+    return quote
+
+# Demand-priced fare from the latest surge tick, also without database access
+@router.get("/dynamic", response_model=schemas.DynamicFareQuote)
+async def dynamic_fare(matatu_id: int = Query(..., alias="matatuId"), disabled: bool = False):
+    quote = surge_engine.quote(matatu_id, disabled=disabled)
+    if quote is None:
+        raise HTTPException(status_code=404, detail="No fare set for this matatu")
+    return quote
+
+# One response for a whole fleet/operator/route screen instead of a request per vehicle
+@router.post("/quote/batch", response_model=schemas.FareQuoteBatch)
+def quote_fares(request: schemas.FareQuoteBatchRequest, db: Session = Depends(get_db)):
+    if request.matatu_ids is None and request.fleet_id is None and request.operator_id is None:
+        raise HTTPException(status_code=400, detail="Provide matatuIds, fleetId or operatorId")
+    matatu_ids = list(request.matatu_ids or [])
+    if request.fleet_id is not None or request.operator_id is not None:
+        matatu_ids.extend(crud.get_matatu_ids(db, fleet_id=request.fleet_id, operator_id=request.operator_id))
+    quotes, missing = fare_table.quote_many(
+        dict.fromkeys(matatu_ids),
+        when=request.time,
+        rainy=request.weather == schemas.Weather.rainy,
+        disabled=request.disabled,
+    )
+    return {"quotes": quotes, "missing": missing}
 
 @router.get("/matatu/{matatu_id}", response_model=List[schemas.FareOut])
-def read_fares_for_matatu(matatu_id: int, db: Session = Depends(get_db)):
-    fares = crud.get_fares_for_matatu(db, matatu_id=matatu_id)
-    print("FARES FROM DB:", fares)
-    for f in fares:
-        print("FARE FIELDS:", f.id, f.matatu_id, f.peak_fare, f.non_peak_fare, f.rainy_peak_fare, f.rainy_non_peak_fare, f.disability_discount)
-    return [{
-        "fareId": f.id,
-        "matatuId": f.matatu_id,
-        "peakFare": f.peak_fare,
-        "nonPeakFare": f.non_peak_fare,
-        "rainyPeakFare": f.rainy_peak_fare,
-        "rainyNonPeakFare": f.rainy_non_peak_fare,
-        "disabilityDiscount": f.disability_discount,
-    } for f in fares]
+def read_fares_for_matatu(matatu_id: int, request: Request, db: Session = Depends(get_read_db)):
+    return response_cache.respond(
+        request, ("fares",), lambda: [fare_dict(row) for row in crud.get_fare_rows(db, matatu_id=matatu_id)]
+    )
 
 # NOTE: Send disability_discount as a decimal (e.g., 0.02 for 2%)
 @router.put("/{fare_id}", response_model=schemas.FareOut)
@@ -1,7 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
 from .. import crud, schemas, auth, models
-from ..database import get_db
+from ..database import get_db, get_read_db
+from ..pagination import Page, next_cursor_headers
+from ..cache import response_cache
+from ..serializers import fleet_dict
 from typing import List
 
 router = APIRouter(prefix="/api/fleets", tags=["fleets"])
@@ -12,30 +15,38 @@ def create_fleet(fleet: schemas.FleetCreate, db: Session = Depends(get_db)):
     return schemas.FleetOut.from_orm(result)
 
 @router.get("/", response_model=List[schemas.FleetOut])
-def read_fleets(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return [schemas.FleetOut.from_orm(f) for f in crud.get_fleets(db, skip=skip, limit=limit)]
+def read_fleets(request: Request, page: Page = Depends(), db: Session = Depends(get_read_db)):
+    headers = {}
+    def load():
+        rows = crud.get_fleet_rows(db, skip=page.skip, limit=page.limit, after_id=page.after_id)
+        headers.update(next_cursor_headers(page, rows))
+        return [fleet_dict(row) for row in rows]
+    return response_cache.respond(request, ("fleets",), load, headers)
 
 @router.get("/{fleet_id}", response_model=schemas.FleetOut)
-def read_fleet(fleet_id: int, db: Session = Depends(get_db)):
-    db_fleet = crud.get_fleet(db, fleet_id=fleet_id)
-    if db_fleet is None:
-        raise HTTPException(status_code=404, detail="Fleet not found")
-    return schemas.FleetOut.from_orm(db_fleet)
+def read_fleet(fleet_id: int, request: Request, db: Session = Depends(get_read_db)):
+    def load():
+        db_fleet = crud.get_fleet(db, fleet_id=fleet_id)
+        if db_fleet is None:
+            raise HTTPException(status_code=404, detail="Fleet not found")
+        return schemas.FleetOut.from_orm(db_fleet)
+    return response_cache.respond(request, ("fleets",), load)
 
 @router.get("/operator/{operator_id}", response_model=List[schemas.FleetOut])
-def get_fleets_for_operator(operator_id: str, db: Session = Depends(get_db)):
-    fleets = db.query(models.Fleet).filter(models.Fleet.operator_id == operator_id).all()
-    return [schemas.FleetOut.from_orm(f) for f in fleets]
+def get_fleets_for_operator(operator_id: str, request: Request, db: Session = Depends(get_read_db)):
+    def load():
+        return [fleet_dict(row) for row in crud.get_fleet_rows(db, operator_id=operator_id)]
+    return response_cache.respond(request, ("fleets",), load)
 
 @router.delete("/{fleet_id}", status_code=204)
 def delete_fleet(fleet_id: str, db: Session = Depends(get_db)):
     db_fleet = crud.get_fleet(db, fleet_id=fleet_id)
     if db_fleet is None:
         raise HTTPException(status_code=404, detail="Fleet not found")
-    # Check if fleet has any matatus
-    matatus_count = db.query(models.Matatu).filter(models.Matatu.fleet_id == fleet_id).count()
-    if matatus_count > 0:
+    # Check if fleet has any matatus (first match on ix_matatus_fleet_id, no count)
+    if crud.fleet_has_matatus(db, fleet_id):
         raise HTTPException(status_code=400, detail="Cannot delete fleet with matatus assigned")
     db.delete(db_fleet)
     db.commit()
+    response_cache.invalidate("fleets")
     return Response(status_code=204)
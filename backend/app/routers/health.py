@@ -0,0 +1,33 @@
+from fastapi import APIRouter
+from ..database import engine, async_engine, async_replicas, pool_stats, replicas
+from ..payment_ingest import ingestor
+from ..cache import response_cache
+from ..surge import surge_engine
+from ..positions import position_index, position_log
+
+router = APIRouter(prefix="/api/health", tags=["health"])
+
+@router.get("/pool")
+async def read_pool_stats():
+    pool = async_engine.sync_engine.pool if async_engine is not None else engine.pool
+    return pool_stats.snapshot(pool)
+
+@router.get("/replicas")
+async def read_replica_stats():
+    return (async_replicas or replicas).stats()
+
+@router.get("/ingest")
+async def read_ingest_stats():
+    return ingestor.stats()
+
+@router.get("/cache")
+async def read_cache_stats():
+    return response_cache.stats()
+
+@router.get("/surge")
+async def read_surge_stats():
+    return surge_engine.stats()
+
+@router.get("/positions")
+async def read_position_stats():
+    return {"index": position_index.stats(), "log": position_log.stats()}
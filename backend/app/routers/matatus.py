@@ -1,8 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, Body, Depends, File, HTTPException, Request, Response, UploadFile
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
 from .. import crud, schemas, auth, models
-from ..database import get_db
-from typing import List
+from ..database import get_db, get_read_db
+from ..pagination import Page, next_cursor_headers
+from ..fare_engine import fare_table
+from ..route_search import route_index
+from ..cache import response_cache
+from ..serializers import matatu_dict
+from typing import Any, Dict, List
+import codecs
+import csv
 
 router = APIRouter(prefix="/api/matatus", tags=["matatus"])
 
@@ -14,28 +22,82 @@ def create_matatu(matatu: schemas.MatatuCreate, db: Session = Depends(get_db)):
     # Always return a Pydantic schema, not the ORM model
     return schemas.MatatuOut.from_orm(result)
 
+def _bulk_register(db: Session, records):
+    matatus, invalid = [], []
+    for index, record in enumerate(records):
+        try:
+            matatus.append((index, schemas.MatatuCreate(**record)))
+        except ValidationError as e:
+            reason = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            registration_number = record.get("registrationNumber")
+            invalid.append({
+                "index": index,
+                "registrationNumber": None if registration_number is None else str(registration_number),
+                "status": "rejected",
+                "reason": reason,
+            })
+    results = sorted(crud.create_matatus_bulk(db, matatus) + invalid, key=lambda r: r["index"])
+    accepted = sum(r["status"] == "accepted" for r in results)
+    return {"accepted": accepted, "rejected": len(results) - accepted, "results": results}
+
+# Rows are validated one by one so a bad record is reported instead of failing the whole batch
+@router.post("/bulk", response_model=schemas.MatatuBulkReport)
+def bulk_register_matatus(matatus: List[Dict[str, Any]] = Body(...), db: Session = Depends(get_db)):
+    return _bulk_register(db, matatus)
+
+# CSV header uses the same camelCase names as the JSON body
+@router.post("/bulk/csv", response_model=schemas.MatatuBulkReport)
+def bulk_register_matatus_csv(file: UploadFile = File(...), db: Session = Depends(get_db)):
+    reader = csv.DictReader(codecs.iterdecode(file.file, "utf-8-sig"))
+    try:
+        records = [{key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()} for row in reader]
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Unreadable CSV (expected UTF-8): {e}")
+    return _bulk_register(db, records)
+
+# Two queries however many rows: matatus joined to their fleet, then the current fares
+def _matatu_dicts(db: Session, rows):
+    fares = crud.get_current_fares(db, [row.id for row in rows])
+    return [matatu_dict(row, fares.get(row.id)) for row in rows]
+
+def _one_matatu(db: Session, **criteria):
+    rows = crud.get_matatu_rows(db, **criteria)
+    if not rows:
+        raise HTTPException(status_code=404, detail="Matatu not found")
+    return _matatu_dicts(db, rows)[0]
+
 @router.get("/", response_model=List[schemas.MatatuOut])
-def read_matatus(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return [schemas.MatatuOut.from_orm(m) for m in crud.get_matatus(db, skip=skip, limit=limit)]
+def read_matatus(request: Request, page: Page = Depends(), db: Session = Depends(get_read_db)):
+    headers = {}
+    def load():
+        rows = crud.get_matatu_rows(db, skip=page.skip, limit=page.limit, after_id=page.after_id)
+        headers.update(next_cursor_headers(page, rows))
+        return _matatu_dicts(db, rows)
+    return response_cache.respond(request, ("matatus", "fares"), load, headers)
 
 @router.get("/{matatu_id}", response_model=schemas.MatatuOut)
-def read_matatu(matatu_id: int, db: Session = Depends(get_db)):
-    db_matatu = crud.get_matatu(db, matatu_id=matatu_id)
-    if db_matatu is None:
-        raise HTTPException(status_code=404, detail="Matatu not found")
-    return schemas.MatatuOut.from_orm(db_matatu)
+def read_matatu(matatu_id: int, request: Request, db: Session = Depends(get_read_db)):
+    return response_cache.respond(request, ("matatus", "fares"), lambda: _one_matatu(db, matatu_id=matatu_id))
 
 @router.get("/registration/{registration_number}", response_model=schemas.MatatuOut)
-def read_matatu_by_registration(registration_number: str, db: Session = Depends(get_db)):
-    db_matatu = crud.get_matatu_by_registration(db, registration_number=registration_number)
-    if db_matatu is None:
-        raise HTTPException(status_code=404, detail="Matatu not found")
-    return schemas.MatatuOut.from_orm(db_matatu)
+def read_matatu_by_registration(registration_number: str, request: Request, db: Session = Depends(get_read_db)):
+    return response_cache.respond(
+        request, ("matatus", "fares"), lambda: _one_matatu(db, registration_number=registration_number)
+    )
 
 @router.get("/operator/{operator_id}", response_model=List[schemas.MatatuOut])
-def get_matatus_for_operator(operator_id: str, db: Session = Depends(get_db)):
-    matatus = db.query(models.Matatu).filter(models.Matatu.operator_id == operator_id).all()
-    return [schemas.MatatuOut.from_orm(m) for m in matatus]
+def get_matatus_for_operator(operator_id: str, request: Request, db: Session = Depends(get_read_db)):
+    return response_cache.respond(
+        request, ("matatus", "fares"), lambda: _matatu_dicts(db, crud.get_matatu_rows(db, operator_id=operator_id))
+    )
+
+# Replaces the matatu's stops; routeStart/routeEnd follow the first and last stop
+@router.put("/{matatu_id}/route", response_model=schemas.MatatuOut)
+def update_matatu_route(matatu_id: int, route: schemas.MatatuRouteUpdate, db: Session = Depends(get_db)):
+    db_matatu = crud.get_matatu(db, matatu_id=matatu_id)
+    if db_matatu is None:
+        raise HTTPException(status_code=404, detail="Matatu not found")
+    return schemas.MatatuOut.from_orm(crud.set_matatu_route(db, db_matatu, route.stops))
 
 @router.delete("/{matatu_id}", status_code=204)
 def delete_matatu(matatu_id: str, db: Session = Depends(get_db)):
@@ -44,4 +106,7 @@ def delete_matatu(matatu_id: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Matatu not found")
     db.delete(db_matatu)
     db.commit()
+    fare_table.discard(db_matatu.id)
+    route_index.remove_matatu(db_matatu.id)
+    response_cache.invalidate("matatus", "fares")
     return Response(status_code=204)
@@ -0,0 +1,29 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from ..database import engine, async_engine, async_replicas, pool_stats, replicas
+from ..payment_ingest import ingestor
+from ..cache import response_cache
+from ..metrics import METRICS_ENABLED, MetricsPublisher, render
+from .. import shared_state
+
+router = APIRouter(tags=["metrics"])
+
+def gauges() -> dict:
+    pool = async_engine.sync_engine.pool if async_engine is not None else engine.pool
+    return {
+        "db_pool": pool_stats.snapshot(pool),
+        "payment_ingest": ingestor.stats(),
+        "response_cache": response_cache.stats(),
+        "db_replicas": (async_replicas or replicas).stats(),
+    }
+
+# Every worker behind the port answers for all of them (see app.metrics)
+publisher = MetricsPublisher(shared_state.generations.directory, gauges) if METRICS_ENABLED and shared_state.generations else None
+
+# Prometheus scrape target; the same numbers as /api/health/* plus request and SQL histograms
+@router.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    return PlainTextResponse(
+        render(gauges(), publisher.others() if publisher else ()),
+        media_type="text/plain; version=0.0.4",
+    )
@@ -1,19 +1,79 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from .. import crud, schemas, auth
-from ..database import get_db
-from typing import List
+from ..database import get_db, get_read_db
+from ..pagination import Page, set_next_cursor
+from ..export import ExportFormat, MEDIA_TYPES, stream_payments
+from ..payment_ingest import ingestor, IngestQueueFull
+from typing import List, Optional
+import datetime
+import logging
+import uuid
 
 router = APIRouter(prefix="/api/payments", tags=["payments"])
+logger = logging.getLogger("payments")
 
 @router.post("/", response_model=schemas.PaymentOut)
 def create_payment(payment: schemas.PaymentCreate, db: Session = Depends(get_db)):
-    return crud.create_payment(db=db, payment=payment)
+    db_payment = crud.create_payment(db=db, payment=payment)
+    if db_payment is None:
+        raise HTTPException(status_code=409, detail="A payment with this M-Pesa receipt is already recorded")
+    return db_payment
 
-@router.get("/", response_model=List[schemas.PaymentOut])
-def read_payments(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_payments(db, skip=skip, limit=limit)
+# Queued write path for peak hours: acknowledged immediately, stored by the
+# background writer in batches. Poll /ingest/{key} to see the stored payment.
+@router.post("/ingest", response_model=schemas.PaymentAck, status_code=202)
+async def ingest_payment(payment: schemas.PaymentCreate, idempotency_key: Optional[str] = Header(None)):
+    key = idempotency_key or uuid.uuid4().hex
+    try:
+        ingestor.submit(payment.dict(), key)
+    except IngestQueueFull:
+        raise HTTPException(status_code=503, detail="Payment queue is full, retry shortly", headers={"Retry-After": "1"})
+    return {"idempotencyKey": key, "status": "queued"}
+
+@router.get("/ingest/{idempotency_key}", response_model=schemas.PaymentOut)
+def read_ingested_payment(idempotency_key: str, db: Session = Depends(get_read_db)):
+    db_payment = crud.get_payment_by_idempotency_key(db, idempotency_key)
+    if db_payment is None:
+        raise HTTPException(status_code=404, detail="Payment not stored yet")
+    return db_payment
+
+# Daraja STK push result URL. Safaricom retries deliveries, so repeats are no-ops;
+# always acknowledge so it stops retrying.
+@router.post("/mpesa/callback")
+def mpesa_callback(callback: schemas.MpesaCallback, db: Session = Depends(get_db)):
+    stk = callback.Body.stkCallback
+    outcome = crud.settle_mpesa_payment(db, stk)
+    logger.info("M-Pesa callback %s: %s", stk.CheckoutRequestID, outcome)
+    return {"ResultCode": 0, "ResultDesc": "Accepted"}
+
+@router.get("/", response_model=List[schemas.PaymentRecordOut])
+def read_payments(response: Response, page: Page = Depends(), since: Optional[datetime.datetime] = None,
+                  until: Optional[datetime.datetime] = None, db: Session = Depends(get_read_db)):
+    payments = crud.get_payments(db, skip=page.skip, limit=page.limit, after_id=page.after_id, since=since, until=until)
+    set_next_cursor(response, page, payments)
+    return payments
 
 @router.get("/user/{user_id}", response_model=List[schemas.PaymentOut])
-def read_payments_for_user(user_id: int, db: Session = Depends(get_db)):
-    return crud.get_payments_for_user(db, user_id=user_id)
+def read_payments_for_user(user_id: int, since: Optional[datetime.datetime] = None,
+                           until: Optional[datetime.datetime] = None, db: Session = Depends(get_read_db)):
+    return crud.get_payments_for_user(db, user_id=user_id, since=since, until=until)
+
+# Full-day dumps for M-Pesa reconciliation, streamed so memory stays flat
+@router.get("/export")
+def export_payments(
+    format: ExportFormat = ExportFormat.ndjson,
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    fleet_id: Optional[int] = Query(None, alias="fleetId"),
+    matatu_id: Optional[int] = Query(None, alias="matatuId"),
+    status: Optional[str] = None,
+):
+    body = stream_payments(format, start=start, end=end, fleet_id=fleet_id, matatu_id=matatu_id, status=status)
+    filename = f"payments-{(start or datetime.datetime.utcnow()).date().isoformat()}.{format.value}"
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
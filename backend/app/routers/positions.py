@@ -0,0 +1,42 @@
+from fastapi import APIRouter, HTTPException, Query
+from .. import schemas
+from ..positions import position_index, position_log
+from ..route_search import route_index
+from ..serializers import JSONBytesResponse
+from typing import List, Optional
+import time
+
+# No database access, so the same handlers serve the sync and async apps
+router = APIRouter(prefix="/api/positions", tags=["positions"])
+
+# Devices batch their fixes; the latest position is indexed in memory and history goes to the append-only log.
+# Fixes dated after their receipt are taken as recorded on receipt.
+@router.post("/", response_model=schemas.PositionAck, status_code=202)
+async def report_positions(batch: schemas.PositionBatch):
+    received_at = time.time()
+    fixes = [
+        (fix.matatuId, fix.lat, fix.lon, fix.heading, fix.speed,
+         min(fix.recordedAt.timestamp(), received_at) if fix.recordedAt is not None else received_at)
+        for fix in batch.positions
+    ]
+    position_index.update_many(fixes)
+    position_log.submit(fixes, received_at)
+    return {"accepted": len(fixes)}
+
+@router.get("/nearest", response_model=List[schemas.VehiclePosition])
+async def nearest_matatus(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    route_id: Optional[int] = Query(None, alias="routeId"),
+    limit: int = Query(10, ge=1, le=100),
+    radius: float = Query(5000, gt=0, le=50000),
+):
+    accept = None if route_id is None else lambda matatu_id: route_index.route_of(matatu_id) == route_id
+    return JSONBytesResponse(position_index.nearest(lat, lon, limit=limit, radius_m=radius, accept=accept))
+
+@router.get("/{matatu_id}", response_model=schemas.VehiclePosition)
+async def read_position(matatu_id: int):
+    position = position_index.get(matatu_id)
+    if position is None:
+        raise HTTPException(status_code=404, detail="No recent position for this matatu")
+    return position
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from .. import schemas
+from ..database import get_read_db
+from ..revenue import daily_query, revenue_day, revenue_dict
+from ..serializers import JSONBytesResponse
+from typing import List, Optional
+import datetime
+
+router = APIRouter(prefix="/api/revenue", tags=["revenue"])
+
+MAX_DAYS = 366
+
+def revenue_range(start: Optional[datetime.date] = None, end: Optional[datetime.date] = None):
+    """[start, end] in Nairobi days; defaults to the last 7 days including today."""
+    end = end or revenue_day()
+    start = start or end - datetime.timedelta(days=6)
+    if start > end or (end - start).days >= MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"start must be on or before end, at most {MAX_DAYS} days apart")
+    return start, end
+
+# Answered from revenue_daily only; payments are never scanned
+@router.get("/matatu/{matatu_id}", response_model=List[schemas.RevenueDay])
+def read_matatu_revenue(matatu_id: int, days=Depends(revenue_range), db: Session = Depends(get_read_db)):
+    rows = db.execute(daily_query(*days, matatu_id=matatu_id)).all()
+    return JSONBytesResponse([revenue_dict(row) for row in rows])
+
+@router.get("/fleet/{fleet_id}", response_model=List[schemas.RevenueDay])
+def read_fleet_revenue(fleet_id: int, days=Depends(revenue_range), by_matatu: bool = Query(False, alias="byMatatu"),
+                       db: Session = Depends(get_read_db)):
+    rows = db.execute(daily_query(*days, fleet_id=fleet_id, by_matatu=by_matatu)).all()
+    return JSONBytesResponse([revenue_dict(row) for row in rows])
@@ -1,25 +1,40 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from .. import crud, schemas, auth
-from ..database import get_db
+from ..database import get_db, get_read_db
+from ..pagination import Page, set_next_cursor
+from ..principals import Principal
+from ..passwords import hasher, PasswordQueueFull
+from .auth import busy_exception
 from typing import List
+from dataclasses import asdict
 
 router = APIRouter(prefix="/api/users", tags=["users"])
 
 @router.post("/", response_model=schemas.UserOut)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_email(db, email=user.email)
+async def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    db_user = await run_in_threadpool(crud.get_user_by_email, db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return crud.create_user(db=db, user=user)
+    try:
+        hashed_password = await hasher.hash(user.password)
+    except PasswordQueueFull:
+        raise busy_exception()
+    return await run_in_threadpool(crud.create_user, db=db, user=user, hashed_password=hashed_password)
 
 @router.get("/", response_model=List[schemas.UserOut])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    users = crud.get_users(db, skip=skip, limit=limit)
+def read_users(response: Response, page: Page = Depends(), db: Session = Depends(get_read_db)):
+    users = crud.get_users(db, skip=page.skip, limit=page.limit, after_id=page.after_id)
+    set_next_cursor(response, page, users)
     return users
 
+@router.get("/me", response_model=schemas.UserOut)
+def read_current_user(current_user: Principal = Depends(auth.get_current_user)):
+    return asdict(current_user)
+
 @router.get("/{user_id}", response_model=schemas.UserOut)
-def read_user(user_id: int, db: Session = Depends(get_db)):
+def read_user(user_id: int, db: Session = Depends(get_read_db)):
     db_user = crud.get_user(db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
@@ -1,5 +1,6 @@
-from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
+from typing import Any, Optional, List
+from enum import Enum
 import datetime
 
 class UserBase(BaseModel):
@@ -61,7 +62,12 @@ class MatatuBase(BaseModel):
         orm_mode = True
 
 class MatatuCreate(MatatuBase):
-    pass
+    # Stops between routeStart and routeEnd, in order
+    stops: List[str] = []
+
+class MatatuRouteUpdate(BaseModel):
+    # Every stop from start to end, in order
+    stops: List[str]
 
 class MatatuOut(MatatuBase):
     matatuId: str
@@ -78,6 +84,7 @@ class MatatuOut(MatatuBase):
     routeEnd: Optional[str] = None
     stops: List[str] = []
     fleetname: Optional[str] = None
+    currentFare: Optional["FareOut"] = None
 
     @classmethod
     def from_orm(cls, obj):
@@ -107,6 +114,59 @@ class MatatuOut(MatatuBase):
         allow_population_by_field_name = True
         from_attributes = True
 
+class PositionFix(BaseModel):
+    matatuId: int
+    lat: float = Field(..., ge=-90, le=90)
+    lon: float = Field(..., ge=-180, le=180)
+    heading: Optional[float] = None
+    speed: Optional[float] = None
+    # Device time of the fix; the time of receipt when missing
+    recordedAt: Optional[datetime.datetime] = None
+
+class PositionBatch(BaseModel):
+    positions: List[PositionFix]
+
+class PositionAck(BaseModel):
+    accepted: int
+
+class VehiclePosition(BaseModel):
+    matatuId: int
+    lat: float
+    lon: float
+    heading: Optional[float] = None
+    speed: Optional[float] = None
+    recordedAt: datetime.datetime
+    distanceM: Optional[float] = None
+
+class RouteMatatu(BaseModel):
+    matatuId: str
+    registrationNumber: str
+
+class RouteMatch(BaseModel):
+    routeId: int
+    name: str
+    origin: str
+    destination: Optional[str] = None
+    stops: List[str]
+    matatus: List[RouteMatatu]
+
+class StopMatch(BaseModel):
+    stopId: int
+    name: str
+    routes: int
+
+class MatatuBulkResult(BaseModel):
+    index: int
+    registrationNumber: Optional[str] = None
+    status: str
+    matatuId: Optional[str] = None
+    reason: Optional[str] = None
+
+class MatatuBulkReport(BaseModel):
+    accepted: int
+    rejected: int
+    results: List[MatatuBulkResult]
+
 from pydantic import BaseModel, Field
 from typing import Optional
 
@@ -151,6 +211,55 @@ class FareOut(BaseModel):
         from_attributes = True
         allow_population_by_field_name = True
 
+MatatuOut.model_rebuild()
+
+class Weather(str, Enum):
+    dry = "dry"
+    rainy = "rainy"
+
+class FareQuote(BaseModel):
+    matatu_id: int = Field(..., alias="matatuId")
+    fare_id: int = Field(..., alias="fareId")
+    fare_type: str = Field(..., alias="fareType")
+    is_peak: bool = Field(..., alias="isPeak")
+    is_rainy: bool = Field(..., alias="isRainy")
+    quoted_at: datetime.datetime = Field(..., alias="quotedAt")
+    base_fare: float = Field(..., alias="baseFare")
+    discount: float = 0.0
+    fare: float
+
+    class Config:
+        allow_population_by_field_name = True
+
+class DynamicFareQuote(BaseModel):
+    matatu_id: int = Field(..., alias="matatuId")
+    fare_id: int = Field(..., alias="fareId")
+    is_peak: bool = Field(..., alias="isPeak")
+    rain: float
+    demand: float
+    priced_at: datetime.datetime = Field(..., alias="pricedAt")
+    base_fare: float = Field(..., alias="baseFare")
+    discount: float = 0.0
+    fare: float
+
+    class Config:
+        allow_population_by_field_name = True
+
+class FareQuoteBatchRequest(BaseModel):
+    matatu_ids: Optional[List[int]] = Field(None, alias="matatuIds")
+    fleet_id: Optional[int] = Field(None, alias="fleetId")
+    operator_id: Optional[str] = Field(None, alias="operatorId")
+    time: Optional[datetime.datetime] = None
+    weather: Weather = Weather.dry
+    disabled: bool = False
+
+    class Config:
+        allow_population_by_field_name = True
+
+class FareQuoteBatch(BaseModel):
+    quotes: List[FareQuote] = []
+    missing: List[int] = []
+
 
 # --- PAYMENT MODELS ---
 class PaymentBase(BaseModel):
@@ -165,13 +274,55 @@ class PaymentBase(BaseModel):
     payment_method: Optional[str] = Field(None, alias="paymentMethod")
     phone_number: Optional[str] = Field(None, alias="phoneNumber")
     fleet_id: Optional[int] = Field(None, alias="fleetId")
+    checkout_request_id: Optional[str] = Field(None, alias="checkoutRequestId")
 
 class PaymentCreate(PaymentBase):
     pass
 
+class PaymentAck(BaseModel):
+    idempotencyKey: str
+    status: str = "queued"
+
 class PaymentOut(PaymentBase):
     id: int
     timestamp: datetime.datetime
-    class Config:
-        orm_mode = True
-        from_attributes = True
\ No newline at end of file
+    # ORM rows have user_id/matatu_id attributes, not the camelCase aliases
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+
+class PaymentRecordOut(PaymentOut):
+    # Any stored payment: those recorded from an M-Pesa receipt alone have no user/matatu yet
+    user_id: Optional[int] = Field(None, alias="userId")
+    matatu_id: Optional[int] = Field(None, alias="matatuId")
+
+# --- M-PESA CALLBACK (Daraja STK push result) ---
+class MpesaCallbackItem(BaseModel):
+    Name: str
+    Value: Optional[Any] = None
+
+class MpesaCallbackMetadata(BaseModel):
+    Item: List[MpesaCallbackItem] = []
+
+class MpesaStkCallback(BaseModel):
+    MerchantRequestID: Optional[str] = None
+    CheckoutRequestID: str
+    ResultCode: int
+    ResultDesc: Optional[str] = None
+    CallbackMetadata: Optional[MpesaCallbackMetadata] = None
+
+    def metadata(self) -> dict:
+        items = self.CallbackMetadata.Item if self.CallbackMetadata else []
+        return {item.Name: item.Value for item in items}
+
+class MpesaCallbackBody(BaseModel):
+    stkCallback: MpesaStkCallback
+
+class MpesaCallback(BaseModel):
+    Body: MpesaCallbackBody
+
+# --- REVENUE (daily rollups) ---
+class RevenueDay(BaseModel):
+    date: datetime.date
+    paymentMethod: Optional[str] = None
+    matatuId: Optional[int] = None
+    amount: float
+    payments: int
@@ -0,0 +1,94 @@
+import json
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from . import models
+from .route_search import route_index
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is used instead
+    orjson = None
+
+# Fast path for list endpoints: select only the columns a response needs,
+# build the camelCase dicts straight from the row tuples and return
+# pre-encoded JSON. Returning a Response skips FastAPI's response_model
+# validation, so every row is converted exactly once.
+
+FLEET_COLUMNS = (models.Fleet.id, models.Fleet.name, models.Fleet.operator_id)
+
+MATATU_COLUMNS = (
+    models.Matatu.id,
+    models.Matatu.registration_number,
+    models.Matatu.fleet_id,
+    models.Matatu.pochi_number,
+    models.Matatu.paybill_number,
+    models.Matatu.till_number,
+    models.Matatu.account_number,
+    models.Matatu.send_money_phone,
+    models.Matatu.mpesa_option,
+    models.Matatu.route_start,
+    models.Matatu.route_end,
+    models.Matatu.route_id,
+    models.Matatu.operator_id,
+    models.Fleet.name,
+)
+
+FARE_COLUMNS = (
+    models.Fare.id,
+    models.Fare.matatu_id,
+    models.Fare.peak_fare,
+    models.Fare.non_peak_fare,
+    models.Fare.rainy_peak_fare,
+    models.Fare.rainy_non_peak_fare,
+    models.Fare.disability_discount,
+)
+
+# Same keys and value types as FleetOut/MatatuOut/FareOut
+def fleet_dict(row) -> dict:
+    id_, name, operator_id = row
+    return {"fleetId": str(id_), "name": name, "operatorId": operator_id}
+
+def matatu_dict(row, fare=None) -> dict:
+    (id_, registration_number, fleet_id, pochi_number, paybill_number, till_number,
+     account_number, send_money_phone, mpesa_option, route_start, route_end, route_id, operator_id, fleet_name) = row
+    return {
+        "registrationNumber": registration_number,
+        "fleetId": str(fleet_id) if fleet_id is not None else None,
+        "pochiNumber": pochi_number,
+        "paybillNumber": paybill_number,
+        "tillNumber": till_number,
+        "accountNumber": account_number,
+        "sendMoneyPhone": send_money_phone,
+        "mpesaOption": mpesa_option,
+        "routeStart": route_start,
+        "routeEnd": route_end,
+        "matatuId": str(id_),
+        "operatorId": operator_id,
+        "stops": route_index.stop_names(route_id),
+        "fleetname": fleet_name,
+        "currentFare": fare_dict(fare) if fare is not None else None,
+    }
+
+def fare_dict(row) -> dict:
+    id_, matatu_id, peak_fare, non_peak_fare, rainy_peak_fare, rainy_non_peak_fare, disability_discount = row
+    return {
+        "fareId": id_,
+        "matatuId": matatu_id,
+        "peakFare": peak_fare,
+        "nonPeakFare": non_peak_fare,
+        "rainyPeakFare": rainy_peak_fare,
+        "rainyNonPeakFare": rainy_non_peak_fare,
+        "disabilityDiscount": disability_discount,
+    }
+
+def dumps(content) -> bytes:
+    # Anything that is not plain JSON (pydantic models, enums) goes through jsonable_encoder
+    if orjson is not None:
+        return orjson.dumps(content, default=jsonable_encoder)
+    return json.dumps(content, default=jsonable_encoder, separators=(",", ":")).encode()
+
+class JSONBytesResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return content if isinstance(content, bytes) else dumps(content)
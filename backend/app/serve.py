@@ -0,0 +1,37 @@
+import argparse
+import os
+import tempfile
+import uvicorn
+from . import shared_state
+from .config import settings
+
+# Multi-worker runner: python -m app.serve --workers 8. Workers share the
+# fare table (one memory-mapped snapshot instead of a copy each) and the
+# generation counters that tell them when the fare table, route index,
+# principal cache and response cache namespaces changed in another worker.
+# Surge demand, login throttling and the latest vehicle positions are kept in
+# the same directory.
+
+def default_state_dir(port: int) -> str:
+    # tmpfs where available, so snapshots never hit the disk
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, f"matatu-{port}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API with several worker processes sharing in-memory state")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--state-dir", default=settings.shared_state_dir, help="default /dev/shm/matatu-<port>")
+    args = parser.parse_args()
+
+    state_dir = args.state_dir or default_state_dir(args.port)
+    # Files from a previous run would hand the new workers stale snapshots
+    shared_state.reset(state_dir)
+    # Workers read their settings from the environment they inherit
+    os.environ["SHARED_STATE_DIR"] = state_dir
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+    uvicorn.run("app.main:app", host=args.host, port=args.port, workers=args.workers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import contextlib
+import fcntl
+import mmap
+import os
+import struct
+import zlib
+from .config import settings
+
+# Multi-worker mode (python -m app.serve sets SHARED_STATE_DIR): workers on
+# one box share hot read-only data through files in this directory,
+# ideally on tmpfs (/dev/shm). A writer publishes a new snapshot and bumps
+# a named generation counter; readers compare the counter with the
+# generation they hold and reload when it moved. Unset, every worker keeps
+# its own state as before.
+SHARED_STATE_DIR = settings.shared_state_dir
+GENERATION_SLOTS = 512
+_COUNTER = struct.Struct("=q")
+
+class Generations:
+    """Named 64-bit counters in one memory-mapped file.
+
+    Names hash into a fixed number of slots; two names sharing a slot only
+    cause an extra reload. Reads are a single unpack from the mapping; bumps
+    take a file lock.
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._map = self.map("generations", GENERATION_SLOTS * _COUNTER.size)
+
+    @staticmethod
+    def _offset(name: str) -> int:
+        return zlib.crc32(name.encode()) % GENERATION_SLOTS * _COUNTER.size
+
+    def get(self, name: str) -> int:
+        return _COUNTER.unpack_from(self._map, self._offset(name))[0]
+
+    def bump(self, name: str) -> int:
+        with self.lock("generations"):
+            value = self.get(name) + 1
+            _COUNTER.pack_into(self._map, self._offset(name), value)
+        return value
+
+    def map(self, name: str, size: int) -> mmap.mmap:
+        """Writable mapping of `size` bytes shared by every worker; zero-filled when first created."""
+        fd = os.open(os.path.join(self.directory, name), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            with self.lock(name):
+                if os.fstat(fd).st_size < size:
+                    os.ftruncate(fd, size)
+            return mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    @contextlib.contextmanager
+    def lock(self, name: str):
+        """Exclusive across processes and threads (each caller opens its own descriptor)."""
+        fd = os.open(os.path.join(self.directory, f"{name}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+def write_atomic(path: str, chunks):
+    """Replace `path` with `chunks`; readers that mapped the old file keep it."""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(temporary, path)
+
+def map_file(path: str):
+    """Read-only mapping of `path`, or None if it does not exist yet."""
+    try:
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        return None
+
+def reset(directory: str):
+    """Remove the files this module and its users create, before workers start."""
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name == "generations" or name.endswith((".lock", ".snapshot", ".counters", ".table", ".tmp")):
+            os.remove(os.path.join(directory, name))
+
+generations = Generations(SHARED_STATE_DIR) if SHARED_STATE_DIR else None
@@ -0,0 +1,254 @@
+import collections
+import logging
+import threading
+import time
+import numpy as np
+from sqlalchemy import select
+from . import models, shared_state
+from .database import SessionLocal
+from .fare_engine import NON_PEAK, PEAK, RAINY_NON_PEAK, RAINY_PEAK, fare_table, is_peak, to_local
+from .config import settings
+
+logger = logging.getLogger("surge")
+
+# Demand-based pricing. Every SURGE_INTERVAL seconds all matatus with a fare
+# are repriced in one vectorized pass from three signals: recent payments on
+# their route, peak hours and rain. The stored Fare price points bound the
+# result: dry fares move from non-peak towards peak, rainy ones from rainy
+# non-peak towards rainy peak, and nothing leaves the [cheapest, dearest]
+# range of the four. With SHARED_STATE_DIR set every worker counts into the
+# same demand window; without it demand is counted per process.
+SURGE_INTERVAL = settings.surge_interval
+SURGE_WINDOW = settings.surge_window
+SURGE_BUCKET = 10
+# Payments per matatu on a route within the window that count as full demand
+SURGE_DEMAND_TARGET = settings.surge_demand_target
+# Columns of the shared demand window; matatu ids that many apart share a count
+SURGE_DEMAND_SLOTS = 8192
+SURGE_ROUTE_REFRESH = settings.surge_route_refresh
+# Rain intensity 0..1 used until a real weather feed is injected
+SURGE_RAIN = settings.surge_rain
+
+class DemandWindow:
+    """Payments per matatu over the last `window` seconds, in `bucket` second slots."""
+
+    def __init__(self, window: int = SURGE_WINDOW, bucket: int = SURGE_BUCKET, clock=time.monotonic):
+        self.bucket = bucket
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._slots = collections.deque([(0, collections.Counter())], maxlen=max(window // bucket, 1))
+        self._totals = collections.Counter()
+
+    def _advance(self):
+        slot = int(self.clock() // self.bucket)
+        if self._slots[-1][0] == slot:
+            return self._slots[-1][1]
+        oldest = slot - self._slots.maxlen
+        while self._slots and self._slots[0][0] <= oldest:
+            self._totals.subtract(self._slots.popleft()[1])
+        if len(self._slots) == self._slots.maxlen:
+            self._totals.subtract(self._slots.popleft()[1])
+        counts = collections.Counter()
+        self._slots.append((slot, counts))
+        return counts
+
+    def record(self, matatu_ids):
+        matatu_ids = [matatu_id for matatu_id in matatu_ids if matatu_id is not None]
+        if not matatu_ids:
+            return
+        with self._lock:
+            self._advance().update(matatu_ids)
+            self._totals.update(matatu_ids)
+
+    def counts(self, matatu_ids) -> np.ndarray:
+        with self._lock:
+            self._advance()
+            totals = self._totals
+            return np.fromiter((totals[matatu_id] for matatu_id in matatu_ids), dtype=np.float64, count=len(matatu_ids))
+
+class SharedDemandWindow:
+    """DemandWindow kept in the shared-state directory, so payments taken by any worker count.
+
+    A ring of rows, one per `bucket` second slot: the slot number followed by
+    a count per matatu id modulo SURGE_DEMAND_SLOTS. A row is cleared when the
+    ring comes back round to it. Writers take a file lock; readers sum the
+    rows still inside the window without one.
+    """
+
+    def __init__(self, state: shared_state.Generations, window: int = SURGE_WINDOW,
+                 bucket: int = SURGE_BUCKET, clock=time.monotonic):
+        self.bucket = bucket
+        self.clock = clock
+        self.state = state
+        rows, width = max(window // bucket, 1), SURGE_DEMAND_SLOTS + 1
+        self._map = state.map("demand.counters", rows * width * 8)
+        self._rows = np.frombuffer(self._map, dtype=np.int64).reshape(rows, width)
+
+    def record(self, matatu_ids):
+        columns = [matatu_id % SURGE_DEMAND_SLOTS + 1 for matatu_id in matatu_ids if matatu_id is not None]
+        if not columns:
+            return
+        slot = int(self.clock() // self.bucket)
+        with self.state.lock("demand"):
+            row = self._rows[slot % len(self._rows)]
+            if row[0] != slot:
+                row[1:] = 0
+                row[0] = slot
+            np.add.at(row, columns, 1)
+
+    def counts(self, matatu_ids) -> np.ndarray:
+        slot = int(self.clock() // self.bucket)
+        slots = self._rows[:, 0]
+        live = self._rows[(slots > slot - len(self._rows)) & (slots <= slot)]
+        columns = np.fromiter((matatu_id % SURGE_DEMAND_SLOTS + 1 for matatu_id in matatu_ids),
+                              dtype=np.int64, count=len(matatu_ids))
+        return live[:, columns].sum(axis=0, dtype=np.float64)
+
+class StaticWeather:
+    """Fixed rain intensity (0 dry .. 1 heavy rain); swap in a live feed with the same rain() method."""
+
+    def __init__(self, rain: float = SURGE_RAIN):
+        self.value = rain
+
+    def rain(self) -> float:
+        return self.value
+
+def price(prices: np.ndarray, demand: np.ndarray, peak: bool, rain: float) -> tuple:
+    """Vectorized fares for an (n, 4) price-point matrix; returns (fares, pressure)."""
+    rain = min(max(rain, 0.0), 1.0)
+    low = prices[:, NON_PEAK] + (prices[:, RAINY_NON_PEAK] - prices[:, NON_PEAK]) * rain
+    high = prices[:, PEAK] + (prices[:, RAINY_PEAK] - prices[:, PEAK]) * rain
+    pressure = np.clip(demand / SURGE_DEMAND_TARGET, 0.0, 1.0)
+    # Peak hours always charge the peak price; off peak, demand moves the fare towards it
+    fares = np.rint(high if peak else low + (high - low) * pressure)
+    return np.clip(fares, prices.min(axis=1), prices.max(axis=1)), pressure
+
+class SurgeEngine:
+    """Reprices every matatu with a fare on a background thread.
+
+    Readers take the last published snapshot without locking; a tick builds
+    a new one from the fare table, the demand window and the weather source
+    and swaps it in whole.
+    """
+
+    def __init__(self, session_factory, demand, weather=None, interval: float = SURGE_INTERVAL):
+        self.session_factory = session_factory
+        self.demand = demand
+        self.weather = weather or StaticWeather()
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._routes = {}
+        self._routes_loaded = 0.0
+        # (index, fare_ids, fares, pressure, discounts, priced_at, peak, rain)
+        self._state = None
+        self.ticks = 0
+        self.last_tick_ms = 0.0
+        self.overruns = 0
+
+    def load_routes(self):
+        db = self.session_factory()
+        try:
+            rows = db.execute(select(models.Matatu.id, models.Matatu.route_start, models.Matatu.route_end)).all()
+        finally:
+            db.close()
+        # Matatus without a route form a route of their own
+        self._routes = {
+            matatu_id: (start, end) if start or end else matatu_id
+            for matatu_id, start, end in rows
+        }
+        self._routes_loaded = time.monotonic()
+
+    def route_demand(self, matatu_ids, counts: np.ndarray) -> np.ndarray:
+        """Mean payments per matatu on each matatu's route."""
+        keys = {}
+        routes = np.fromiter(
+            (keys.setdefault(self._routes.get(matatu_id, matatu_id), len(keys)) for matatu_id in matatu_ids),
+            dtype=np.int64, count=len(matatu_ids),
+        )
+        totals = np.bincount(routes, weights=counts, minlength=len(keys))
+        sizes = np.bincount(routes, minlength=len(keys))
+        return (totals / np.maximum(sizes, 1))[routes]
+
+    def tick(self, when=None):
+        started = time.perf_counter()
+        if time.monotonic() - self._routes_loaded >= SURGE_ROUTE_REFRESH:
+            self.load_routes()
+        matatu_ids, rows, fare_ids, prices, discounts = fare_table.snapshot()
+        rows = np.frombuffer(rows, dtype=np.int64)
+        local = to_local(when)
+        peak, rain = is_peak(local), self.weather.rain()
+        demand = self.route_demand(matatu_ids, self.demand.counts(matatu_ids))
+        fares, pressure = price(np.frombuffer(prices).reshape(-1, 4)[rows], demand, peak, rain)
+        self._state = (
+            {matatu_id: i for i, matatu_id in enumerate(matatu_ids)},
+            np.frombuffer(fare_ids, dtype=np.int64)[rows],
+            fares,
+            pressure,
+            np.frombuffer(discounts)[rows],
+            local,
+            peak,
+            rain,
+        )
+        self.ticks += 1
+        self.last_tick_ms = (time.perf_counter() - started) * 1000
+        if self.last_tick_ms > self.interval * 1000:
+            self.overruns += 1
+            logger.warning("Surge tick took %.0f ms for %d matatus", self.last_tick_ms, len(matatu_ids))
+
+    def quote(self, matatu_id: int, disabled: bool = False):
+        state = self._state
+        if state is None:
+            return None
+        index, fare_ids, fares, pressure, discounts, priced_at, peak, rain = state
+        i = index.get(matatu_id)
+        if i is None:
+            return None
+        base_fare = float(fares[i])
+        discount = base_fare * float(discounts[i]) if disabled else 0.0
+        return {
+            "matatuId": matatu_id,
+            "fareId": int(fare_ids[i]),
+            "isPeak": peak,
+            "rain": rain,
+            "demand": float(pressure[i]),
+            "pricedAt": priced_at,
+            "baseFare": base_fare,
+            "discount": discount,
+            "fare": max(base_fare - discount, 0.0),
+        }
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self.tick()
+        self._thread = threading.Thread(target=self._run, name="surge-pricing", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def stats(self) -> dict:
+        state = self._state
+        return {
+            "matatus": len(state[0]) if state else 0,
+            "ticks": self.ticks,
+            "lastTickMs": round(self.last_tick_ms, 3),
+            "overruns": self.overruns,
+            "intervalSeconds": self.interval,
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("Surge tick failed")
+
+demand = SharedDemandWindow(shared_state.generations) if shared_state.generations else DemandWindow()
+surge_engine = SurgeEngine(SessionLocal, demand)
@@ -0,0 +1,58 @@
+"""Shared pieces of the benchmark suite: the default database, timing summaries and result files.
+
+Import this before anything from app/, so DATABASE_URL is set first.
+"""
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+
+# seed, micro and load share this database unless DATABASE_URL points elsewhere
+DEFAULT_DATABASE_URL = "sqlite:///./bench.db"
+os.environ.setdefault("DATABASE_URL", DEFAULT_DATABASE_URL)
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+def percentile(ordered, fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def summarize(timings_ms) -> dict:
+    ordered = sorted(timings_ms)
+    return {
+        "count": len(ordered),
+        "meanMs": round(sum(ordered) / len(ordered), 4) if ordered else 0.0,
+        "p50Ms": round(percentile(ordered, 0.50), 4),
+        "p99Ms": round(percentile(ordered, 0.99), 4),
+        "maxMs": round(ordered[-1], 4) if ordered else 0.0,
+    }
+
+def environment() -> dict:
+    url = os.environ["DATABASE_URL"]
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "database": url.split(":", 1)[0],
+        "dbAsync": os.getenv("DB_ASYNC", "0"),
+    }
+
+def write_results(name: str, results: dict, output: str = None) -> str:
+    """Write results plus run metadata to `output` (default results/<name>-<UTC time>.json)."""
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        output = os.path.join(RESULTS_DIR, f"{name}-{stamp}.json")
+    payload = {"benchmark": name, "ranAt": datetime.datetime.utcnow().isoformat() + "Z", "environment": environment(), **results}
+    with open(output, "w") as f:
+        json.dump(payload, f, indent=2)
+    print(f"Results written to {output}", file=sys.stderr)
+    return output
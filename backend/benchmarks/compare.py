@@ -0,0 +1,46 @@
+"""Compare two benchmark result files and flag timings that got slower.
+
+    python -m benchmarks.compare results/micro-before.json results/micro-after.json [--threshold 0.2]
+
+Every timing (keys ending in Ms) present in both files is compared; exits
+non-zero when one grew by more than --threshold (a fraction) and by more
+than --min-ms, so sub-millisecond noise does not fail a run.
+"""
+import argparse
+import json
+import sys
+
+def timings(results, prefix: str = "") -> dict:
+    found = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            found.update(timings(value, name + "."))
+        elif key.endswith("Ms") and isinstance(value, (int, float)):
+            found[name] = float(value)
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--min-ms", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = timings(json.load(f))
+    with open(args.candidate) as f:
+        candidate = timings(json.load(f))
+    regressions = 0
+    for name in sorted(baseline.keys() & candidate.keys()):
+        before, after = baseline[name], candidate[name]
+        change = (after - before) / before if before else 0.0
+        slower = change > args.threshold and after - before > args.min_ms
+        regressions += slower
+        print(f"{'SLOWER' if slower else '':6} {name:60} {before:10.3f} -> {after:10.3f} ms  {change:+7.1%}")
+    if regressions:
+        sys.exit(f"{regressions} timings regressed by more than {args.threshold:.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Run EXPLAIN on the queries issued by app/crud.py and flag sequential scans.
+
+    python -m benchmarks.explain_queries [--payments 20000]
+
+Each crud read (and the M-Pesa settle UPDATE) is executed against a seeded
+database while the SQL it sends is captured; every captured statement is
+then explained. On PostgreSQL the plans are taken with enable_seqscan off,
+so a remaining Seq Scan means no index can serve the filter at all.
+Unfiltered paged lists are expected to scan and are reported but not
+failed. Exits non-zero when an unexpected scan is found.
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "explain.db")
+
+from contextlib import contextmanager
+from sqlalchemy import event, func, select
+from app import crud, models, revenue, schemas
+from app.database import Base, SessionLocal, engine
+from app.fare_engine import latest_fare_ids
+
+START = datetime.datetime(2025, 1, 1)
+
+def seed(db, payments: int):
+    if db.scalar(select(func.count()).select_from(models.Payment)):
+        return
+    rng = random.Random(7)
+    db.execute(models.User.__table__.insert(), [
+        {"name": f"User {i}", "email": f"user{i}@example.com", "hashed_password": "x", "role": "user"} for i in range(500)
+    ])
+    db.execute(models.Fleet.__table__.insert(), [{"name": f"Fleet {i}", "operator_id": f"op{i % 10}"} for i in range(50)])
+    db.execute(models.Matatu.__table__.insert(), [
+        {"registration_number": f"KXX{i:04d}", "fleet_id": i % 50 + 1, "operator_id": f"op{i % 10}"} for i in range(1000)
+    ])
+    db.execute(models.Fare.__table__.insert(), [
+        {"matatu_id": i % 1000 + 1, "peak_fare": 100.0, "non_peak_fare": 70.0, "rainy_peak_fare": 120.0,
+         "rainy_non_peak_fare": 90.0, "disability_discount": 0.1} for i in range(3000)
+    ])
+    db.execute(models.Payment.__table__.insert(), [{
+        "user_id": rng.randint(1, 500),
+        "matatu_id": rng.randint(1, 1000),
+        "fleet_id": rng.randint(1, 50),
+        "amount": 80.0,
+        "status": rng.choice(("completed", "completed", "completed", "failed", "pending")),
+        "timestamp": START + datetime.timedelta(minutes=i),
+        "payment_method": "mpesa",
+        "idempotency_key": f"key-{i}",
+        "checkout_request_id": f"ws_CO_{i}",
+    } for i in range(payments)])
+    db.commit()
+    if engine.dialect.name == "postgresql":
+        db.connection().exec_driver_sql("ANALYZE")
+        db.commit()
+
+def day(n: int):
+    return START + datetime.timedelta(days=n)
+
+# (label, call, scan expected) - a scan is fine for unfiltered LIMIT-ed pages
+CALLS = (
+    ("get_user_by_email", lambda db: crud.get_user_by_email(db, "user42@example.com"), False),
+    ("get_user", lambda db: crud.get_user(db, 42), False),
+    ("get_users", lambda db: crud.get_users(db, limit=50), True),
+    ("get_users after", lambda db: crud.get_users(db, limit=50, after_id=200), False),
+    ("get_fleet", lambda db: crud.get_fleet(db, 7), False),
+    ("get_fleet_rows operator", lambda db: crud.get_fleet_rows(db, operator_id="op3"), False),
+    ("fleet_has_matatus", lambda db: crud.fleet_has_matatus(db, 7), False),
+    ("get_matatu", lambda db: crud.get_matatu(db, 7), False),
+    ("get_matatu_by_registration", lambda db: crud.get_matatu_by_registration(db, "KXX0042"), False),
+    ("get_matatu_ids fleet", lambda db: crud.get_matatu_ids(db, fleet_id=7), False),
+    ("get_matatu_rows operator", lambda db: crud.get_matatu_rows(db, operator_id="op3"), False),
+    ("get_matatus", lambda db: crud.get_matatus(db, limit=50), True),
+    ("get_current_fares", lambda db: crud.get_current_fares(db, list(range(1, 51))), False),
+    ("get_fares_for_matatu", lambda db: crud.get_fares_for_matatu(db, 7), False),
+    ("get_fare_rows matatu", lambda db: crud.get_fare_rows(db, matatu_id=7), False),
+    ("get_fares", lambda db: crud.get_fares(db, limit=50), True),
+    ("fare_table refresh", lambda db: db.execute(select(models.Fare).where(models.Fare.id.in_(latest_fare_ids([7, 8])))).all(), False),
+    ("get_payments_for_user", lambda db: crud.get_payments_for_user(db, 42), False),
+    ("get_payment_by_idempotency_key", lambda db: crud.get_payment_by_idempotency_key(db, "key-42"), False),
+    ("get_payments", lambda db: crud.get_payments(db, limit=50), True),
+    ("iter_payments day", lambda db: [p for p in crud.iter_payments(db, start=day(3), end=day(4))], False),
+    ("iter_payments matatu", lambda db: [p for p in crud.iter_payments(db, start=day(1), end=day(8), matatu_id=7)], False),
+    ("iter_payments fleet", lambda db: [p for p in crud.iter_payments(db, start=day(1), end=day(8), fleet_id=7)], False),
+    ("iter_payments pending", lambda db: [p for p in crud.iter_payments(db, status="pending", start=day(1), end=day(2))], False),
+    ("revenue matatu", lambda db: db.execute(revenue.daily_query(day(0).date(), day(7).date(), matatu_id=7)).all(), False),
+    ("revenue fleet", lambda db: db.execute(revenue.daily_query(day(0).date(), day(7).date(), fleet_id=7, by_matatu=True)).all(), False),
+    ("mpesa settle", lambda db: db.execute(crud.mpesa_settle_statement(
+        schemas.MpesaStkCallback(MerchantRequestID="m", CheckoutRequestID="ws_CO_42", ResultCode=1, ResultDesc="x"))), False),
+)
+
+@contextmanager
+def capture():
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+def scans(connection, statement, parameters):
+    """Tables read by a full scan in the statement's plan."""
+    if connection.dialect.name == "postgresql":
+        plan = connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+        found = []
+        def walk(node):
+            if node.get("Node Type") == "Seq Scan":
+                found.append(node["Relation Name"])
+            for child in node.get("Plans", ()):
+                walk(child)
+        walk((plan if isinstance(plan, list) else json.loads(plan))[0]["Plan"])
+        return found
+    rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+    # "SCAN payments" is a table scan; "SCAN payments USING INDEX ..." walks an index in order
+    return [row[3].split()[1] for row in rows if row[3].startswith("SCAN ") and " USING " not in row[3]]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--payments", type=int, default=20000)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    unexpected = 0
+    try:
+        seed(db, args.payments)
+        for label, call, scan_expected in CALLS:
+            with capture() as statements:
+                call(db)
+            db.rollback()
+            connection = db.connection()
+            if connection.dialect.name == "postgresql":
+                connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+            tables = sorted({table for statement, parameters in statements for table in scans(connection, statement, parameters)})
+            db.rollback()
+            if not tables:
+                status = "ok  "
+            elif scan_expected:
+                status = "page"
+            else:
+                status = "SCAN"
+                unexpected += 1
+            print(f"{status} {label:<32} {', '.join(tables)}")
+    finally:
+        db.close()
+    sys.exit(1 if unexpected else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Rush-hour HTTP load test: fare quotes, route searches, logins and payments.
+
+    python -m benchmarks.load [--url http://localhost:8000 --concurrency 50 --duration 30]
+
+Without --url the app runs in-process (startup and shutdown included)
+against DATABASE_URL, with the per-IP login limit lifted since every
+request comes from one client. With --url, point it at a server whose
+database was filled by benchmarks.seed and start that server with a high
+LOGIN_MAX_ATTEMPTS_PER_IP, or logins will show up as 429s.
+
+Requests follow SCENARIO's weights from --concurrency closed-loop clients.
+Reports p50/p99 and errors per request type plus overall throughput, and
+saves them as JSON. Needs httpx.
+"""
+import argparse
+import asyncio
+import collections
+import os
+import random
+import time
+
+from benchmarks.common import summarize, write_results
+
+# Settings are read once, when app/ is first imported (benchmarks.seed does);
+# only the in-process app is affected
+os.environ.setdefault("LOGIN_MAX_ATTEMPTS_PER_IP", "1000000000")
+
+from benchmarks.seed import PASSWORD, STOPS
+
+import httpx
+
+# (name, weight): a morning peak is mostly riders checking fares and paying
+SCENARIO = (
+    ("fareQuote", 40),
+    ("dynamicQuote", 15),
+    ("routeSearch", 10),
+    ("login", 5),
+    ("payment", 10),
+    ("paymentIngest", 20),
+)
+
+def build_request(name: str, rng, users: int, matatus: int):
+    """(method, path, keyword arguments for httpx) for one request of type `name`."""
+    if name == "fareQuote":
+        return "GET", "/api/fares/quote", {"params": {"matatuId": rng.randint(1, matatus), "weather": rng.choice(("dry", "rainy"))}}
+    if name == "dynamicQuote":
+        return "GET", "/api/fares/dynamic", {"params": {"matatuId": rng.randint(1, matatus)}}
+    if name == "routeSearch":
+        origin, destination = rng.sample(STOPS, 2)
+        return "GET", "/api/routes/search", {"params": {"from": origin[:rng.randint(3, len(origin))], "to": destination}}
+    if name == "login":
+        return "POST", "/api/auth/token", {"data": {"username": f"user{rng.randint(1, users)}@example.com", "password": PASSWORD}}
+    payment = {
+        "userId": rng.randint(1, users), "matatuId": rng.randint(1, matatus), "amount": float(rng.choice((50, 70, 100))),
+        "status": "completed", "paymentMethod": rng.choice(("mpesa", "cash")),
+    }
+    if name == "payment":
+        return "POST", "/api/payments/", {"json": payment}
+    return "POST", "/api/payments/ingest", {"json": payment}
+
+async def client_loop(client, deadline: float, rng, users: int, matatus: int, timings, statuses):
+    names = [name for name, _ in SCENARIO]
+    weights = [weight for _, weight in SCENARIO]
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        method, path, kwargs = build_request(name, rng, users, matatus)
+        start = time.perf_counter()
+        try:
+            status = (await client.request(method, path, **kwargs)).status_code
+        except httpx.HTTPError as exc:
+            status = type(exc).__name__
+        timings[name].append((time.perf_counter() - start) * 1000)
+        statuses[name][str(status)] += 1
+
+async def run(client, concurrency: int, duration: float, users: int, matatus: int, seed: int) -> dict:
+    timings = collections.defaultdict(list)
+    statuses = collections.defaultdict(collections.Counter)
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(
+        client_loop(client, deadline, random.Random(seed + i), users, matatus, timings, statuses) for i in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - started
+    requests = {}
+    for name, _ in SCENARIO:
+        errors = sum(count for status, count in statuses[name].items() if not status.startswith("2"))
+        requests[name] = {**summarize(timings[name]), "errors": errors, "statuses": dict(statuses[name])}
+    total = sum(len(values) for values in timings.values())
+    return {
+        "concurrency": concurrency,
+        "durationS": round(elapsed, 2),
+        "requests": total,
+        "throughputRps": round(total / elapsed, 1),
+        "errors": sum(entry["errors"] for entry in requests.values()),
+        "overall": summarize([value for values in timings.values() for value in values]),
+        "byRequest": requests,
+    }
+
+async def run_in_process(args) -> dict:
+    from app.main import app
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            return await run(client, args.concurrency, args.duration, args.users, args.matatus, args.seed)
+
+async def run_remote(args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+        return await run(client, args.concurrency, args.duration, args.users, args.matatus, args.seed)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="base URL of a running server (default: run the app in-process)")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--users", type=int, default=5000, help="as passed to benchmarks.seed")
+    parser.add_argument("--matatus", type=int, default=5000, help="as passed to benchmarks.seed")
+    parser.add_argument("--seed", type=int, default=21)
+    parser.add_argument("--output", help="result file (default benchmarks/results/load-<time>.json)")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_remote(args) if args.url else run_in_process(args))
+    print(f"{results['requests']} requests in {results['durationS']} s: {results['throughputRps']} req/s, {results['errors']} errors")
+    for name, entry in results["byRequest"].items():
+        print(f"{name:15} {entry['count']:7}  p50 {entry['p50Ms']:8.2f} ms  p99 {entry['p99Ms']:8.2f} ms  errors {entry['errors']}")
+    write_results("load", {"target": args.url or "in-process", "scenario": dict(SCENARIO), **results}, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Micro-benchmarks for the crud functions and schema conversions on the hot paths.
+
+    python -m benchmarks.micro [--iterations 200 --output results.json]
+
+Run against a database filled by benchmarks.seed (same DATABASE_URL). Each
+case is timed per call; p50/p99 per case are printed and saved as JSON.
+Writes are confined to insert_payments_batch; its pending rows and their
+idempotency keys are deleted again at the end.
+"""
+import argparse
+import datetime
+import random
+import sys
+import time
+import uuid
+
+from benchmarks.common import summarize, write_results
+
+from sqlalchemy import delete, func, select
+from app import crud, models, schemas
+from app.database import SessionLocal, engine
+from app.fare_engine import fare_table
+from app.serializers import fare_dict, matatu_dict
+
+BENCH_ROUTE = "benchmarks.micro"
+
+def cases(db, rng, inserted_keys: list):
+    users = db.scalar(select(func.max(models.User.id)))
+    matatus = db.scalar(select(func.max(models.Matatu.id)))
+    operators = [row[0] for row in db.execute(select(models.Matatu.operator_id).distinct())]
+    latest = db.scalar(select(func.max(models.Payment.timestamp)))
+    matatu = db.get(models.Matatu, 1)
+    matatu.stops = []
+    fare = db.scalar(select(models.Fare).limit(1))
+    payment = db.scalar(select(models.Payment).limit(1))
+    fare_rows = crud.get_fare_rows(db, limit=100)
+    matatu_rows = crud.get_matatu_rows(db, limit=100)
+    current = crud.get_current_fares(db, [row.id for row in matatu_rows])
+
+    def insert_batch():
+        rows = [{
+            "idempotency_key": uuid.uuid4().hex, "user_id": rng.randint(1, users), "matatu_id": rng.randint(1, matatus),
+            "amount": 70.0, "status": "pending", "route": BENCH_ROUTE, "timestamp": datetime.datetime.utcnow(),
+        } for _ in range(100)]
+        inserted_keys.extend(row["idempotency_key"] for row in rows)
+        crud.insert_payments_batch(db, rows)
+
+    def one_day():
+        start = latest - datetime.timedelta(days=1)
+        return sum(len(partition) for partition in crud.iter_payments(db, start=start, end=latest, matatu_id=rng.randint(1, matatus)))
+
+    return {
+        "crud.get_user_by_email": lambda: crud.get_user_by_email(db, f"user{rng.randint(1, users)}@example.com"),
+        "crud.get_matatu_rows(matatu_id)": lambda: crud.get_matatu_rows(db, matatu_id=rng.randint(1, matatus)),
+        "crud.get_matatu_rows(operator_id)": lambda: crud.get_matatu_rows(db, operator_id=rng.choice(operators)),
+        "crud.get_current_fares(100)": lambda: crud.get_current_fares(db, rng.sample(range(1, matatus + 1), 100)),
+        "crud.get_fare_rows(100)": lambda: crud.get_fare_rows(db, limit=100, after_id=rng.randint(0, matatus)),
+        "crud.get_payments_for_user(30 days)": lambda: crud.get_payments_for_user(
+            db, rng.randint(1, users), since=latest - datetime.timedelta(days=30)
+        ),
+        "crud.iter_payments(1 day, matatu)": one_day,
+        "crud.insert_payments_batch(100)": insert_batch,
+        "schemas.MatatuOut.from_orm": lambda: schemas.MatatuOut.from_orm(matatu),
+        "schemas.FareOut.from_orm": lambda: schemas.FareOut.from_orm(fare),
+        "schemas.PaymentOut.from_orm": lambda: schemas.PaymentOut.from_orm(payment),
+        "serializers.matatu_dict(100)": lambda: [matatu_dict(row, current.get(row.id)) for row in matatu_rows],
+        "serializers.fare_dict(100)": lambda: [fare_dict(row) for row in fare_rows],
+        "fare_table.quote": lambda: fare_table.quote(rng.randint(1, matatus)),
+    }
+
+def run(fn, iterations: int) -> list:
+    fn()
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=21)
+    parser.add_argument("--only", help="run the cases whose name contains this")
+    parser.add_argument("--output", help="result file (default benchmarks/results/micro-<time>.json)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if not db.scalar(select(func.count()).select_from(models.Payment)):
+            sys.exit("No payments found; seed first with python -m benchmarks.seed")
+        fare_table.load_from_db(db)
+        results, inserted_keys = {}, []
+        for name, fn in cases(db, random.Random(args.seed), inserted_keys).items():
+            if args.only and args.only not in name:
+                continue
+            results[name] = summarize(run(fn, args.iterations))
+            db.rollback()
+            print(f"{name:40} p50 {results[name]['p50Ms']:9.3f} ms   p99 {results[name]['p99Ms']:9.3f} ms")
+        db.execute(delete(models.Payment).where(models.Payment.route == BENCH_ROUTE))
+        for offset in range(0, len(inserted_keys), 1000):
+            db.execute(delete(models.PaymentKey).where(
+                models.PaymentKey.kind == crud.IDEMPOTENCY_KEY, models.PaymentKey.value.in_(inserted_keys[offset:offset + 1000])
+            ))
+        db.commit()
+    finally:
+        db.close()
+    write_results("micro", {"iterations": args.iterations, "dialect": engine.dialect.name, "cases": results}, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Load the live position index like a rush-hour fleet and time nearest-vehicle queries.
+
+    python -m benchmarks.positions [--vehicles 5000 --rounds 20] [--shared]
+
+Each round moves every vehicle once (one update_many call per 500 fixes,
+like batched device reports), then runs nearest queries around Nairobi and
+checks them against a brute-force scan. --shared measures the memory-mapped
+index the workers of python -m app.serve share instead.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "positions.db")
+
+from app.positions import PositionIndex, SharedPositionIndex, distance_m
+from app.shared_state import Generations
+
+CENTER = (-1.2864, 36.8172)
+SPREAD = 0.15
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vehicles", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--shared", action="store_true")
+    args = parser.parse_args()
+
+    rng = random.Random(20)
+    index = SharedPositionIndex(Generations(tempfile.mkdtemp())) if args.shared else PositionIndex()
+    vehicles = {i: (CENTER[0] + rng.uniform(-SPREAD, SPREAD), CENTER[1] + rng.uniform(-SPREAD, SPREAD)) for i in range(1, args.vehicles + 1)}
+    update_time = 0.0
+    for _ in range(args.rounds):
+        now = time.time()
+        for matatu_id, (lat, lon) in vehicles.items():
+            vehicles[matatu_id] = (lat + rng.uniform(-0.0005, 0.0005), lon + rng.uniform(-0.0005, 0.0005))
+        fixes = [(matatu_id, lat, lon, None, None, now) for matatu_id, (lat, lon) in vehicles.items()]
+        started = time.perf_counter()
+        for offset in range(0, len(fixes), 500):
+            index.update_many(fixes[offset:offset + 500])
+        update_time += time.perf_counter() - started
+
+    timings, mismatches = [], 0
+    for _ in range(args.queries):
+        lat, lon = CENTER[0] + rng.uniform(-SPREAD, SPREAD), CENTER[1] + rng.uniform(-SPREAD, SPREAD)
+        started = time.perf_counter()
+        found = [p["matatuId"] for p in index.nearest(lat, lon, limit=10, radius_m=2000)]
+        timings.append((time.perf_counter() - started) * 1000)
+        expected = sorted((distance_m(lat, lon, *position), matatu_id) for matatu_id, position in vehicles.items())
+        mismatches += found != [matatu_id for distance, matatu_id in expected if distance <= 2000][:10]
+    timings.sort()
+    print(json.dumps({
+        "vehicles": len(index),
+        "fixesPerSecond": round(args.vehicles * args.rounds / update_time),
+        "nearestP50Ms": round(timings[len(timings) // 2], 3),
+        "nearestP99Ms": round(timings[int(len(timings) * 0.99) - 1], 3),
+        "mismatches": mismatches,
+    }))
+
+if __name__ == "__main__":
+    main()
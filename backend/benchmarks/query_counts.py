@@ -0,0 +1,85 @@
+"""Fail when a list endpoint's query count grows with the number of rows.
+
+    python -m benchmarks.query_counts
+
+Each endpoint is called for a small and a large operator; the number of SQL
+statements must be the same for both. Exits non-zero on an N+1 regression.
+"""
+import os
+import sys
+import tempfile
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "queries.db")
+
+from contextlib import contextmanager
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from app import models
+from app.database import DB_ASYNC, Base, SessionLocal, async_engine, engine
+from app.main import app
+
+SIZES = {"small": 3, "large": 30}
+
+ENDPOINTS = (
+    "/api/matatus/?limit={limit}",
+    "/api/matatus/operator/{operator}",
+    "/api/fleets/operator/{operator}",
+    "/api/fares/?limit={limit}",
+)
+
+@contextmanager
+def count_queries():
+    counted = []
+    target = async_engine.sync_engine if DB_ASYNC else engine
+    def before_cursor_execute(conn, cursor, statement, *args):
+        counted.append(statement)
+    event.listen(target, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield counted
+    finally:
+        event.remove(target, "before_cursor_execute", before_cursor_execute)
+
+def seed() -> dict:
+    """Operators of SIZES matatus, each in its own fleet; returns {operator: fleet id}."""
+    fleets = {}
+    db = SessionLocal()
+    try:
+        for operator, size in SIZES.items():
+            fleet = models.Fleet(name=f"{operator} fleet", operator_id=operator)
+            db.add(fleet)
+            db.flush()
+            fleets[operator] = fleet.id
+            for i in range(size):
+                matatu = models.Matatu(registration_number=f"{operator}-{i}", fleet_id=fleet.id, operator_id=operator)
+                db.add(matatu)
+                db.flush()
+                # Two fares each so "current fare" has to pick the latest
+                for price in (50.0, 70.0):
+                    db.add(models.Fare(matatu_id=matatu.id, peak_fare=price, non_peak_fare=price,
+                                       rainy_peak_fare=price, rainy_non_peak_fare=price, disability_discount=0.0))
+        db.commit()
+    finally:
+        db.close()
+    return fleets
+
+def main():
+    failures = 0
+    Base.metadata.create_all(bind=engine)
+    with TestClient(app) as client:
+        seed()
+        for endpoint in ENDPOINTS:
+            counts = {}
+            for operator, size in SIZES.items():
+                url = endpoint.format(operator=operator, limit=size)
+                with count_queries() as counted:
+                    response = client.get(url)
+                response.raise_for_status()
+                counts[operator] = len(counted)
+            ok = len(set(counts.values())) == 1
+            failures += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {endpoint}: {counts}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
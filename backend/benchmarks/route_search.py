@@ -0,0 +1,97 @@
+"""Time origin-destination searches against the in-memory route index.
+
+    python -m benchmarks.route_search [--stops 3000 --routes 800 --matatus 10000]
+
+Seeds stops, routes and matatus, loads the index the way the app does at
+startup and runs prefix, exact and misspelt searches. Exits non-zero when
+the 99th percentile exceeds --budget-ms.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "routes.db")
+
+from sqlalchemy import func, select
+from app import models
+from app.database import Base, SessionLocal, engine
+from app.route_search import RouteIndex, stop_key
+
+SYLLABLES = ("ka", "ng", "mo", "ri", "ta", "we", "lu", "ki", "sa", "ma", "ni", "go", "ra", "be", "to", "ya")
+
+def seed(db, stops: int, routes: int, matatus: int, rng):
+    if db.scalar(select(func.count()).select_from(models.Route)):
+        return
+    names = set()
+    while len(names) < stops:
+        names.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).title()
+                  + rng.choice(("", " Stage", " Market", " Junction")))
+    names = sorted(names)
+    db.execute(models.Stop.__table__.insert(), [{"id": i + 1, "name": name, "key": stop_key(name)} for i, name in enumerate(names)])
+    route_stops, signatures = [], []
+    for route_id in range(1, routes + 1):
+        path = rng.sample(range(1, stops + 1), rng.randint(8, 25))
+        signatures.append({"id": route_id, "name": f"{names[path[0] - 1]} - {names[path[-1] - 1]}",
+                           "signature": ",".join(map(str, path))})
+        route_stops.extend({"route_id": route_id, "position": position, "stop_id": stop_id} for position, stop_id in enumerate(path))
+    db.execute(models.Route.__table__.insert(), signatures)
+    db.execute(models.RouteStop.__table__.insert(), route_stops)
+    db.execute(models.Matatu.__table__.insert(), [
+        {"registration_number": f"KRS{i:05d}", "operator_id": "bench", "route_id": rng.randint(1, routes)} for i in range(matatus)
+    ])
+    db.commit()
+
+def queries(names, count: int, rng):
+    def typo(name):
+        i = rng.randrange(len(name))
+        return name[:i] + name[i + 1:]
+    shapes = (lambda n: n, lambda n: n[:3], lambda n: n.lower()[:5], typo)
+    return [(rng.choice(shapes)(rng.choice(names)), rng.choice(shapes)(rng.choice(names)) if rng.random() < 0.8 else None)
+            for _ in range(count)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stops", type=int, default=3000)
+    parser.add_argument("--routes", type=int, default=800)
+    parser.add_argument("--matatus", type=int, default=10000)
+    parser.add_argument("--searches", type=int, default=2000)
+    parser.add_argument("--budget-ms", type=float, default=10.0)
+    args = parser.parse_args()
+
+    rng = random.Random(19)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        seed(db, args.stops, args.routes, args.matatus, rng)
+        index = RouteIndex()
+        started = time.perf_counter()
+        index.load(db)
+        load_ms = (time.perf_counter() - started) * 1000
+        names = list(db.scalars(select(models.Stop.name)))
+    finally:
+        db.close()
+    timings, found = [], 0
+    for origin, destination in queries(names, args.searches, rng):
+        started = time.perf_counter()
+        found += bool(index.search(origin, destination))
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    print(json.dumps({
+        "routes": len(index),
+        "loadMs": round(load_ms, 1),
+        "searches": len(timings),
+        "withResults": found,
+        "p50Ms": round(timings[len(timings) // 2], 3),
+        "p99Ms": round(p99, 3),
+        "maxMs": round(timings[-1], 3),
+    }))
+    sys.exit(1 if p99 > args.budget_ms else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Compare the ORM + response_model path with the projection fast path.
+
+    python -m benchmarks.serialization --rows 5000
+
+Runs against a throwaway SQLite database unless DATABASE_URL is set.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from typing import List
+from fastapi.encoders import jsonable_encoder
+from pydantic import parse_obj_as
+from app import crud, models, schemas
+from app.database import Base, SessionLocal, engine
+from app.serializers import dumps, matatu_dict
+
+OPERATOR = "bench-operator"
+
+def seed(db, rows: int):
+    for fleet in db.query(models.Fleet).filter(models.Fleet.operator_id == OPERATOR):
+        db.query(models.Fare).filter(models.Fare.matatu.has(fleet_id=fleet.id)).delete(synchronize_session=False)
+        db.query(models.Matatu).filter(models.Matatu.fleet_id == fleet.id).delete()
+        db.delete(fleet)
+    fleet = models.Fleet(name="Bench", operator_id=OPERATOR)
+    db.add(fleet)
+    db.flush()
+    db.bulk_insert_mappings(models.Matatu, [{
+        "registration_number": f"KBN{i:05d}",
+        "fleet_id": fleet.id,
+        "operator_id": OPERATOR,
+        "paybill_number": "247247",
+        "account_number": f"ACC{i}",
+        "route_start": "CBD",
+        "route_end": "Rongai",
+    } for i in range(rows)])
+    ids = [id_ for (id_,) in db.query(models.Matatu.id).filter(models.Matatu.operator_id == OPERATOR)]
+    db.bulk_insert_mappings(models.Fare, [{
+        "matatu_id": matatu_id,
+        "peak_fare": 100.0,
+        "non_peak_fare": 70.0,
+        "rainy_peak_fare": 120.0,
+        "rainy_non_peak_fare": 90.0,
+        "disability_discount": 0.1,
+    } for matatu_id in ids])
+    db.commit()
+
+def orm_path(db) -> bytes:
+    # What the operator endpoint did: hydrate, from_orm, then FastAPI validates against response_model.
+    # Fleet name and current fare come from the lazy relationships, one query per row each.
+    matatus = db.query(models.Matatu).filter(models.Matatu.operator_id == OPERATOR).all()
+    content = []
+    for m in matatus:
+        out = schemas.MatatuOut.from_orm(m)
+        out.fleetname = m.fleet.name if m.fleet else None
+        out.currentFare = schemas.FareOut.from_orm(max(m.fares, key=lambda f: f.id)) if m.fares else None
+        content.append(out)
+    validated = parse_obj_as(List[schemas.MatatuOut], [m.dict(by_alias=True) for m in content])
+    return json.dumps(jsonable_encoder(validated, by_alias=True)).encode()
+
+def fast_path(db) -> bytes:
+    rows = crud.get_matatu_rows(db, operator_id=OPERATOR)
+    fares = crud.get_current_fares(db, [row.id for row in rows])
+    return dumps([matatu_dict(row, fares.get(row.id)) for row in rows])
+
+def timed(fn, db, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        db.expunge_all()
+        start = time.perf_counter()
+        body = fn(db)
+        best = min(best, time.perf_counter() - start)
+    return best, body
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        seed(db, args.rows)
+        orm_time, orm_body = timed(orm_path, db, args.repeat)
+        fast_time, fast_body = timed(fast_path, db, args.repeat)
+    finally:
+        db.close()
+    assert json.loads(orm_body) == json.loads(fast_body), "fast path output differs from MatatuOut"
+    print(json.dumps({
+        "rows": args.rows,
+        "ormMs": round(orm_time * 1000, 2),
+        "fastMs": round(fast_time * 1000, 2),
+        "speedup": round(orm_time / fast_time, 1),
+    }))
+
+if __name__ == "__main__":
+    main()
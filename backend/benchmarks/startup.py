@@ -0,0 +1,93 @@
+"""Measure worker cold start: import, startup (lifespan) and first request, each in a fresh interpreter.
+
+    python -m benchmarks.startup [--runs 10 --imports]
+
+Uses DATABASE_URL (default ./bench.db; run alembic upgrade head or
+benchmarks.seed against it first). spawnToReadyMs is what a new worker
+costs before it can take traffic: interpreter start, imports, the
+lifespan startup (fare table, route index, background threads) and one
+fare quote. --imports also lists the slowest imports of one run.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.common import summarize, write_results
+
+PHASES = ("importMs", "startupMs", "firstRequestMs", "spawnToReadyMs")
+
+def child():
+    import asyncio
+    import httpx
+
+    async def serve(app):
+        async with app.router.lifespan_context(app):
+            started = time.perf_counter()
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                await client.get("/api/fares/quote", params={"matatuId": 1})
+            return started, time.perf_counter()
+
+    start = time.perf_counter()
+    from app.main import app
+    imported = time.perf_counter()
+    started, served = asyncio.run(serve(app))
+    print(json.dumps({
+        "importMs": (imported - start) * 1000,
+        "startupMs": (started - imported) * 1000,
+        "firstRequestMs": (served - started) * 1000,
+    }), flush=True)
+
+def spawn(extra_args=()) -> tuple:
+    """Run one child; returns its phases, the ms until it reported them (before shutdown) and its stderr."""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, *extra_args, "-m", "benchmarks.startup", "--child"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    line = process.stdout.readline()
+    ready = (time.perf_counter() - start) * 1000
+    _, stderr = process.communicate()
+    if process.returncode or not line:
+        sys.exit(f"Startup run failed:\n{stderr}")
+    return json.loads(line), ready, stderr
+
+def slowest_imports(stderr: str, count: int = 15) -> list:
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name = (part.strip() for part in line.replace("import time:", "|").split("|"))
+        rows.append({"module": name, "selfMs": int(self_us) / 1000, "cumulativeMs": int(cumulative_us) / 1000})
+    return sorted(rows, key=lambda row: -row["cumulativeMs"])[:count]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--imports", action="store_true", help="also report the slowest imports")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="result file (default benchmarks/results/startup-<time>.json)")
+    args = parser.parse_args()
+    if args.child:
+        return child()
+
+    timings = {phase: [] for phase in PHASES}
+    for _ in range(args.runs):
+        phases, ready, _ = spawn()
+        phases["spawnToReadyMs"] = ready
+        for phase in PHASES:
+            timings[phase].append(phases[phase])
+    results = {"runs": args.runs, "phases": {phase: summarize(values) for phase, values in timings.items()}}
+    for phase, summary in results["phases"].items():
+        print(f"{phase:15} p50 {summary['p50Ms']:8.1f} ms   max {summary['maxMs']:8.1f} ms")
+    if args.imports:
+        results["slowestImports"] = slowest_imports(spawn(("-X", "importtime"))[2])
+        for row in results["slowestImports"]:
+            print(f"  {row['cumulativeMs']:8.1f} ms  {row['module']}")
+    write_results("startup", results, args.output)
+
+if __name__ == "__main__":
+    main()
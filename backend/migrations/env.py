@@ -18,7 +18,12 @@ if config.config_file_name is not None:
 # for 'autogenerate' support
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
-target_metadata = None
+from app.database import Base, SQLALCHEMY_DATABASE_URL
+from app import models  # noqa: F401 - registers the tables on Base.metadata
+
+# Same DATABASE_URL as the app; alembic.ini only holds a placeholder
+config.set_main_option("sqlalchemy.url", SQLALCHEMY_DATABASE_URL.replace("%", "%%"))
+target_metadata = Base.metadata
 
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
@@ -0,0 +1,108 @@
+"""Baseline schema (tables as created by Base.metadata.create_all)
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 09:00:00.000000
+
+Databases that were created by the app before migrations existed already
+have these tables: run `alembic stamp 0001` once, then `alembic upgrade head`.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('email', sa.String(), nullable=False),
+        sa.Column('hashed_password', sa.String(), nullable=False),
+        sa.Column('phone', sa.String(), nullable=True),
+        sa.Column('role', sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_users_id', 'users', ['id'])
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+
+    op.create_table(
+        'fleets',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('operator_id', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_fleets_id', 'fleets', ['id'])
+    op.create_index('ix_fleets_operator_id', 'fleets', ['operator_id'])
+
+    op.create_table(
+        'matatus',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('registration_number', sa.String(), nullable=False),
+        sa.Column('fleet_id', sa.Integer(), sa.ForeignKey('fleets.id'), nullable=True),
+        sa.Column('pochi_number', sa.String(), nullable=True),
+        sa.Column('paybill_number', sa.String(), nullable=True),
+        sa.Column('till_number', sa.String(), nullable=True),
+        sa.Column('account_number', sa.String(), nullable=True),
+        sa.Column('send_money_phone', sa.String(), nullable=True),
+        sa.Column('mpesa_option', sa.String(), nullable=True),
+        sa.Column('route_start', sa.String(), nullable=True),
+        sa.Column('route_end', sa.String(), nullable=True),
+        sa.Column('matatu_id', sa.String(), nullable=True),
+        sa.Column('operator_id', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_matatus_id', 'matatus', ['id'])
+    op.create_index('ix_matatus_registration_number', 'matatus', ['registration_number'], unique=True)
+    op.create_index('ix_matatus_operator_id', 'matatus', ['operator_id'])
+
+    op.create_table(
+        'fares',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('matatu_id', sa.Integer(), sa.ForeignKey('matatus.id'), nullable=True),
+        sa.Column('peak_fare', sa.Float(), nullable=False),
+        sa.Column('non_peak_fare', sa.Float(), nullable=False),
+        sa.Column('rainy_peak_fare', sa.Float(), nullable=False),
+        sa.Column('rainy_non_peak_fare', sa.Float(), nullable=False),
+        sa.Column('disability_discount', sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_fares_id', 'fares', ['id'])
+
+    op.create_table(
+        'payments',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+        sa.Column('matatu_id', sa.Integer(), sa.ForeignKey('matatus.id'), nullable=True),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.Column('route', sa.String(), nullable=True),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('start_location', sa.String(), nullable=True),
+        sa.Column('end_location', sa.String(), nullable=True),
+        sa.Column('mpesa_receipt_number', sa.String(), nullable=True),
+        sa.Column('payment_method', sa.String(), nullable=True),
+        sa.Column('phone_number', sa.String(), nullable=True),
+        sa.Column('fleet_id', sa.Integer(), sa.ForeignKey('fleets.id'), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_payments_id', 'payments', ['id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('payments')
+    op.drop_table('fares')
+    op.drop_table('matatus')
+    op.drop_table('fleets')
+    op.drop_table('users')
@@ -0,0 +1,36 @@
+"""Idempotency key on payments (batched ingestion)
+
+Revision ID: 0001a
+Revises: 0001
+Create Date: 2026-10-18 09:10:00.000000
+
+Databases created by the app while it still ran create_all at startup may
+already have the column and index; they are left as they are.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001a'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    if 'idempotency_key' not in {column['name'] for column in inspector.get_columns('payments')}:
+        op.add_column('payments', sa.Column('idempotency_key', sa.String(), nullable=True))
+    if 'ix_payments_idempotency_key' not in {index['name'] for index in inspector.get_indexes('payments')}:
+        op.create_index('ix_payments_idempotency_key', 'payments', ['idempotency_key'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_payments_idempotency_key', table_name='payments')
+    with op.batch_alter_table('payments') as batch:
+        batch.drop_column('idempotency_key')
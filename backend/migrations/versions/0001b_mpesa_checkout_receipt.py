@@ -0,0 +1,51 @@
+"""STK push checkout id on payments and unique M-Pesa receipts
+
+Revision ID: 0001b
+Revises: 0001a
+Create Date: 2026-10-18 09:20:00.000000
+
+Databases created by the app while it still ran create_all at startup may
+already have the column and indexes; they are left as they are. A receipt
+number stored on more than one payment stops the upgrade: settle those
+duplicates first.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001b'
+down_revision: Union[str, None] = '0001a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+DUPLICATE_RECEIPTS = (
+    "SELECT mpesa_receipt_number FROM payments WHERE mpesa_receipt_number IS NOT NULL "
+    "GROUP BY mpesa_receipt_number HAVING count(*) > 1 LIMIT 10"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    indexes = {index['name'] for index in inspector.get_indexes('payments')}
+    if 'checkout_request_id' not in {column['name'] for column in inspector.get_columns('payments')}:
+        op.add_column('payments', sa.Column('checkout_request_id', sa.String(), nullable=True))
+    if 'ix_payments_checkout_request_id' not in indexes:
+        op.create_index('ix_payments_checkout_request_id', 'payments', ['checkout_request_id'], unique=True)
+    if 'ix_payments_mpesa_receipt_number' not in indexes:
+        duplicates = [row[0] for row in op.get_bind().execute(sa.text(DUPLICATE_RECEIPTS))]
+        if duplicates:
+            raise RuntimeError(f"M-Pesa receipts stored on more than one payment: {', '.join(duplicates)}")
+        op.create_index('ix_payments_mpesa_receipt_number', 'payments', ['mpesa_receipt_number'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_payments_mpesa_receipt_number', table_name='payments')
+    op.drop_index('ix_payments_checkout_request_id', table_name='payments')
+    with op.batch_alter_table('payments') as batch:
+        batch.drop_column('checkout_request_id')
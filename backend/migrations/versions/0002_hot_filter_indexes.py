@@ -0,0 +1,46 @@
+"""Indexes for the hot payment, fare and matatu filters
+
+Revision ID: 0002
+Revises: 0001b
+Create Date: 2026-10-18 09:30:00.000000
+
+The composite indexes lead with the equality column and end with
+timestamp, so "payments of X between A and B" is a single range read and
+the plain user_id/matatu_id/fleet_id lookups use the same index prefix.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEXES = (
+    ('ix_matatus_fleet_id', 'matatus', ['fleet_id']),
+    ('ix_fares_matatu_id_id', 'fares', ['matatu_id', 'id']),
+    ('ix_payments_timestamp', 'payments', ['timestamp']),
+    ('ix_payments_user_id_timestamp', 'payments', ['user_id', 'timestamp']),
+    ('ix_payments_matatu_id_timestamp', 'payments', ['matatu_id', 'timestamp']),
+    ('ix_payments_fleet_id_timestamp', 'payments', ['fleet_id', 'timestamp']),
+    ('ix_payments_status_timestamp', 'payments', ['status', 'timestamp']),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY on PostgreSQL so payments keep being written while the indexes build
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
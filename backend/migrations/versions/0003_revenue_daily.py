@@ -0,0 +1,41 @@
+"""Daily revenue rollup table
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 11:00:00.000000
+
+Fill it for existing payments with
+`python -m app.revenue backfill --start <first day>`.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'revenue_daily',
+        sa.Column('matatu_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('fleet_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('payment_method', sa.String(), nullable=False),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.Column('payments', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('matatu_id', 'day', 'fleet_id', 'payment_method'),
+    )
+    op.create_index('ix_revenue_daily_fleet_id_day', 'revenue_daily', ['fleet_id', 'day'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_revenue_daily_fleet_id_day', table_name='revenue_daily')
+    op.drop_table('revenue_daily')
@@ -0,0 +1,128 @@
+"""Partition payments by month and move key uniqueness to payment_keys
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 13:00:00.000000
+
+On PostgreSQL payments becomes a table range-partitioned by month on
+timestamp, with primary key (id, timestamp) because a partitioned table's
+unique constraints must include the partition key. The rows are copied into
+the new table, so run it in a maintenance window. Further partitions are
+created by app/partitions.py. On other databases payments stays a single
+table. In both cases the unique indexes on M-Pesa receipt and idempotency
+key are replaced by rows in payment_keys.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+PARTITIONS_AHEAD = 3
+
+UNIQUE_INDEXES = (
+    ('ix_payments_mpesa_receipt_number', ['mpesa_receipt_number']),
+    ('ix_payments_idempotency_key', ['idempotency_key']),
+    ('ix_payments_checkout_request_id', ['checkout_request_id']),
+)
+
+INDEXES = (
+    ('ix_payments_id', ['id']),
+    ('ix_payments_timestamp', ['timestamp']),
+    ('ix_payments_user_id_timestamp', ['user_id', 'timestamp']),
+    ('ix_payments_matatu_id_timestamp', ['matatu_id', 'timestamp']),
+    ('ix_payments_fleet_id_timestamp', ['fleet_id', 'timestamp']),
+    ('ix_payments_status_timestamp', ['status', 'timestamp']),
+)
+
+FOREIGN_KEYS = (
+    ('payments_user_id_fkey', 'users', 'user_id'),
+    ('payments_matatu_id_fkey', 'matatus', 'matatu_id'),
+    ('payments_fleet_id_fkey', 'fleets', 'fleet_id'),
+)
+
+CREATE_PARTITIONS = f"""
+DO $$
+DECLARE
+    month date := date_trunc('month', coalesce((SELECT min("timestamp") FROM payments_unpartitioned), now() AT TIME ZONE 'utc'));
+    last date := date_trunc('month', now() AT TIME ZONE 'utc') + interval '{PARTITIONS_AHEAD} months';
+BEGIN
+    WHILE month <= last LOOP
+        EXECUTE format('CREATE TABLE %I PARTITION OF payments FOR VALUES FROM (%L) TO (%L)',
+                       'payments_' || to_char(month, 'YYYY_MM'), month, month + interval '1 month');
+        month := month + interval '1 month';
+    END LOOP;
+END $$
+"""
+
+
+def copy_table(source: str, primary_key: str, partitioned: bool) -> None:
+    op.execute(f'ALTER TABLE payments RENAME TO {source}')
+    for name, _ in INDEXES + UNIQUE_INDEXES:
+        op.execute(f'DROP INDEX IF EXISTS {name}')
+    # Constraint and index names are schema-wide, so free them for the new table
+    op.execute(f'ALTER TABLE {source} DROP CONSTRAINT payments_pkey')
+    op.execute(
+        f'CREATE TABLE payments (LIKE {source} INCLUDING DEFAULTS, PRIMARY KEY ({primary_key}))'
+        + (' PARTITION BY RANGE ("timestamp")' if partitioned else '')
+    )
+    if partitioned:
+        op.execute(CREATE_PARTITIONS)
+    op.execute(f'INSERT INTO payments SELECT * FROM {source}')
+    op.execute('ALTER SEQUENCE payments_id_seq OWNED BY payments.id')
+    op.execute(f'DROP TABLE {source} CASCADE')
+    for name, table, column in FOREIGN_KEYS:
+        op.create_foreign_key(name, 'payments', table, [column], ['id'])
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'payment_keys',
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('value', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('kind', 'value'),
+    )
+    op.execute(
+        "INSERT INTO payment_keys (kind, value) "
+        "SELECT 'receipt', mpesa_receipt_number FROM payments WHERE mpesa_receipt_number IS NOT NULL "
+        "UNION SELECT 'idempotency', idempotency_key FROM payments WHERE idempotency_key IS NOT NULL"
+    )
+    if op.get_context().dialect.name == 'postgresql':
+        op.execute("UPDATE payments SET \"timestamp\" = now() AT TIME ZONE 'utc' WHERE \"timestamp\" IS NULL")
+        op.alter_column('payments', 'timestamp', existing_type=sa.DateTime(), nullable=False)
+        copy_table('payments_unpartitioned', 'id, "timestamp"', partitioned=True)
+        for name, columns in INDEXES + UNIQUE_INDEXES:
+            op.create_index(name, 'payments', columns)
+        return
+    op.execute("UPDATE payments SET timestamp = CURRENT_TIMESTAMP WHERE timestamp IS NULL")
+    with op.batch_alter_table('payments') as batch:
+        batch.alter_column('timestamp', existing_type=sa.DateTime(), nullable=False)
+        for name, columns in UNIQUE_INDEXES:
+            batch.drop_index(name)
+            batch.create_index(name, columns)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_context().dialect.name == 'postgresql':
+        copy_table('payments_partitioned', 'id', partitioned=False)
+        for name, columns in INDEXES:
+            op.create_index(name, 'payments', columns)
+        for name, columns in UNIQUE_INDEXES:
+            op.create_index(name, 'payments', columns, unique=True)
+        op.alter_column('payments', 'timestamp', existing_type=sa.DateTime(), nullable=True)
+    else:
+        with op.batch_alter_table('payments') as batch:
+            batch.alter_column('timestamp', existing_type=sa.DateTime(), nullable=True)
+            for name, columns in UNIQUE_INDEXES:
+                batch.drop_index(name)
+                batch.create_index(name, columns, unique=True)
+    op.drop_table('payment_keys')
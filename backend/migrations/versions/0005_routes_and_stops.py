@@ -0,0 +1,66 @@
+"""Routes and stops
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 15:00:00.000000
+
+Give existing matatus a route from their routeStart/routeEnd with
+`python -m app.route_search backfill`.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'stops',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('key', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_stops_key', 'stops', ['key'], unique=True)
+    op.create_table(
+        'routes',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('signature', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_routes_signature', 'routes', ['signature'], unique=True)
+    op.create_table(
+        'route_stops',
+        sa.Column('route_id', sa.Integer(), sa.ForeignKey('routes.id'), nullable=False),
+        sa.Column('position', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('stop_id', sa.Integer(), sa.ForeignKey('stops.id'), nullable=False),
+        sa.PrimaryKeyConstraint('route_id', 'position'),
+    )
+    op.create_index('ix_route_stops_stop_id', 'route_stops', ['stop_id'])
+    with op.batch_alter_table('matatus') as batch:
+        batch.add_column(sa.Column('route_id', sa.Integer(), nullable=True))
+        batch.create_foreign_key('matatus_route_id_fkey', 'routes', ['route_id'], ['id'])
+        batch.create_index('ix_matatus_route_id', ['route_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('matatus') as batch:
+        batch.drop_index('ix_matatus_route_id')
+        batch.drop_constraint('matatus_route_id_fkey', type_='foreignkey')
+        batch.drop_column('route_id')
+    op.drop_index('ix_route_stops_stop_id', table_name='route_stops')
+    op.drop_table('route_stops')
+    op.drop_index('ix_routes_signature', table_name='routes')
+    op.drop_table('routes')
+    op.drop_index('ix_stops_key', table_name='stops')
+    op.drop_table('stops')
@@ -0,0 +1,20 @@
+import os
+import tempfile
+
+# Settings are read once, at the first import of app/; point them at a
+# throwaway database before any test module imports the app
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "tests.db")
+os.environ.pop("DATABASE_REPLICA_URLS", None)
+os.environ.pop("SHARED_STATE_DIR", None)
+
+import pytest
+from fastapi.testclient import TestClient
+
+@pytest.fixture(scope="session")
+def client():
+    from app.database import Base, engine
+    from app.main import app
+
+    Base.metadata.create_all(bind=engine)
+    with TestClient(app) as client:
+        yield client
@@ -0,0 +1,27 @@
+import time
+from starlette.requests import Request
+from app import cache
+from app.cache import LocalCache, ResponseCache
+from app.database import READ_PRIMARY_COOKIE
+
+def request(primary: bool = False) -> Request:
+    headers = [(b"cookie", f"{READ_PRIMARY_COOKIE}={time.time() + 60}".encode())] if primary else []
+    return Request({"type": "http", "method": "GET", "path": "/api/fleets/", "query_string": b"", "headers": headers})
+
+def test_replica_reads_are_not_cached_right_after_an_invalidation(monkeypatch):
+    responses = ResponseCache(LocalCache(), replicas=True)
+    responses.invalidate("fleets")
+    # A lagging replica still answers with the old list
+    assert responses.respond(request(), ("fleets",), lambda: ["old"]).body == b'["old"]'
+    assert responses.respond(request(), ("fleets",), lambda: ["new"]).body == b'["new"]'
+    assert responses.stats()["unsettled"] == 2
+
+    # The writer reads the primary: it skips the cache and its load is stored
+    assert responses.respond(request(primary=True), ("fleets",), lambda: ["newer"]).body == b'["newer"]'
+    assert responses.respond(request(), ("fleets",), lambda: ["stale"]).body == b'["newer"]'
+
+    monkeypatch.setattr(cache, "REPLICA_STICKY_SECONDS", 0)
+    responses.invalidate("fleets")
+    assert responses.respond(request(), ("fleets",), lambda: ["settled"]).body == b'["settled"]'
+    assert responses.respond(request(), ("fleets",), lambda: ["other"]).body == b'["settled"]'
+    assert responses.stats()["hits"] == 2
@@ -0,0 +1,45 @@
+import asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from app.database import ReadSession, ReplicaSet, create_instrumented_engine, pool_stats
+
+def replica_set(tmp_path, create):
+    down = create(f"sqlite:///{tmp_path}/missing/replica.db")
+    up = create(f"sqlite:///{tmp_path}/replica.db")
+    primary = create(f"sqlite:///{tmp_path}/primary.db")
+    return ReplicaSet([down, up], primary)
+
+def test_read_session_connects_on_first_query(tmp_path):
+    replicas = replica_set(tmp_path, create_instrumented_engine)
+    checkouts = pool_stats.checkouts
+    db = ReadSession(replicas)
+    db.close()
+    assert pool_stats.checkouts == checkouts and replicas.replica_reads == 0
+
+    for _ in range(2):
+        db = ReadSession(replicas)
+        try:
+            assert db.execute(text("select 1")).scalar() == 1
+            assert db.get_bind().engine is replicas.engines[1]
+        finally:
+            db.close()
+    assert replicas.stats() == {"replicas": 2, "down": 1, "replicaReads": 2, "primaryReads": 0}
+
+def test_async_read_session_connects_on_first_query(tmp_path):
+    replicas = replica_set(tmp_path, lambda url: create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://")).sync_engine)
+
+    async def read():
+        async with AsyncSession(sync_session_class=ReadSession, replica_set=replicas):
+            pass
+        assert replicas.replica_reads == 0
+        async with AsyncSession(sync_session_class=ReadSession, replica_set=replicas) as db:
+            return (await db.execute(text("select 1"))).scalar()
+
+    assert asyncio.run(read()) == 1
+    assert replicas.stats()["replicaReads"] == 1 and replicas.stats()["down"] == 1
+
+def test_memory_only_routes_take_no_connection(client):
+    checkouts = pool_stats.checkouts
+    assert client.get("/api/routes/search", params={"from": "town"}).status_code == 200
+    assert client.get("/api/routes/stops", params={"q": "town"}).status_code == 200
+    assert pool_stats.checkouts == checkouts
@@ -0,0 +1,78 @@
+import sys
+import threading
+import types
+from app.fare_engine import FARE_TABLE_SLACK, FareTable
+
+def fare(fare_id, matatu_id, price):
+    return types.SimpleNamespace(
+        id=fare_id, matatu_id=matatu_id, peak_fare=price, non_peak_fare=price,
+        rainy_peak_fare=price, rainy_non_peak_fare=price, disability_discount=0.1,
+    )
+
+def test_superseded_rows_are_compacted():
+    table = FareTable()
+    table.load([fare(1, 10, 50.0), fare(2, 20, 60.0)])
+    for fare_id in range(3, FARE_TABLE_SLACK + 10):
+        table.upsert(fare(fare_id, 10, float(fare_id)))
+    table.discard(20)
+    table.upsert(fare(FARE_TABLE_SLACK + 10, 30, 80.0))
+    _, _, fare_ids, prices, discounts = table.snapshot()
+    assert len(fare_ids) < 20 and len(prices) == 4 * len(fare_ids) and len(discounts) == len(fare_ids)
+    assert table.quote(10)["fareId"] == FARE_TABLE_SLACK + 9 and table.quote(10)["baseFare"] == FARE_TABLE_SLACK + 9
+    assert table.quote(30)["baseFare"] == 80.0 and table.quote(20) is None
+
+def test_quotes_stay_consistent_under_concurrent_updates():
+    # Every fare encodes its matatu and its own id in the price and the discount
+    def coded(fare_id, matatu_id):
+        coded_fare = fare(fare_id * 100 + matatu_id, matatu_id, float(fare_id * 100 + matatu_id))
+        coded_fare.disability_discount = coded_fare.id / 1e7
+        return coded_fare
+
+    table = FareTable()
+    table.load([coded(0, matatu_id) for matatu_id in range(40)])
+    stop, errors = threading.Event(), []
+
+    def write():
+        # Discarded matatus free rows while others keep being updated
+        for fare_id in range(1, 30000):
+            matatu_id = fare_id % 40
+            if fare_id % 3 == 0:
+                table.discard(matatu_id)
+            else:
+                table.upsert(coded(fare_id, matatu_id))
+        stop.set()
+
+    def read():
+        while not stop.is_set():
+            for matatu_id in range(40):
+                quote = table.quote(matatu_id, disabled=True)
+                if quote is None:
+                    continue
+                fare_id = quote["fareId"]
+                if fare_id % 100 != matatu_id or quote["baseFare"] != fare_id or quote["discount"] != fare_id * (fare_id / 1e7):
+                    errors.append(quote)
+
+    previous = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(previous)
+    assert errors == []
+    expected = {matatu_id: matatu_id for matatu_id in range(40)}
+    for fare_id in range(1, 30000):
+        if fare_id % 3 == 0:
+            expected.pop(fare_id % 40, None)
+        else:
+            expected[fare_id % 40] = fare_id * 100 + fare_id % 40
+    assert {m: q["fareId"] for m in range(40) if (q := table.quote(m))} == expected
+
+def test_upsert_keeps_newer_fare():
+    table = FareTable()
+    table.upsert(fare(5, 10, 70.0))
+    table.upsert(fare(4, 10, 40.0))
+    assert table.quote(10)["fareId"] == 5
@@ -0,0 +1,28 @@
+from benchmarks.query_counts import count_queries
+
+def test_matatu_list_is_cached_with_etag(client):
+    fleet = client.post("/api/fleets/", json={"name": "Cached", "operatorId": "cache-op"}).json()
+    client.post("/api/matatus/", json={"registrationNumber": "KCA 001", "fleetId": fleet["fleetId"], "operatorId": "cache-op"})
+    first = client.get("/api/matatus/?limit=50")
+    assert first.status_code == 200 and first.headers["etag"]
+
+    with count_queries() as counted:
+        again = client.get("/api/matatus/?limit=50")
+        not_modified = client.get("/api/matatus/?limit=50", headers={"If-None-Match": first.headers["etag"]})
+    assert counted == []
+    assert again.content == first.content and not_modified.status_code == 304
+
+    client.post("/api/matatus/", json={"registrationNumber": "KCA 002", "fleetId": fleet["fleetId"], "operatorId": "cache-op"})
+    changed = client.get("/api/matatus/?limit=50", headers={"If-None-Match": first.headers["etag"]})
+    assert changed.status_code == 200
+    assert "KCA 002" in {m["registrationNumber"] for m in changed.json()}
+
+def test_bulk_rejects_non_string_registration(client):
+    report = client.post("/api/matatus/bulk", json=[{"registrationNumber": 123}])
+    assert report.status_code == 200
+    assert report.json()["results"][0]["registrationNumber"] == "123" and report.json()["rejected"] == 1
+
+def test_bulk_csv_rejects_non_utf8(client):
+    upload = {"file": ("matatus.csv", b"registrationNumber,fleetId\n\xff\xfeKCB,1\n", "text/csv")}
+    response = client.post("/api/matatus/bulk/csv", files=upload)
+    assert response.status_code == 400
@@ -0,0 +1,25 @@
+import json
+import os
+from app.metrics import MetricsPublisher, render, request_seconds, requests_total
+
+def test_scraped_worker_sums_the_live_workers(tmp_path):
+    requests_total.inc(("GET", "/test/metrics", "200"))
+    request_seconds.observe(("GET", "/test/metrics"), 0.004)
+    publisher = MetricsPublisher(str(tmp_path), lambda: {"response_cache": {"hits": 3, "backend": "memory"}})
+    publisher.publish()
+    # Pose as two other workers: the parent process and one that has exited
+    published = json.loads(open(publisher.path).read())
+    assert published["gauges"] == {"response_cache": {"hits": 3}}
+    for pid in (os.getppid(), 999999999):
+        (tmp_path / f"metrics-{pid}.snapshot").write_text(json.dumps(dict(published, pid=pid)))
+    os.remove(publisher.path)
+
+    others = publisher.others()
+    assert [worker["pid"] for worker in others] == [os.getppid()]
+    lines = render({"response_cache": {"hits": 1}}, others).splitlines()
+    count = next(line for line in lines if line.startswith('http_requests_total{method="GET",route="/test/metrics",status="200"}'))
+    assert count.split()[-1] in ("2", "2.0")
+    assert any(line.startswith('http_request_duration_seconds_count{method="GET",route="/test/metrics"} 2') for line in lines)
+    assert f'response_cache{{stat="hits",worker="{os.getpid()}"}} 1' in lines
+    assert f'response_cache{{stat="hits",worker="{os.getppid()}"}} 3' in lines
+    assert 'response_cache{stat="hits"} 1' in render({"response_cache": {"hits": 1}}).splitlines()
@@ -0,0 +1,27 @@
+import os
+import subprocess
+import sys
+import sqlalchemy as sa
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def alembic(url, *args):
+    return subprocess.run(
+        [sys.executable, "-m", "alembic", *args], cwd=BACKEND, env=dict(os.environ, DATABASE_URL=url),
+        capture_output=True, text=True, check=True,
+    ).stdout
+
+def test_baseline_database_upgrades_to_the_models(tmp_path):
+    # 0001 is the schema the app's create_all produced before migrations existed
+    url = f"sqlite:///{tmp_path / 'legacy.db'}"
+    alembic(url, "upgrade", "0001")
+    engine = sa.create_engine(url)
+    assert "idempotency_key" not in {column["name"] for column in sa.inspect(engine).get_columns("payments")}
+    with engine.begin() as connection:
+        connection.execute(sa.text("INSERT INTO payments (amount, mpesa_receipt_number) VALUES (70, 'R1'), (50, NULL)"))
+
+    alembic(url, "upgrade", "head")
+    alembic(url, "check")
+    with engine.connect() as connection:
+        assert connection.execute(sa.text("SELECT count(*) FROM payments")).scalar() == 2
+        assert connection.execute(sa.text("SELECT kind, value FROM payment_keys")).all() == [("receipt", "R1")]
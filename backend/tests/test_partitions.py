@@ -0,0 +1,23 @@
+import datetime
+from app import crud, models
+from app.database import SessionLocal
+from app.partitions import prune_payment_keys
+
+def test_pruning_releases_only_the_archived_months_keys(client):
+    rows = [
+        dict(user_id=1, matatu_id=1, amount=70.0, status="completed", timestamp=timestamp,
+             mpesa_receipt_number=f"RCPT-{key}", idempotency_key=key)
+        for key, timestamp in (("old-1", datetime.datetime(2024, 3, 5)), ("old-2", datetime.datetime(2024, 3, 31, 23)),
+                               ("kept-1", datetime.datetime(2024, 4, 1)))
+    ]
+    db = SessionLocal()
+    try:
+        assert crud.insert_payments_batch(db, rows) == 3
+        assert prune_payment_keys(db, datetime.date(2024, 3, 1)) == 4
+        db.commit()
+        keys = db.query(models.PaymentKey.kind, models.PaymentKey.value).filter(
+            models.PaymentKey.value.in_(["old-1", "old-2", "kept-1", "RCPT-old-1", "RCPT-old-2", "RCPT-kept-1"])
+        ).all()
+        assert sorted(keys) == [("idempotency", "kept-1"), ("receipt", "RCPT-kept-1")]
+    finally:
+        db.close()
@@ -0,0 +1,92 @@
+import datetime
+import threading
+from sqlalchemy.exc import OperationalError
+from app import crud, models
+from app.database import SessionLocal
+from app.payment_ingest import PaymentIngestor, replay
+
+class DownDatabase:
+    """Session stand-in whose every statement fails."""
+
+    def execute(self, *args, **kwargs):
+        raise OperationalError("INSERT", {}, OSError("database is down"))
+
+    query = get_bind = execute
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+def test_failed_batch_is_dead_lettered_and_replayed(client, tmp_path):
+    ingestor = PaymentIngestor(DownDatabase, dead_letter_dir=str(tmp_path))
+    rows = [
+        dict(user_id=1, matatu_id=1, amount=70.0, status="completed", timestamp=datetime.datetime(2026, 10, 1, 7, 30), idempotency_key=f"dead-{i}")
+        for i in range(3)
+    ]
+    ingestor._flush(rows)
+    assert ingestor.stats()["deadLettered"] == 3
+    [path] = tmp_path.glob("payments-*.ndjson")
+
+    db = SessionLocal()
+    try:
+        assert replay(db, [str(path)]) == 3
+        stored = db.query(models.Payment).filter(models.Payment.idempotency_key.like("dead-%")).all()
+        assert sorted(p.idempotency_key for p in stored) == ["dead-0", "dead-1", "dead-2"]
+        assert stored[0].timestamp == datetime.datetime(2026, 10, 1, 7, 30)
+        # Replaying again stores nothing twice
+        path.with_suffix(".ndjson.replayed").rename(path)
+        assert replay(db, [str(path)]) == 0
+    finally:
+        db.close()
+
+def test_bad_row_is_dead_lettered_alone(client, tmp_path):
+    ingestor = PaymentIngestor(SessionLocal, dead_letter_dir=str(tmp_path))
+    rows = [
+        dict(user_id=1, matatu_id=1, amount=None if i == 5 else 70.0, status="completed",
+             timestamp=datetime.datetime(2026, 10, 1, 8, i), idempotency_key=f"split-{i}")
+        for i in range(8)
+    ]
+    ingestor._flush(rows)
+    assert ingestor.stats()["written"] == 7 and ingestor.stats()["deadLettered"] == 1
+    [path] = tmp_path.glob("payments-*.ndjson")
+    assert '"split-5"' in path.read_text() and path.read_text().count("\n") == 1
+
+def test_stop_keeps_a_writer_that_is_still_draining(tmp_path):
+    release = threading.Event()
+
+    class SlowDatabase(DownDatabase):
+        def get_bind(self, *args, **kwargs):
+            release.wait(5)
+            return super().get_bind(*args, **kwargs)
+
+    ingestor = PaymentIngestor(SlowDatabase, dead_letter_dir=str(tmp_path), flush_interval=0.01)
+    ingestor.start()
+    ingestor.submit(dict(user_id=1, matatu_id=1, amount=70.0, status="completed"), "slow-0")
+    writer = ingestor._thread
+    ingestor.stop(timeout=0.1)
+    assert ingestor._thread is writer and writer.is_alive()
+    release.set()
+    ingestor.start()
+    assert ingestor._thread is not writer and not writer.is_alive()
+    ingestor.stop()
+    assert ingestor._thread is None and ingestor.stats()["deadLettered"] == 1
+
+def test_ingest_skips_recorded_receipts(client):
+    payment = {"userId": 9, "matatuId": 1, "amount": 70.0, "status": "completed", "mpesaReceiptNumber": "RCPT-INGEST"}
+    assert client.post("/api/payments/", json=payment).status_code == 200
+    rows = [
+        dict(user_id=9, matatu_id=1, amount=70.0, status="completed", mpesa_receipt_number=receipt,
+             timestamp=datetime.datetime(2026, 10, 1, 9, 0), idempotency_key=f"receipt-{i}")
+        for i, receipt in enumerate(["RCPT-INGEST", "RCPT-NEW", "RCPT-NEW", None])
+    ]
+    db = SessionLocal()
+    try:
+        assert crud.insert_payments_batch(db, rows) == 2
+        stored = db.query(models.Payment).filter(models.Payment.idempotency_key.like("receipt-%")).all()
+        assert sorted(p.idempotency_key for p in stored) == ["receipt-1", "receipt-3"]
+        keys = db.query(models.PaymentKey.value).filter(models.PaymentKey.value.like("receipt-%")).all()
+        assert sorted(value for value, in keys) == ["receipt-1", "receipt-3"]
+    finally:
+        db.close()
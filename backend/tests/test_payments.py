@@ -0,0 +1,35 @@
+def receipt_callback(checkout_id, receipt):
+    return {"Body": {"stkCallback": {
+        "CheckoutRequestID": checkout_id, "ResultCode": 0,
+        "CallbackMetadata": {"Item": [{"Name": "MpesaReceiptNumber", "Value": receipt}, {"Name": "Amount", "Value": 70}]},
+    }}}
+
+def test_payment_responses_carry_user_and_matatu(client):
+    payment = {"userId": 7, "matatuId": 3, "amount": 70.0, "status": "completed", "paymentMethod": "cash"}
+    created = client.post("/api/payments/", json=payment)
+    assert created.status_code == 200, created.text
+    assert (created.json()["userId"], created.json()["matatuId"]) == (7, 3)
+
+    for_user = client.get("/api/payments/user/7").json()
+    assert [(p["userId"], p["matatuId"]) for p in for_user] == [(7, 3)]
+
+    key = client.post("/api/payments/ingest", json=payment, headers={"Idempotency-Key": "pay-7-3"}).json()["idempotencyKey"]
+    from app.payment_ingest import ingestor
+    ingestor.stop()
+    ingestor.start()
+    ingested = client.get(f"/api/payments/ingest/{key}")
+    assert ingested.status_code == 200, ingested.text
+    assert (ingested.json()["userId"], ingested.json()["matatuId"]) == (7, 3)
+
+def test_receipt_only_payment_is_listed_without_user(client):
+    assert client.post("/api/payments/mpesa/callback", json=receipt_callback("ws_CO_1", "RCPT1")).status_code == 200
+    listed = {p["mpesaReceiptNumber"]: p for p in client.get("/api/payments/").json()}
+    assert listed["RCPT1"]["userId"] is None and listed["RCPT1"]["matatuId"] is None
+    assert any(p["userId"] == 7 for p in listed.values() if p["mpesaReceiptNumber"] is None)
+
+def test_reused_receipt_is_a_conflict(client):
+    payment = {"userId": 8, "matatuId": 3, "amount": 70.0, "status": "completed", "mpesaReceiptNumber": "RCPT-DUP"}
+    assert client.post("/api/payments/", json=payment).status_code == 200
+    again = client.post("/api/payments/", json=payment)
+    assert again.status_code == 409
+    assert [p["mpesaReceiptNumber"] for p in client.get("/api/payments/user/8").json()] == ["RCPT-DUP"]
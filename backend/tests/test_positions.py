@@ -0,0 +1,36 @@
+from app.positions import POSITION_SHARED_SLOTS, PositionIndex, SharedPositionIndex
+from app.shared_state import Generations
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_future_fix_does_not_pin_the_position():
+    clock = Clock()
+    index = PositionIndex(ttl=60, clock=clock)
+    index.update_many([(7, -1.28, 36.82, None, None, clock.now + 86400)])
+    assert index.get(7)["lat"] == -1.28
+    clock.now += 5
+    index.update_many([(7, -1.30, 36.80, None, None, clock.now)])
+    assert index.get(7)["lat"] == -1.30
+    clock.now += 120
+    assert index.get(7) is None
+
+def test_shared_index_is_seen_by_every_worker(tmp_path):
+    clock = Clock()
+    state = Generations(str(tmp_path))
+    workers = [SharedPositionIndex(state, ttl=60, clock=clock) for _ in range(2)]
+    # 7 and its colliding id share a probe path
+    workers[0].update_many([(7, -1.28, 36.82, 90.0, None, clock.now + 86400), (7 + POSITION_SHARED_SLOTS, -1.2801, 36.82, None, 12.0, clock.now)])
+    clock.now += 5
+    workers[1].update_many([(8, -1.30, 36.80, None, None, clock.now)])
+    assert workers[1].get(7)["heading"] == 90.0 and workers[1].get(7)["speed"] is None
+    assert [p["matatuId"] for p in workers[1].nearest(-1.28, 36.82, radius_m=1000)] == [7, 7 + POSITION_SHARED_SLOTS]
+    assert [p["matatuId"] for p in workers[0].nearest(-1.28, 36.82, limit=1, accept=lambda m: m == 8, radius_m=5000)] == [8]
+    workers[0].update_many([(7, -1.29, 36.81, None, None, clock.now)])
+    assert workers[1].get(7)["lat"] == -1.29 and len(workers[1]) == 3
+    clock.now += 120
+    assert workers[0].get(7) is None and workers[1].nearest(-1.28, 36.82) == [] and len(workers[0]) == 0
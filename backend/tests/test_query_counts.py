@@ -0,0 +1,26 @@
+import pytest
+from benchmarks.query_counts import SIZES, count_queries, seed
+
+# SQL statements per request, whatever the number of rows: a change here is
+# either a deliberate new query or an N+1 regression
+EXPECTED = {
+    # Matatus with their fleet names, then every listed matatu's current fare
+    "/api/matatus/?limit={limit}": 2,
+    "/api/matatus/operator/{operator}": 2,
+    "/api/fleets/operator/{operator}": 1,
+    "/api/fleets/{fleet}": 1,
+}
+
+@pytest.fixture(scope="module")
+def seeded(client):
+    return seed()
+
+@pytest.mark.parametrize("endpoint", EXPECTED)
+def test_statement_count_is_fixed(client, seeded, endpoint):
+    counts = {}
+    for operator, size in SIZES.items():
+        with count_queries() as counted:
+            response = client.get(endpoint.format(operator=operator, limit=size, fleet=seeded[operator]))
+        assert response.status_code == 200, response.text
+        counts[operator] = len(counted)
+    assert counts == {operator: EXPECTED[endpoint] for operator in SIZES}
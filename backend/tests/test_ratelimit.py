@@ -0,0 +1,28 @@
+from app.ratelimit import SharedSlidingWindowLimiter
+from app.shared_state import Generations
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_shared_limit_holds_across_workers(tmp_path):
+    # Hits age out a tenth of the window (6 s) at a time
+    clock = Clock()
+    state = Generations(str(tmp_path))
+    workers = [SharedSlidingWindowLimiter(state, "login-accounts", 3, 60, clock=clock) for _ in range(2)]
+    for i in range(3):
+        assert workers[i % 2].retry_after("rider@example.com") == 0
+        workers[i % 2].hit("rider@example.com")
+        clock.now += 10
+    assert workers[0].retry_after("rider@example.com") == workers[1].retry_after("rider@example.com") == 26
+    assert workers[1].retry_after("other@example.com") == 0
+
+    clock.now += 30
+    assert workers[0].retry_after("rider@example.com") == 0
+    workers[1].hit("rider@example.com")
+    assert workers[0].retry_after("rider@example.com") == 8
+    workers[0].reset("rider@example.com")
+    assert workers[1].retry_after("rider@example.com") == 0
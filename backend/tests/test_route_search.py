@@ -0,0 +1,31 @@
+import threading
+from app.route_search import RouteIndex
+
+class SlowSession:
+    """Session stand-in whose queries wait for `release` and then return no rows."""
+
+    def __init__(self, release: threading.Event, opened: list):
+        self.release = release
+        opened.append(self)
+
+    def execute(self, *args, **kwargs):
+        self.release.wait(5)
+        return []
+
+    def close(self):
+        pass
+
+def test_stale_index_reloads_once_in_the_background():
+    release, opened = threading.Event(), []
+    index = RouteIndex(lambda: SlowSession(release, opened), max_age=0)
+    index._index.add_route(1, "Town - Ngong", [(1, "Town"), (2, "Ngong")])
+    index._index.set_matatu(7, "KAA 001A", 1)
+    for _ in range(5):
+        index.refresh_if_stale()
+        assert [route["routeId"] for route in index.search("town")] == [1]
+    assert len(opened) == 1
+    release.set()
+    for thread in threading.enumerate():
+        if thread.name == "route-index-refresh":
+            thread.join(5)
+    assert index.search("town") == [] and index._loaded_at is not None
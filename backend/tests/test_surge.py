@@ -0,0 +1,23 @@
+from app.shared_state import Generations
+from app.surge import DemandWindow, SharedDemandWindow
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_shared_demand_is_counted_across_workers(tmp_path):
+    clock = Clock()
+    state = Generations(str(tmp_path))
+    workers = [SharedDemandWindow(state, window=60, bucket=10, clock=clock) for _ in range(2)]
+    local = DemandWindow(window=60, bucket=10, clock=clock)
+    for step, matatu_ids in enumerate([[1, 2, 2], [2, None], [3], [1], [], [2]]):
+        workers[step % 2].record(matatu_ids)
+        local.record(matatu_ids)
+        clock.now += 15
+    for window in workers:
+        assert window.counts([1, 2, 3, 4]).tolist() == local.counts([1, 2, 3, 4]).tolist()
+    clock.now += 60
+    assert workers[0].counts([1, 2, 3]).tolist() == [0.0, 0.0, 0.0]